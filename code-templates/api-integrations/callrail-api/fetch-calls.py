@@ -3,18 +3,41 @@ Fetch CallRail calls via API.
 """
 
 import os
-import requests
+import sys
 
-CALLRAIL_API_KEY = os.getenv('CALLRAIL_API_KEY')
-CALLRAIL_ACCOUNT_ID = os.getenv('CALLRAIL_ACCOUNT_ID')
+from dotenv import load_dotenv
 
+# Load environment variables from .env file
+load_dotenv()
 
-def fetch_calls():
-    url = f"https://api.callrail.com/v3/a/{CALLRAIL_ACCOUNT_ID}/calls.json"
-    headers = {"Authorization": f"Token token={CALLRAIL_API_KEY}"}
-    response = requests.get(url, headers=headers, timeout=30)
-    response.raise_for_status()
-    return response.json()
+# Add parent directories to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+from automation.utils.callrail_client import get_client
+
+
+def fetch_calls(params=None, per_page=250):
+    """
+    Fetch every page of calls for the configured CallRail account
+
+    Pages after the first are prefetched concurrently over the shared,
+    pooled CallRail session.
+
+    Args:
+        params: Optional query parameters (start_date, fields, ...)
+        per_page: Records per page (max 250)
+
+    Returns:
+        Dict with the combined 'calls' list and 'total_records'
+    """
+    calls = []
+    total_records = 0
+
+    for page in get_client().iter_pages('calls.json', params, per_page):
+        calls.extend(page.get('calls', []))
+        total_records = page.get('total_records', len(calls))
+
+    return {'calls': calls, 'total_records': total_records}
 
 
 if __name__ == "__main__":
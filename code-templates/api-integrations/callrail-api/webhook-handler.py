@@ -0,0 +1,78 @@
+"""
+CallRail webhook receiver (Python replacement for webhook-handler.js)
+
+Verifies CallRail signatures, keeps qualified calls with a GCLID and
+appends them to the durable webhook queue. The uploader (cron run or
+--daemon) reads the queue; polling CallRail remains as a backstop.
+
+Usage:
+    python3 webhook-handler.py                    # 0.0.0.0:3000/callrail/webhook
+    python3 webhook-handler.py --port 8080 --path /hooks/callrail
+    python3 webhook-handler.py --tenants tenants.json --tenant clinic-a --port 3001
+
+Configure the webhook in CallRail (Settings > Integrations > Webhooks,
+"Post-Call") to POST to the URL above, and set CALLRAIL_WEBHOOK_SECRET to
+the account's signing token.
+
+With a tenant manifest, run one receiver per tenant (its own port or path
+and signing token): each queues into its tenant's state directory, where
+that tenant's uploads read the queue.
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add parent directories to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+from automation.utils.callrail_webhooks import WEBHOOK_PATH, run_webhook_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Receive CallRail webhooks into the upload queue')
+    parser.add_argument('--host', default=os.getenv('CALLRAIL_WEBHOOK_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('CALLRAIL_WEBHOOK_PORT', '3000')))
+    parser.add_argument('--path', default=WEBHOOK_PATH, help=f'URL path (default: {WEBHOOK_PATH})')
+    parser.add_argument('--allow-unsigned', action='store_true',
+                        help='Accept requests without a valid signature (local testing only)')
+    parser.add_argument('--tenants', metavar='MANIFEST', default=os.getenv('TENANT_MANIFEST'),
+                        help='Tenant manifest (default: TENANT_MANIFEST); requires --tenant')
+    parser.add_argument('--tenant', metavar='NAME',
+                        help='Tenant in the manifest whose CallRail account posts to this receiver')
+    args = parser.parse_args(argv)
+
+    if args.tenants and not args.tenant:
+        parser.error('a tenant manifest is set: run one receiver per tenant with --tenant NAME')
+    if args.tenant and not args.tenants:
+        parser.error('--tenant requires --tenants MANIFEST (or TENANT_MANIFEST)')
+
+    try:
+        config = None
+        if args.tenant:
+            from automation.conversion_upload.orchestrator import load_tenant_manifest
+
+            tenants = {tenant.name: tenant for tenant in load_tenant_manifest(args.tenants)}
+            if args.tenant not in tenants:
+                raise ValueError(f"Tenant {args.tenant!r} is not in {args.tenants}")
+            config = tenants[args.tenant].config
+            os.makedirs(config.state_dir, exist_ok=True)
+
+        stats = run_webhook_server(host=args.host, port=args.port, path=args.path,
+                                   allow_unsigned=args.allow_unsigned, config=config)
+    except ValueError as e:
+        print(f"⚠️  ERROR: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Received {stats.requests} webhooks: {stats.queued} queued, {stats.ignored} ignored, "
+          f"{stats.rejected} rejected, {stats.errors} errors")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
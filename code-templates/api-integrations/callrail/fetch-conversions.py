@@ -3,93 +3,40 @@ CallRail API Integration
 Fetches qualified call conversions with GCLID tracking
 """
 
-import requests
 import os
-from datetime import datetime, timedelta
+import sys
+
 from dotenv import load_dotenv
 
+# Load environment variables from .env file
 load_dotenv()
 
+# Add parent directories to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+from automation.utils.callrail_fetcher import FetchStats, iter_new_conversions
+from automation.utils.profiling import span
+
 CALLRAIL_API_KEY = os.getenv('CALLRAIL_API_KEY')
 CALLRAIL_ACCOUNT_ID = os.getenv('CALLRAIL_ACCOUNT_ID')
-BASE_URL = 'https://api.callrail.com/v3'
 
 
-def fetch_new_conversions(since_minutes=360):
+def fetch_new_conversions(since_minutes=360, stats=None):
     """
     Fetch qualified call conversions from CallRail since specified time
+
+    Walks every page of results. Use iter_new_conversions() to stream
+    conversions instead of collecting them in a list.
     
     Args:
         since_minutes: How many minutes back to fetch (default 6 hours)
+        stats: Optional FetchStats for page/byte/latency counters
     
     Returns:
         List of conversion dictionaries with GCLID data
     """
-    if not CALLRAIL_API_KEY or not CALLRAIL_ACCOUNT_ID:
-        raise ValueError("Missing CallRail API credentials. Set CALLRAIL_API_KEY and CALLRAIL_ACCOUNT_ID in .env file")
-    
-    # Calculate time range
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(minutes=since_minutes)
-    
-    headers = {
-        'Authorization': f'Token token={CALLRAIL_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    
-    params = {
-        'start_date': start_date.strftime('%Y-%m-%dT%H:%M:%S'),
-        'end_date': end_date.strftime('%Y-%m-%dT%H:%M:%S'),
-        'fields': 'id,start_time,duration,tracking_phone_number,customer_phone_number,qualifying,value,tags,gclid',
-        'qualifying': 'true'  # Only fetch qualified leads
-    }
-    
-    url = f'{BASE_URL}/a/{CALLRAIL_ACCOUNT_ID}/calls.json'
-    
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        
-        calls_data = response.json()
-        conversions = []
-        
-        for call in calls_data.get('calls', []):
-            # Only include calls with GCLID tracking
-            if call.get('gclid'):
-                conversion = {
-                    'gclid': call['gclid'],
-                    'conversion_date_time': format_timestamp(call['start_time']),
-                    'conversion_value': call.get('value', 0),
-                    'call_id': call['id'],
-                    'duration': call.get('duration', 0),
-                    'phone_number': call.get('customer_phone_number', '')
-                }
-                conversions.append(conversion)
-        
-        print(f"✓ Fetched {len(conversions)} conversions from CallRail")
-        return conversions
-        
-    except requests.exceptions.RequestException as e:
-        print(f"✗ Error fetching from CallRail API: {e}")
-        return []
-
-
-def format_timestamp(callrail_timestamp):
-    """
-    Convert CallRail timestamp to Google Ads format
-    
-    Args:
-        callrail_timestamp: ISO format timestamp from CallRail
-    
-    Returns:
-        Formatted timestamp: YYYY-MM-DD HH:MM:SS+TZ
-    """
-    # Handle both with and without timezone
-    if callrail_timestamp.endswith('Z'):
-        callrail_timestamp = callrail_timestamp.replace('Z', '+00:00')
-    
-    dt = datetime.fromisoformat(callrail_timestamp)
-    return dt.strftime('%Y-%m-%d %H:%M:%S%z')
+    with span('callrail.fetch_new_conversions'):
+        return list(iter_new_conversions(since_minutes, stats=stats))
 
 
 if __name__ == "__main__":
@@ -100,9 +47,10 @@ if __name__ == "__main__":
     print()
     
     if CALLRAIL_API_KEY and CALLRAIL_ACCOUNT_ID:
-        conversions = fetch_new_conversions(since_minutes=1440)  # Last 24 hours
+        stats = FetchStats()
+        conversions = fetch_new_conversions(since_minutes=1440, stats=stats)  # Last 24 hours
         
-        print(f"\nFound {len(conversions)} conversions:")
+        print(f"\nFound {len(conversions)} conversions across {stats.pages} pages:")
         for conv in conversions[:5]:  # Show first 5
             print(f"  GCLID: {conv['gclid']}")
             print(f"  Time: {conv['conversion_date_time']}")
@@ -0,0 +1,73 @@
+"""Consolidate many CRM exports into per-conversion-action Google Ads upload files.
+
+Runs the csv-generator.py (CRM column mapping) or csv-formatter.py (already
+in upload format) conversion over every input at once: large files are split
+into shards and converted in a process pool, then merged with deterministic
+ordering and duplicate conversions removed.
+
+Usage:
+    python3 consolidate-exports.py OUTPUT_DIR EXPORT.csv [EXPORT.csv.gz ...]
+    python3 consolidate-exports.py --upload-format OUTPUT_DIR FORMATTED.csv ...
+"""
+
+import argparse
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from automation.utils.crm_rows import DEFAULT_COLUMN_MAPPING
+from automation.utils.sharded_convert import DEFAULT_SHARD_BYTES, convert_exports_parallel
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir', help='Directory for conversions_<action_id>.csv files')
+    parser.add_argument('inputs', nargs='+', help='CRM export files (.csv, .csv.gz, .csv.zst)')
+    parser.add_argument('--upload-format', action='store_true',
+                        help='Inputs already use the upload columns (like csv-formatter.py)')
+    parser.add_argument('--gclid-column', default=DEFAULT_COLUMN_MAPPING['gclid_column'])
+    parser.add_argument('--date-column', default=DEFAULT_COLUMN_MAPPING['date_column'])
+    parser.add_argument('--value-column', default=DEFAULT_COLUMN_MAPPING['value_column'])
+    parser.add_argument('--conversion-action-id', default=DEFAULT_COLUMN_MAPPING['conversion_action_id'])
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--shard-mb', type=int, default=DEFAULT_SHARD_BYTES // (1024 * 1024),
+                        help='Shard size for uncompressed inputs, 0 to disable splitting')
+    parser.add_argument('--output-suffix', default='.csv', choices=['.csv', '.csv.gz', '.csv.zst'])
+    args = parser.parse_args(argv)
+
+    column_mapping = None
+    if not args.upload_format:
+        column_mapping = {
+            'gclid_column': args.gclid_column,
+            'date_column': args.date_column,
+            'value_column': args.value_column,
+            'conversion_action_id': args.conversion_action_id
+        }
+
+    try:
+        result = convert_exports_parallel(
+            args.inputs,
+            args.output_dir,
+            column_mapping=column_mapping,
+            workers=args.workers,
+            shard_bytes=args.shard_mb * 1024 * 1024,
+            output_suffix=args.output_suffix
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
+
+    print(f"✓ Converted {len(args.inputs)} files in {result['shards']} shards ({result['seconds']:.2f}s)")
+    print(f"✓ Wrote {result['rows_written']} conversions")
+    if result['duplicates']:
+        print(f"⚠ Removed {result['duplicates']} duplicate conversions")
+    if result['rows_skipped']:
+        print(f"⚠ Skipped {result['rows_skipped']} rows without GCLID")
+    for action, path in sorted(result['files'].items()):
+        print(f"  {action}: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Conversion Upload: Upload CallRail / CSV call conversions to Google Ads
+
+Importing the package has no side effects: each submodule is imported on
+first use of a name exported from it, settings are read when an upload
+starts (load_config() loads the .env file) and the Google Ads SDK is
+loaded only when there is something to upload.
+
+Usage as a library:
+    from automation.conversion_upload import load_config, upload_conversions_from_callrail
+    upload_conversions_from_callrail(config=load_config())
+
+Usage from the command line (from code-templates/):
+    python3 -m automation.conversion_upload [--since-minutes N | --csv PATH]
+    python3 -m automation.conversion_upload --adjustments crm-values.csv
+    python3 -m automation.conversion_upload --daemon [--metrics-port 9464]
+    python3 -m automation.conversion_upload --tenants tenants.json [--daemon]
+"""
+
+import importlib
+
+# Public name -> module it lives in
+_EXPORTS = {
+    'diff_adjustments': 'adjustments',
+    'upload_adjustments_from_csv': 'adjustments',
+    'upload_conversion_adjustments_batch': 'adjustments',
+    'ConfigError': 'config',
+    'DaemonConfig': 'config',
+    'UploadConfig': 'config',
+    'load_config': 'config',
+    'load_daemon_config': 'config',
+    'Tenant': 'orchestrator',
+    'TenantOrchestrator': 'orchestrator',
+    'load_tenant_manifest': 'orchestrator',
+    'UploadSession': 'session',
+    'get_session': 'session',
+    'session_for': 'session',
+    'load_client': 'uploader',
+    'upload_click_conversion': 'uploader',
+    'upload_click_conversions_batch': 'uploader',
+    'upload_conversions_from_callrail': 'uploader',
+    'upload_conversions_from_csv': 'uploader',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'{__name__}.{module}'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,5 @@
+import sys
+
+from automation.conversion_upload.cli import main
+
+sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Conversion Adjustments: Restate or retract uploaded conversions from CRM values
+
+Revenue often closes weeks after the call (a "Sale Closed" row in the CRM).
+Instead of uploading the history again, a CRM export is diffed against the
+upload ledger, which keeps the value Google Ads has for every acknowledged
+conversion:
+
+- a row whose value differs becomes a RESTATEMENT to the new value,
+- a row whose status is one of ADJUSTMENT_RETRACT_STATUSES (e.g. Cancelled,
+  Refunded) becomes a RETRACTION,
+- unchanged rows, and rows for conversions that were never uploaded, are
+  not sent.
+
+Adjustments go out through ConversionAdjustmentUploadService in batches of
+up to 2,000 with partial failure enabled. Accepted ones are written back to
+the ledger, so running the same export again sends nothing; failed ones are
+left as they were and sent again on the next run.
+
+Input: the upload CSV (or .parquet / .arrow) format with an optional status
+column. conversion_date_time and conversion_action_id may be left empty:
+the click's latest uploaded conversion for the default action is adjusted.
+
+    gclid,conversion_action_id,conversion_date_time,conversion_value,status
+    CjwKCAiA...,987654321,,4500,Sale Closed
+    CjwKCAiB...,987654321,,0,Refunded
+"""
+
+import csv
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import chain, islice
+
+from automation.conversion_upload.config import (
+    DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER,
+    MAX_CONVERSIONS_PER_REQUEST,
+    load_config
+)
+from automation.conversion_upload.session import get_session, session_for
+from automation.conversion_upload.uploader import _log, _upload_batch_in_slot
+from automation.utils.columnar_io import columnar_format_for, iter_rows, read_schema
+from automation.utils.logging_config import get_metrics
+from automation.utils.profiling import span
+from automation.utils.settings import env_str
+from automation.utils.state_manager import state_path
+from automation.utils.timestamps import InvalidTimestamp, TimestampNormalizer, get_timezone
+from automation.utils.upload_ledger import STATUS_RETRACTED, UploadLedger, conversion_key
+
+# CRM statuses (case-insensitive) that withdraw a conversion, unless
+# ADJUSTMENT_RETRACT_STATUSES lists others
+DEFAULT_RETRACT_STATUSES = 'Cancelled,Canceled,Refunded,Returned'
+
+ADJUSTMENT_FIELDNAMES = ['gclid', 'conversion_action_id', 'conversion_date_time', 'conversion_value', 'status']
+
+RESTATEMENT = 'RESTATEMENT'
+RETRACTION = 'RETRACTION'
+
+# Values closer than this (in the account currency) are unchanged
+VALUE_TOLERANCE = 0.005
+
+
+class AdjustmentStats:
+    """
+    Counters for one adjustment run
+
+    Attributes:
+        checked: CRM rows read
+        unchanged: Rows whose value Google Ads already has (or whose
+                   conversion was already retracted)
+        not_uploaded: Rows with no acknowledged conversion in the ledger
+        repeated: Rows for a conversion already adjusted earlier in the file
+        rejected: Rows that could not be read (no GCLID, bad value or date)
+        restatements: RESTATEMENT adjustments produced
+        retractions: RETRACTION adjustments produced
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.unchanged = 0
+        self.not_uploaded = 0
+        self.repeated = 0
+        self.rejected = 0
+        self.restatements = 0
+        self.retractions = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __str__(self):
+        return (
+            f"{self.checked} rows: {self.restatements} restated, {self.retractions} retracted, "
+            f"{self.unchanged} unchanged, {self.not_uploaded} not uploaded, {self.repeated} repeated, "
+            f"{self.rejected} rejected"
+        )
+
+
+def retract_statuses_setting():
+    """Lowercase CRM statuses that mean RETRACTION (ADJUSTMENT_RETRACT_STATUSES)"""
+    statuses = env_str('ADJUSTMENT_RETRACT_STATUSES', DEFAULT_RETRACT_STATUSES)
+    return frozenset(status.strip().lower() for status in statuses.split(',') if status.strip())
+
+
+def _reject(stats, ref, row, code, message, logger=None):
+    stats.rejected += 1
+    get_metrics().inc('adjustments', outcome='rejected')
+    _log(
+        f"✗ Rejected row {ref}: {code}: {message}", logger, "error",
+        event='adjustment_rejected', ref=ref, gclid=row.get('gclid'), error_codes=[code]
+    )
+
+
+def diff_adjustments(ledger, rows, default_conversion_action_id, adjustment_date_time, normalizer=None,
+                     retract_statuses=None, stats=None, logger=None):
+    """
+    Yield the adjustments needed to bring Google Ads in line with CRM rows
+
+    Args:
+        ledger: UploadLedger with the uploaded conversions and their values
+        rows: Iterable of (ref, row dict) pairs in ADJUSTMENT_FIELDNAMES format
+        default_conversion_action_id: Conversion action of rows without one
+        adjustment_date_time: When the adjustments happened
+                              ("yyyy-mm-dd hh:mm:ss+hh:mm")
+        normalizer: TimestampNormalizer for conversion_date_time (default UTC)
+        retract_statuses: Lowercase statuses that mean RETRACTION (default:
+                          retract_statuses_setting())
+        stats: Optional AdjustmentStats to update
+        logger: Optional logger instance
+
+    Yields:
+        (ref, adjustment) pairs for UploadSession.build_adjustment_request
+    """
+    normalizer = normalizer or TimestampNormalizer()
+    stats = stats if stats is not None else AdjustmentStats()
+    if retract_statuses is None:
+        retract_statuses = retract_statuses_setting()
+    seen_keys = set()
+
+    for ref, row in rows:
+        stats.checked += 1
+        gclid = str(row.get('gclid') or '').strip()
+        if not gclid:
+            _reject(stats, ref, row, 'validation.MISSING_GCLID', 'Missing gclid', logger)
+            continue
+        action_id = str(row.get('conversion_action_id') or default_conversion_action_id).strip()
+        retract = str(row.get('status') or '').strip().lower() in retract_statuses
+
+        value = None
+        if not retract:
+            try:
+                value = float(row.get('conversion_value') or 0)
+            except (TypeError, ValueError):
+                _reject(stats, ref, row, 'validation.INVALID_CONVERSION_VALUE',
+                        f"conversion_value is not a number: {row.get('conversion_value')!r}", logger)
+                continue
+
+        uploaded = ledger.uploaded_conversions(gclid, action_id)
+        if row.get('conversion_date_time'):
+            try:
+                date_time = normalizer.normalize(row['conversion_date_time'])
+            except InvalidTimestamp as e:
+                _reject(stats, ref, row, 'validation.INVALID_DATE_TIME', str(e), logger)
+                continue
+            uploaded = [conversion for conversion in uploaded if conversion[0] == date_time]
+        if not uploaded:
+            stats.not_uploaded += 1
+            continue
+        # Without a date, the click's latest upload for the action
+        date_time, old_value, status = uploaded[0]
+
+        adjustment = {
+            'gclid': gclid,
+            'conversion_action_id': action_id,
+            'conversion_date_time': date_time,
+            'adjustment_date_time': adjustment_date_time
+        }
+        key = conversion_key(adjustment)
+        if key in seen_keys:
+            stats.repeated += 1
+            continue
+        seen_keys.add(key)
+
+        if status == STATUS_RETRACTED:
+            # A retracted conversion cannot be restated
+            stats.unchanged += 1
+            continue
+        if retract:
+            adjustment['adjustment_type'] = RETRACTION
+            stats.retractions += 1
+        elif old_value is not None and abs(old_value - value) < VALUE_TOLERANCE:
+            stats.unchanged += 1
+            continue
+        else:
+            adjustment['adjustment_type'] = RESTATEMENT
+            adjustment['restatement_value'] = value
+            stats.restatements += 1
+        yield ref, adjustment
+
+
+def _report_adjustments(batch, batch_failures, logger=None):
+    """Log and count the outcome of one adjustment request"""
+    failed_refs = {failure['ref'] for failure in batch_failures}
+    successful = len(batch) - len(failed_refs)
+
+    metrics = get_metrics()
+    metrics.inc('adjustments', successful, outcome='uploaded')
+    metrics.inc('adjustments', len(failed_refs), outcome='failed')
+
+    _log(
+        f"✓ Uploaded batch of {len(batch)} adjustments ({len(failed_refs)} failed)",
+        logger, success=True, event='adjustment_batch_uploaded', rows=len(batch), failed=len(failed_refs)
+    )
+    for failure in batch_failures:
+        codes = [error['code'] for error in failure['errors']]
+        for code in codes:
+            metrics.inc('failures', code=code)
+        details = "; ".join(f"{error['code']}: {error['message']}" for error in failure['errors'])
+        _log(
+            f"✗ Failed to adjust conversion ref={failure['ref']} gclid={failure['gclid']}: {details}",
+            logger, "error", event='adjustment_failed', ref=failure['ref'], gclid=failure['gclid'],
+            error_codes=codes
+        )
+    return successful
+
+
+def upload_conversion_adjustments_batch(client, customer_id, adjustments, default_conversion_action_id=None,
+                                        logger=None, batch_size=MAX_CONVERSIONS_PER_REQUEST, ledger=None,
+                                        max_in_flight_per_customer=DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER):
+    """
+    Upload conversion adjustments to Google Ads in batched requests
+
+    Requests hold up to ``batch_size`` adjustments and are sent one at a
+    time, sharing the per-customer request slots and API quota of click
+    uploads. With a ``ledger``, accepted adjustments are recorded: restated
+    values replace the uploaded ones and retracted conversions are marked
+    retracted (never uploaded again).
+
+    Args:
+        client: GoogleAdsClient or UploadSession
+        customer_id: Google Ads customer ID
+        adjustments: Iterable of (ref, adjustment) pairs (see diff_adjustments)
+        default_conversion_action_id: Conversion action used when a row has none
+        logger: Optional logger instance
+        batch_size: Maximum adjustments per request (default 2,000)
+        ledger: Optional UploadLedger to record accepted adjustments in
+        max_in_flight_per_customer: Cap on concurrent requests per customer,
+                                    across all uploads in this process
+
+    Returns:
+        Tuple of (successful_count, failed_count, failures) where failures is a
+        list of {'ref', 'gclid', 'errors'} dicts
+    """
+    session = session_for(client)
+    batch_size = max(1, min(batch_size, MAX_CONVERSIONS_PER_REQUEST))
+    adjustments = iter(adjustments)
+
+    successful = 0
+    failures = []
+    while True:
+        with span('adjustments.read_source'):
+            batch = list(islice(adjustments, batch_size))
+        if not batch:
+            break
+        batch_failures = _upload_batch_in_slot(
+            session, customer_id, batch, default_conversion_action_id, max_in_flight_per_customer,
+            adjustments=True
+        )
+        successful += _report_adjustments(batch, batch_failures, logger)
+        failures.extend(batch_failures)
+
+        if ledger is not None:
+            failed_refs = {failure['ref'] for failure in batch_failures}
+            with span('ledger.record'):
+                ledger.record_adjustments(
+                    (conversion_key(adjustment, default_conversion_action_id), adjustment.get('restatement_value'))
+                    for ref, adjustment in batch if ref not in failed_refs
+                )
+
+    failed = len({failure['ref'] for failure in failures})
+    return successful, failed, failures
+
+
+def upload_adjustments_from_csv(csv_file_path, logger=None, config=None, client=None,
+                                retract_statuses=None):
+    """
+    Restate or retract uploaded conversions whose CRM value or status changed
+
+    Rows are diffed against the upload ledger (see module docstring); only
+    changed conversions are sent. Timestamps without an offset are in
+    config.timezone.
+
+    Args:
+        csv_file_path: CSV (or .parquet / .arrow) file in ADJUSTMENT_FIELDNAMES format
+        logger: Optional logger instance
+        config: UploadConfig (default: load_config())
+        client: GoogleAdsClient (default: the shared client for config, loaded only
+                if there is something to adjust)
+        retract_statuses: Lowercase statuses that mean RETRACTION (default:
+                          retract_statuses_setting())
+
+    Returns:
+        Tuple of (successful_count, failed_count); failed includes rejected rows
+    """
+    _log(f"Diffing conversion values from {csv_file_path} against the upload ledger", logger)
+
+    config = config or load_config()
+    ledger = UploadLedger(state_path(config.state_dir, 'upload_ledger.sqlite3'))
+    stats = AdjustmentStats()
+    adjustment_date_time = datetime.now(get_timezone(config.timezone)).isoformat(' ', 'seconds')
+
+    with ExitStack() as stack:
+        if columnar_format_for(csv_file_path):
+            columns = [name for name in ADJUSTMENT_FIELDNAMES if name in read_schema(csv_file_path)]
+            numbered = enumerate(iter_rows(csv_file_path, columns), start=1)
+        else:
+            reader = csv.DictReader(stack.enter_context(open(csv_file_path, 'r')))
+            # Line 1 is the header, so data rows start at line 2
+            numbered = enumerate(reader, start=2)
+
+        adjustments = diff_adjustments(
+            ledger, numbered, config.conversion_action_id, adjustment_date_time,
+            normalizer=TimestampNormalizer(config.timezone), retract_statuses=retract_statuses,
+            stats=stats, logger=logger
+        )
+        first = next(adjustments, None)
+        if first is None:
+            _log("No conversion values changed", logger)
+            successful, failed = 0, 0
+        else:
+            with span('google_ads.session'):
+                session = session_for(client) if client is not None else get_session(config)
+            successful, failed, _ = upload_conversion_adjustments_batch(
+                session,
+                config.customer_id,
+                chain([first], adjustments),
+                default_conversion_action_id=config.conversion_action_id,
+                logger=logger,
+                ledger=ledger,
+                max_in_flight_per_customer=config.max_in_flight_per_customer
+            )
+
+    summary = [
+        "",
+        "=== Adjustment Summary ===",
+        f"Successful: {successful}",
+        f"Failed: {failed}",
+        f"CRM rows: {stats}"
+    ]
+    ledger.close()
+    _log("\n".join(summary), logger)
+
+    return successful, failed + stats.rejected
@@ -0,0 +1,160 @@
+"""
+Command-line entry point for conversion uploads
+
+Exit codes: 0 on success (rows that Google Ads rejected are in the retry
+queue or its dead-letter file), 1 if the configuration is incomplete, 2 if
+a tenant's sync failed (--tenants).
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import os
+import sys
+
+from automation.conversion_upload.config import ConfigError, _load_dotenv, load_config, load_daemon_config
+
+
+def main(argv=None):
+    """Parse arguments, then upload from CallRail (default) or a CSV file"""
+    # Before the environment defaults below and any helper's settings
+    _load_dotenv()
+    parser = argparse.ArgumentParser(
+        prog='conversion_upload',
+        description='Upload call conversions to Google Ads'
+    )
+    parser.add_argument('--csv', metavar='PATH',
+                        help='Upload conversions from a CSV (or .parquet / .arrow) file instead of CallRail')
+    parser.add_argument('--adjustments', metavar='PATH',
+                        help='Restate or retract uploaded conversions whose value or status changed in a '
+                             'CRM export (upload CSV format plus an optional status column)')
+    parser.add_argument('--since-minutes', type=int, metavar='N',
+                        help='Fetch CallRail calls from the last N minutes '
+                             '(default: incremental sync from the saved watermark)')
+    parser.add_argument('--priority', choices=('live', 'backfill'),
+                        help='API quota lane: backfill leaves headroom for live syncs '
+                             '(default: RATE_LIMIT_LANE or live)')
+    parser.add_argument('--metrics-file', metavar='PATH', default=os.getenv('UPLOAD_METRICS_FILE'),
+                        help='Write Prometheus metrics to PATH when the run ends '
+                             '(node_exporter textfile collector)')
+
+    tenants = parser.add_argument_group('multiple accounts')
+    tenants.add_argument('--tenants', metavar='MANIFEST', default=os.getenv('TENANT_MANIFEST'),
+                         help='Sync every tenant (CallRail account -> Google Ads customer) in a JSON manifest; '
+                              'with --daemon, keep re-syncing each one every --poll-seconds')
+    tenants.add_argument('--tenant-workers', type=int, metavar='N',
+                         help='Tenants synced concurrently (default: TENANT_WORKERS or 4)')
+
+    profile = parser.add_argument_group('profiling')
+    profile.add_argument('--profile', metavar='DIR', default=os.getenv('UPLOAD_PROFILE_DIR'),
+                         help='Time each pipeline stage and write a timing report and '
+                              'flamegraph stacks to DIR')
+    profile.add_argument('--profile-mode', choices=('spans', 'cprofile', 'pyinstrument'),
+                         default=os.getenv('UPLOAD_PROFILE_MODE', 'spans'),
+                         help='Also capture a cProfile or pyinstrument profile of the run (default: spans)')
+    profile.add_argument('--profile-allocations', action='store_true',
+                         default=os.getenv('UPLOAD_PROFILE_ALLOCATIONS', '').lower() in ('1', 'true', 'yes'),
+                         help='Track allocations per stage with tracemalloc (slows the run)')
+
+    daemon = parser.add_argument_group('daemon mode')
+    daemon.add_argument('--daemon', action='store_true',
+                        help='Run continuously, polling CallRail and uploading micro-batches')
+    daemon.add_argument('--poll-seconds', type=int, metavar='N', help='Seconds between CallRail polls')
+    daemon.add_argument('--flush-rows', type=int, metavar='N', help='Upload once this many conversions are buffered')
+    daemon.add_argument('--flush-seconds', type=int, metavar='N',
+                        help='Upload once the oldest buffered conversion is this old')
+    daemon.add_argument('--metrics-port', type=int, metavar='PORT', help='Serve /healthz and /metrics on this port')
+    args = parser.parse_args(argv)
+
+    if args.tenants and args.csv:
+        parser.error('--csv cannot be combined with --tenants')
+    if args.adjustments and (args.csv or args.tenants or args.daemon):
+        parser.error('--adjustments cannot be combined with --csv, --tenants or --daemon')
+
+    try:
+        if args.tenants:
+            from automation.conversion_upload.orchestrator import load_tenant_manifest
+            config = load_tenant_manifest(args.tenants)
+        else:
+            config = load_config()
+        daemon_config = load_daemon_config()
+    except ConfigError as e:
+        print(f"⚠️  ERROR: {e}", file=sys.stderr)
+        if args.tenants:
+            return 1
+        print("Please set GOOGLE_ADS_CUSTOMER_ID and GOOGLE_ADS_CONVERSION_ACTION_ID in your .env file",
+              file=sys.stderr)
+        print("Example:", file=sys.stderr)
+        print("  GOOGLE_ADS_CUSTOMER_ID=1234567890", file=sys.stderr)
+        print("  GOOGLE_ADS_CONVERSION_ACTION_ID=987654321", file=sys.stderr)
+        return 1
+
+    from automation.utils.logging_config import get_metrics, setup_logging
+    from automation.utils.profiling import profile_run
+    from automation.utils.rate_limiter import get_rate_limiter, set_default_lane
+
+    logger = setup_logging()
+    if args.priority:
+        set_default_lane(args.priority)
+
+    with contextlib.ExitStack() as stack:
+        if args.profile:
+            stack.enter_context(profile_run(
+                args.profile, mode=args.profile_mode, allocations=args.profile_allocations, logger=logger
+            ))
+        status = _run(args, config, daemon_config, logger)
+
+    if args.metrics_file:
+        get_metrics().write_textfile(
+            args.metrics_file, get_rate_limiter().stats.render_prometheus('conversion_upload_rate_limit')
+        )
+
+    return status
+
+
+def _run(args, config, daemon_config, logger):
+    """
+    Run the tenant orchestrator, the daemon, a CSV upload, an adjustment
+    upload or a CallRail sync
+
+    Args:
+        config: UploadConfig, or the list of Tenant with --tenants
+
+    Returns:
+        Exit code
+    """
+    from automation.conversion_upload.uploader import (
+        upload_conversions_from_callrail,
+        upload_conversions_from_csv
+    )
+
+    if args.tenants:
+        from automation.conversion_upload.orchestrator import TenantOrchestrator
+
+        orchestrator = TenantOrchestrator(config, workers=args.tenant_workers, logger=logger)
+        poll_seconds = (args.poll_seconds or daemon_config.poll_seconds) if args.daemon else None
+        failed_tenants = orchestrator.run(since_minutes=args.since_minutes, poll_seconds=poll_seconds)
+        return 2 if failed_tenants else 0
+    elif args.daemon:
+        from automation.conversion_upload.daemon import UploadDaemon
+
+        overrides = {
+            name: getattr(args, name)
+            for name in ('poll_seconds', 'flush_rows', 'flush_seconds', 'metrics_port')
+            if getattr(args, name) is not None
+        }
+        UploadDaemon(config, dataclasses.replace(daemon_config, **overrides), logger=logger).run()
+    elif args.csv:
+        upload_conversions_from_csv(args.csv, logger=logger, config=config)
+    elif args.adjustments:
+        from automation.conversion_upload.adjustments import upload_adjustments_from_csv
+
+        upload_adjustments_from_csv(args.adjustments, logger=logger, config=config)
+    else:
+        logger.info("Using CallRail integration for conversion upload")
+        upload_conversions_from_callrail(since_minutes=args.since_minutes, logger=logger, config=config)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Configuration for conversion uploads, resolved when an upload starts
+
+Nothing is read at import time: load_config() loads the .env file and
+reads the environment on each call, so the package can be imported as a
+library and tests can change settings between runs.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from automation.utils.enhanced_conversions import leads_enabled
+from automation.utils.timestamps import InvalidTimestamp, get_timezone, rules_timezone
+
+# Google Ads accepts at most 2,000 conversions per UploadClickConversionsRequest
+MAX_CONVERSIONS_PER_REQUEST = 2000
+
+# Default batch requests kept in flight, overall and per customer
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER = 4
+
+# Default upload attempts before a failing row is dead-lettered
+DEFAULT_RETRY_MAX_ATTEMPTS = 8
+
+_dotenv_loaded = False
+
+
+class ConfigError(ValueError):
+    """Raised when required upload settings are missing or invalid"""
+
+
+@dataclass(frozen=True)
+class UploadConfig:
+    customer_id: str
+    conversion_action_id: str
+    google_ads_yaml_path: str = 'google-ads.yaml'
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    max_in_flight_per_customer: int = DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER
+    # Timezone of CSV timestamps that have no UTC offset
+    timezone: str = 'UTC'
+    # CallRail account to fetch from (default: CALLRAIL_ACCOUNT_ID)
+    callrail_account_id: Optional[str] = None
+    # qualification-rules.json for fetched calls (default: QUALIFICATION_RULES_PATH)
+    qualification_rules_path: Optional[str] = None
+    # Upload calls without a GCLID by hashed caller number (enhanced
+    # conversions for leads must be on for the conversion action)
+    enhanced_conversions_for_leads: bool = False
+    # Upload attempts (including the first) before a failing row is dead-lettered
+    retry_max_attempts: int = DEFAULT_RETRY_MAX_ATTEMPTS
+    # Directory for the sync watermark, ledger, retry queue and webhook queue
+    # (default: the repo-root files); set per tenant by the orchestrator
+    state_dir: Optional[str] = None
+
+
+def _load_dotenv():
+    """Load the .env file once per process (existing variables win)"""
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+    _dotenv_loaded = True
+
+
+def _int_setting(env, name, default):
+    value = env.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ConfigError(f"{name} must be an integer, got {value!r}")
+
+
+def load_config(env=None):
+    """
+    Read upload settings from the environment
+
+    Args:
+        env: Mapping to read instead of os.environ (the .env file is then
+             not loaded)
+
+    Returns:
+        UploadConfig
+
+    Raises:
+        ConfigError if GOOGLE_ADS_CUSTOMER_ID or GOOGLE_ADS_CONVERSION_ACTION_ID
+        is missing, a numeric setting is not a number, or the timezone is unknown
+    """
+    if env is None:
+        _load_dotenv()
+        env = os.environ
+
+    customer_id = env.get('GOOGLE_ADS_CUSTOMER_ID')
+    conversion_action_id = env.get('GOOGLE_ADS_CONVERSION_ACTION_ID')
+    if not customer_id or not conversion_action_id:
+        raise ConfigError(
+            "Missing required environment variables: "
+            "GOOGLE_ADS_CUSTOMER_ID and GOOGLE_ADS_CONVERSION_ACTION_ID"
+        )
+
+    max_in_flight = _int_setting(env, 'GOOGLE_ADS_UPLOAD_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)
+    max_in_flight_per_customer = _int_setting(
+        env, 'GOOGLE_ADS_MAX_IN_FLIGHT_PER_CUSTOMER', DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER
+    )
+
+    qualification_rules_path = env.get('QUALIFICATION_RULES_PATH') or None
+
+    # CONVERSION_TIMEZONE, else the configured rules' business hours timezone
+    timezone = env.get('CONVERSION_TIMEZONE') or rules_timezone(qualification_rules_path) or 'UTC'
+    try:
+        get_timezone(timezone)
+    except InvalidTimestamp as e:
+        raise ConfigError(f"CONVERSION_TIMEZONE: {e}")
+
+    return UploadConfig(
+        customer_id=customer_id,
+        conversion_action_id=conversion_action_id,
+        google_ads_yaml_path=env.get('GOOGLE_ADS_YAML_PATH') or 'google-ads.yaml',
+        max_in_flight=max(1, max_in_flight),
+        max_in_flight_per_customer=max(1, max_in_flight_per_customer),
+        timezone=timezone,
+        callrail_account_id=env.get('CALLRAIL_ACCOUNT_ID') or None,
+        qualification_rules_path=qualification_rules_path,
+        enhanced_conversions_for_leads=leads_enabled(env.get('ENHANCED_CONVERSIONS_FOR_LEADS', 'false')),
+        retry_max_attempts=max(1, _int_setting(env, 'RETRY_MAX_ATTEMPTS', DEFAULT_RETRY_MAX_ATTEMPTS))
+    )
+
+
+@dataclass(frozen=True)
+class DaemonConfig:
+    poll_seconds: int = 60
+    flush_rows: int = 500
+    flush_seconds: int = 300
+    overlap_minutes: int = 15
+    queue_check_seconds: int = 5
+    metrics_host: str = '127.0.0.1'
+    metrics_port: Optional[int] = None
+
+
+def load_daemon_config(env=None):
+    """
+    Read daemon-mode settings from the environment
+
+    UPLOAD_DAEMON_POLL_SECONDS: Seconds between CallRail polls (default 60)
+    UPLOAD_DAEMON_FLUSH_ROWS: Upload once this many conversions are pending (default 500)
+    UPLOAD_DAEMON_FLUSH_SECONDS: ...or once the oldest has waited this long (default 300)
+    UPLOAD_DAEMON_OVERLAP_MINUTES: Minutes re-fetched before the newest call on each poll (default 15)
+    UPLOAD_DAEMON_QUEUE_CHECK_SECONDS: Seconds between webhook queue checks (default 5)
+    UPLOAD_DAEMON_METRICS_HOST / UPLOAD_DAEMON_METRICS_PORT: Health and metrics
+        endpoint address (no port = disabled)
+
+    Returns:
+        DaemonConfig
+    """
+    if env is None:
+        _load_dotenv()
+        env = os.environ
+
+    defaults = DaemonConfig()
+
+    return DaemonConfig(
+        poll_seconds=max(1, _int_setting(env, 'UPLOAD_DAEMON_POLL_SECONDS', defaults.poll_seconds)),
+        flush_rows=max(1, _int_setting(env, 'UPLOAD_DAEMON_FLUSH_ROWS', defaults.flush_rows)),
+        flush_seconds=max(0, _int_setting(env, 'UPLOAD_DAEMON_FLUSH_SECONDS', defaults.flush_seconds)),
+        overlap_minutes=max(0, _int_setting(env, 'UPLOAD_DAEMON_OVERLAP_MINUTES', defaults.overlap_minutes)),
+        queue_check_seconds=max(1, _int_setting(
+            env, 'UPLOAD_DAEMON_QUEUE_CHECK_SECONDS', defaults.queue_check_seconds
+        )),
+        metrics_host=env.get('UPLOAD_DAEMON_METRICS_HOST') or defaults.metrics_host,
+        metrics_port=_int_setting(env, 'UPLOAD_DAEMON_METRICS_PORT', None)
+    )
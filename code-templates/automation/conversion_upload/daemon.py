@@ -0,0 +1,481 @@
+"""
+Upload Daemon: Resident CallRail -> Google Ads worker with micro-batches
+
+Instead of a cold run every few hours, the daemon keeps its Google Ads
+session and CallRail connection pool open, polls CallRail every
+poll_seconds, and buffers new conversions. The buffer is flushed to Google
+Ads once it holds flush_rows conversions or its oldest conversion has
+waited flush_seconds, so conversions reach Google Ads within minutes.
+
+The first poll starts from the saved watermark minus SYNC_OVERLAP_MINUTES,
+like a cron run. Later polls start from the newest call already fetched
+minus a short overlap_minutes window. The watermark is saved only when the
+buffer is empty, so a crash never skips buffered conversions.
+
+Conversions queued by the CallRail webhook receiver are picked up every
+queue_check_seconds and flushed under the same thresholds; with webhooks in
+place, poll_seconds can be raised so polling is only a reconciliation
+backstop. Queue events are deleted once their upload is in the ledger.
+
+Failed rows go to the retry queue. A flush also runs when retries become
+due, even if nothing new is buffered.
+
+SIGTERM / SIGINT stop polling, upload whatever is buffered (waiting for
+in-flight requests), save the watermark and exit.
+
+Health and metrics (when a metrics port is configured):
+    GET /healthz  200 while polls succeed, 503 when the last successful
+                  poll is older than three poll intervals
+    GET /metrics  Prometheus text format counters and gauges, the upload
+                  metrics from logging_config (rows, batches, RPC latency,
+                  failures by error code) and the API quota wait-time
+                  histogram per API and lane
+"""
+
+import json
+import signal
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+
+from automation.conversion_upload.config import load_config, load_daemon_config
+from automation.conversion_upload.session import get_session, session_for
+from automation.conversion_upload.uploader import _log, _open_state, upload_click_conversions_batch
+from automation.utils.state_manager import get_sync_start, save_last_sync_time, save_sync_watermark, state_path
+from automation.utils.logging_config import get_metrics
+from automation.utils.rate_limiter import get_rate_limiter
+from automation.utils.webhook_queue import WebhookQueue, queue_exists
+
+# Rows checked against the ledger per query while polling
+_FILTER_CHUNK = 500
+
+# Compact the ledger at most this often
+_COMPACT_INTERVAL_SECONDS = 3600
+
+
+class DaemonMetrics:
+    """Thread-safe counters and gauges exposed on /metrics and /healthz"""
+
+    COUNTERS = {
+        'polls': 'CallRail polls completed',
+        'poll_errors': 'CallRail polls that failed',
+        'calls_fetched': 'CallRail calls received',
+        'webhook_events': 'Webhook queue events read',
+        'conversions_buffered': 'New conversions added to the buffer',
+        'flushes': 'Micro-batches uploaded',
+        'flush_errors': 'Micro-batch uploads that failed and were kept for the next flush',
+        'uploaded': 'Conversions acknowledged by Google Ads',
+        'failed': 'Conversions rejected by Google Ads',
+        'retries_scheduled': 'Failed conversions scheduled for a retry',
+        'dead_lettered': 'Failed conversions written to the dead-letter file'
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.started_at = time.time()
+        self.last_poll_at = None
+        self.last_flush_at = None
+        self.pending_rows = 0
+        self.retry_rows = 0
+        self.skipped = 0
+        self.bloom_filtered = 0
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def set(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                setattr(self, name, value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                **self.counters,
+                'started_at': self.started_at,
+                'last_poll_at': self.last_poll_at,
+                'last_flush_at': self.last_flush_at,
+                'pending_rows': self.pending_rows,
+                'retry_rows': self.retry_rows,
+                'skipped': self.skipped,
+                'bloom_filtered': self.bloom_filtered
+            }
+
+    def render_prometheus(self):
+        """Return the metrics in Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, help_text in self.COUNTERS.items():
+            metric = f"conversion_upload_{name}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter", f"{metric} {snapshot[name]}"]
+
+        gauges = {
+            'pending_rows': ('Conversions waiting in the buffer', snapshot['pending_rows']),
+            'retry_rows': ('Failed conversions waiting in the retry queue', snapshot['retry_rows']),
+            'skipped_rows': ('Conversions skipped as already uploaded', snapshot['skipped']),
+            'bloom_filtered_rows': ('Conversions the ledger Bloom filter cleared without a lookup',
+                                    snapshot['bloom_filtered']),
+            'last_poll_timestamp_seconds': ('Unix time of the last successful poll', snapshot['last_poll_at'] or 0),
+            'last_flush_timestamp_seconds': ('Unix time of the last flush', snapshot['last_flush_at'] or 0),
+            'start_timestamp_seconds': ('Unix time the daemon started', snapshot['started_at'])
+        }
+        for name, (help_text, value) in gauges.items():
+            metric = f"conversion_upload_{name}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+
+        return (
+            "\n".join(lines) + "\n"
+            + get_metrics().render_prometheus()
+            + get_rate_limiter().stats.render_prometheus('conversion_upload_rate_limit')
+        )
+
+
+def _make_handler(daemon):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            body = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send(200, daemon.metrics.render_prometheus(), 'text/plain; version=0.0.4')
+            elif self.path in ('/healthz', '/health'):
+                healthy, status = daemon.health()
+                self._send(200 if healthy else 503, json.dumps(status), 'application/json')
+            else:
+                self._send(404, '{"error": "not found"}', 'application/json')
+
+    return Handler
+
+
+class UploadDaemon:
+    """
+    Resident conversion uploader
+
+    The CallRail account, qualification rules and state files (watermark,
+    ledger, retry queue, webhook queue) come from config, so a daemon per
+    tenant keeps its state in that tenant's state_dir.
+
+    Args:
+        config: UploadConfig (default: load_config())
+        daemon_config: DaemonConfig (default: load_daemon_config())
+        logger: Optional logger instance
+        client: GoogleAdsClient (default: the shared client for config)
+    """
+
+    def __init__(self, config=None, daemon_config=None, logger=None, client=None):
+        self.config = config or load_config()
+        self.settings = daemon_config or load_daemon_config()
+        self.logger = logger
+        self.metrics = DaemonMetrics()
+        self.metrics_server = None
+
+        self._client = client
+        self._session = None
+        self._ledger = None
+        self._retry_queue = None
+        self._stop_event = threading.Event()
+
+        self._pending = []
+        self._pending_refs = set()
+        self._oldest_pending_at = None
+        self._cursor = None
+        self._last_compact_at = time.monotonic()
+
+        self._queue = None
+        self._queue_path = state_path(self.config.state_dir, 'webhook_queue.sqlite3')
+        self._queue_cursor = 0
+        self._queued_event_ids = []
+
+    @property
+    def metrics_address(self):
+        """(host, port) of the health/metrics server, or None if disabled"""
+        if self.metrics_server is None:
+            return None
+        return self.metrics_server.server_address[:2]
+
+    def stop(self, *args):
+        """Ask the daemon to drain and exit (safe to call from a signal handler)"""
+        self._stop_event.set()
+
+    def health(self):
+        """Return (healthy, status dict) for /healthz"""
+        snapshot = self.metrics.snapshot()
+        last_ok = snapshot['last_poll_at'] or snapshot['started_at']
+        stale_after = 3 * self.settings.poll_seconds
+        healthy = not self._stop_event.is_set() and time.time() - last_ok <= stale_after
+
+        return healthy, {
+            'status': 'ok' if healthy else ('stopping' if self._stop_event.is_set() else 'stale'),
+            'pending_rows': snapshot['pending_rows'],
+            'last_poll_at': snapshot['last_poll_at'],
+            'last_flush_at': snapshot['last_flush_at'],
+            'uptime_seconds': round(time.time() - snapshot['started_at'], 1)
+        }
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = session_for(self._client) if self._client is not None else get_session(self.config)
+        return self._session
+
+    def _poll_start(self):
+        if self._cursor is None:
+            return get_sync_start(state_dir=self.config.state_dir)
+        return self._cursor[0] - timedelta(minutes=self.settings.overlap_minutes)
+
+    def _buffer(self, rows):
+        """
+        Add (ref, conversion) pairs not yet acknowledged or buffered
+
+        Returns:
+            Number of conversions added
+        """
+        rows = iter(rows)
+        added = 0
+        default_action = self.config.conversion_action_id
+        while True:
+            chunk = list(islice(rows, _FILTER_CHUNK))
+            if not chunk:
+                break
+            for ref, conversion in self._ledger.filter_new(chunk, default_action):
+                if ref in self._pending_refs:
+                    self._ledger.stats.repeats += 1
+                    continue
+                self._pending_refs.add(ref)
+                self._pending.append((ref, conversion))
+                added += 1
+
+        if added and self._oldest_pending_at is None:
+            self._oldest_pending_at = time.monotonic()
+        return added
+
+    def drain_queue(self):
+        """
+        Move new webhook queue events into the buffer
+
+        Returns:
+            Number of conversions added
+        """
+        if self._queue is None:
+            if not queue_exists(self._queue_path):
+                return 0
+            self._queue = WebhookQueue(self._queue_path)
+
+        events = self._queue.peek(after_id=self._queue_cursor)
+        if not events:
+            return 0
+
+        self._queue_cursor = events[-1][0]
+        self._queued_event_ids.extend(event_id for event_id, _ in events)
+        added = self._buffer((conversion['call_id'], conversion) for _, conversion in events)
+
+        if not self._pending:
+            # Every event was already uploaded
+            self._delete_queued_events()
+
+        self.metrics.increment('webhook_events', len(events))
+        self.metrics.increment('conversions_buffered', added)
+        self.metrics.set(pending_rows=len(self._pending), skipped=self._ledger.skipped,
+                         bloom_filtered=self._ledger.stats.filtered)
+        return added
+
+    def _delete_queued_events(self):
+        if self._queued_event_ids:
+            self._queue.delete(self._queued_event_ids)
+            self._queued_event_ids = []
+
+    def poll(self):
+        """
+        Fetch new CallRail conversions into the buffer
+
+        Returns:
+            Number of conversions added
+        """
+        from automation.utils.callrail_client import get_client
+        from automation.utils.callrail_fetcher import FetchStats, iter_new_conversions
+        from automation.utils.qualification_rules import load_rules
+
+        stats = FetchStats()
+        added = self._buffer(
+            (conversion['call_id'], conversion)
+            for conversion in iter_new_conversions(
+                stats=stats, start_date=self._poll_start(),
+                client=get_client(account_id=self.config.callrail_account_id),
+                rules=load_rules(self.config.qualification_rules_path, self.config.customer_id),
+                leads=self.config.enhanced_conversions_for_leads, logger=self.logger
+            )
+        )
+
+        if not stats.complete:
+            self.metrics.increment('poll_errors')
+            self.metrics.set(pending_rows=len(self._pending))
+            return added
+
+        if stats.max_start_time:
+            cursor = (stats.max_start_time, str(stats.max_call_id))
+            if self._cursor is None or cursor > self._cursor:
+                self._cursor = cursor
+        if not self._pending:
+            self._save_watermark()
+
+        self.metrics.increment('polls')
+        self.metrics.increment('calls_fetched', stats.calls)
+        self.metrics.increment('conversions_buffered', added)
+        self.metrics.set(last_poll_at=time.time(), pending_rows=len(self._pending),
+                         skipped=self._ledger.skipped, bloom_filtered=self._ledger.stats.filtered)
+        return added
+
+    def _save_watermark(self):
+        if self._cursor is not None:
+            save_sync_watermark(*self._cursor, state_dir=self.config.state_dir)
+
+    def _retry_due(self):
+        next_due_at = self._retry_queue.next_due_at()
+        return next_due_at is not None and next_due_at <= time.time()
+
+    def should_flush(self):
+        """
+        True once the buffer reaches flush_rows, its oldest row is flush_seconds
+        old, or a retry is due
+        """
+        if not self._pending:
+            return self._retry_due()
+        if len(self._pending) >= self.settings.flush_rows:
+            return True
+        return time.monotonic() - self._oldest_pending_at >= self.settings.flush_seconds
+
+    def flush(self, reason='threshold'):
+        """
+        Upload the buffered conversions plus failures whose retry is due
+
+        On an unexpected error the buffer is kept for the next flush.
+
+        Returns:
+            Tuple of (successful_count, failed_count)
+        """
+        retries = self._retry_queue.due()
+        scheduled_before = self._retry_queue.scheduled
+        dead_lettered_before = self._retry_queue.dead_lettered
+        _log(f"Flushing {len(self._pending)} conversions ({reason}), retrying {len(retries)}", self.logger)
+
+        try:
+            successful, failed, _ = upload_click_conversions_batch(
+                self._get_session(),
+                self.config.customer_id,
+                retries + self._pending,
+                default_conversion_action_id=self.config.conversion_action_id,
+                logger=self.logger,
+                max_in_flight=self.config.max_in_flight,
+                ledger=self._ledger,
+                max_in_flight_per_customer=self.config.max_in_flight_per_customer,
+                retry_queue=self._retry_queue
+            )
+        except Exception as e:
+            self.metrics.increment('flush_errors')
+            _log(f"✗ Flush failed, keeping {len(self._pending)} conversions buffered: {e}", self.logger, "error")
+            return 0, 0
+
+        # Everything fetched or queued so far is now in the ledger
+        self._pending = []
+        self._pending_refs = set()
+        self._oldest_pending_at = None
+        self._delete_queued_events()
+        self._save_watermark()
+        save_last_sync_time(self.config.state_dir)
+
+        self.metrics.increment('flushes')
+        self.metrics.increment('uploaded', successful)
+        self.metrics.increment('failed', failed)
+        self.metrics.increment('retries_scheduled', self._retry_queue.scheduled - scheduled_before)
+        self.metrics.increment('dead_lettered', self._retry_queue.dead_lettered - dead_lettered_before)
+        self.metrics.set(last_flush_at=time.time(), pending_rows=0, retry_rows=len(self._retry_queue),
+                         skipped=self._ledger.skipped, bloom_filtered=self._ledger.stats.filtered)
+        _log(f"✓ Flushed: {successful} uploaded, {failed} failed", self.logger)
+        return successful, failed
+
+    def _next_wait(self, next_poll_at):
+        wait = max(0.0, next_poll_at - time.monotonic())
+        if self._queue is not None or queue_exists(self._queue_path):
+            wait = min(wait, self.settings.queue_check_seconds)
+        if self._pending:
+            flush_in = self._oldest_pending_at + self.settings.flush_seconds - time.monotonic()
+            wait = min(wait, max(0.0, flush_in))
+        next_due_at = self._retry_queue.next_due_at()
+        if next_due_at is not None:
+            wait = min(wait, max(0.0, next_due_at - time.time()))
+        return wait
+
+    def _start_metrics_server(self):
+        if self.settings.metrics_port is None:
+            return
+        self.metrics_server = ThreadingHTTPServer(
+            (self.settings.metrics_host, self.settings.metrics_port), _make_handler(self)
+        )
+        self.metrics_server.daemon_threads = True
+        threading.Thread(target=self.metrics_server.serve_forever, daemon=True).start()
+        host, port = self.metrics_address
+        _log(f"Health and metrics on http://{host}:{port}/healthz and /metrics", self.logger)
+
+    def run(self):
+        """Poll and flush until stop() or SIGTERM / SIGINT, then drain"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        self._ledger, self._retry_queue = _open_state(self.config)
+        self.metrics.set(retry_rows=len(self._retry_queue))
+        self._start_metrics_server()
+        _log(
+            f"=== Upload daemon started (poll every {self.settings.poll_seconds}s, flush at "
+            f"{self.settings.flush_rows} rows or {self.settings.flush_seconds}s) ===",
+            self.logger
+        )
+
+        next_poll_at = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.drain_queue()
+                except Exception as e:
+                    _log(f"✗ Reading the webhook queue failed: {e}", self.logger, "error")
+
+                if time.monotonic() >= next_poll_at:
+                    next_poll_at = time.monotonic() + self.settings.poll_seconds
+                    try:
+                        self.poll()
+                    except Exception as e:
+                        self.metrics.increment('poll_errors')
+                        _log(f"✗ Poll failed: {e}", self.logger, "error")
+
+                if self.should_flush():
+                    self.flush()
+
+                if time.monotonic() - self._last_compact_at >= _COMPACT_INTERVAL_SECONDS:
+                    self._ledger.compact()
+                    self._retry_queue.compact()
+                    self._last_compact_at = time.monotonic()
+
+                self._stop_event.wait(self._next_wait(next_poll_at))
+        finally:
+            _log("Stopping: draining buffered conversions", self.logger)
+            if self._pending:
+                self.flush(reason='shutdown')
+            self._retry_queue.close()
+            self._ledger.close()
+            if self._queue is not None:
+                self._queue.close()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
+                self.metrics_server.server_close()
+            _log("=== Upload daemon stopped ===", self.logger)
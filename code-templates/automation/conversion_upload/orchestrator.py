@@ -0,0 +1,334 @@
+"""
+Tenant Orchestrator: One process syncing many CallRail accounts to Google Ads
+
+An agency runs one clinic per CallRail account, each uploading to its own
+Google Ads customer and conversion actions. Instead of one cold process per
+clinic, the orchestrator reads a tenant manifest and runs every tenant's
+CallRail -> Google Ads sync (upload_conversions_from_callrail) on a worker
+pool inside one process:
+
+- one pooled CallRail client per API key (accounts share its connections
+  and throttle) and one Google Ads client per google-ads.yaml,
+- shared API quota buckets, with per-account and per-customer budgets
+  (rate_limiter) and per-customer in-flight caps,
+- per-tenant state: watermark, upload ledger, retry queue and webhook
+  queue live in <state_root>/<tenant name>/ (the webhook queue is filled
+  by one webhook-handler.py --tenant <name> receiver per tenant),
+- per-tenant failure isolation: an error in one tenant's sync is logged
+  and counted, and that tenant backs off; the others keep running.
+
+Scheduling is fair: a tenant never runs twice at once, due tenants start
+in the order they became due, and in continuous mode each tenant is
+rescheduled poll_seconds after its own run ends, so a clinic with a large
+backlog only delays itself.
+
+Manifest (JSON):
+    {
+      "state_root": ".tenants",
+      "defaults": {"google_ads_yaml_path": "google-ads.yaml", "max_in_flight": 2},
+      "tenants": [
+        {"name": "clinic-a", "callrail_account_id": "ACC111",
+         "customer_id": "1234567890", "conversion_action_id": "987654321",
+         "timezone": "America/Los_Angeles"},
+        {"name": "clinic-b", "callrail_account_id": "ACC222",
+         "customer_id": "2345678901", "conversion_action_id": "987654330",
+         "qualification_rules": "callrail/clinic-b-rules.json",
+         "enabled": false}
+      ]
+    }
+
+Tenant settings override "defaults", which override the environment (see
+TENANT_SETTINGS for the keys and the environment variables they replace).
+Relative state_root and qualification_rules paths are relative to the
+manifest.
+"""
+
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from heapq import heappop, heappush
+from itertools import count
+from typing import Optional
+
+from automation.conversion_upload.config import ConfigError, UploadConfig, _load_dotenv, load_config
+from automation.conversion_upload.uploader import _log, upload_conversions_from_callrail
+from automation.utils.logging_config import get_metrics
+from automation.utils.settings import env_int
+
+# Tenants synced concurrently (TENANT_WORKERS)
+DEFAULT_TENANT_WORKERS = 4
+
+# Default root of the per-tenant state directories, relative to the manifest
+DEFAULT_STATE_ROOT = '.tenants'
+
+# Manifest key -> environment variable it replaces for that tenant
+TENANT_SETTINGS = {
+    'customer_id': 'GOOGLE_ADS_CUSTOMER_ID',
+    'conversion_action_id': 'GOOGLE_ADS_CONVERSION_ACTION_ID',
+    'callrail_account_id': 'CALLRAIL_ACCOUNT_ID',
+    'google_ads_yaml_path': 'GOOGLE_ADS_YAML_PATH',
+    'max_in_flight': 'GOOGLE_ADS_UPLOAD_MAX_IN_FLIGHT',
+    'max_in_flight_per_customer': 'GOOGLE_ADS_MAX_IN_FLIGHT_PER_CUSTOMER',
+    'timezone': 'CONVERSION_TIMEZONE',
+    'qualification_rules': 'QUALIFICATION_RULES_PATH',
+    'enhanced_conversions_for_leads': 'ENHANCED_CONVERSIONS_FOR_LEADS',
+    'retry_max_attempts': 'RETRY_MAX_ATTEMPTS',
+}
+
+# Accounts every tenant names itself (in its entry or "defaults"), never
+# inherited from the environment
+TENANT_IDENTITY = ('customer_id', 'conversion_action_id', 'callrail_account_id')
+
+# A failing tenant waits poll_seconds * 2**failures, up to this long
+MAX_BACKOFF_SECONDS = 3600
+
+_TENANT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+@dataclass
+class Tenant:
+    """
+    One clinic: its upload configuration and run history
+
+    Attributes:
+        name: Tenant name (also its state directory name)
+        config: UploadConfig with the tenant's accounts and state_dir
+        enabled: False to keep the tenant in the manifest without syncing it
+    """
+    name: str
+    config: UploadConfig
+    enabled: bool = True
+    runs: int = 0
+    successful: int = 0
+    failed: int = 0
+    consecutive_errors: int = 0
+    last_error: Optional[str] = None
+    last_run_seconds: Optional[float] = None
+
+    def retry_delay(self, poll_seconds):
+        """Seconds until the next run: poll_seconds, longer after errors"""
+        if not self.consecutive_errors:
+            return poll_seconds
+        return min(poll_seconds * 2 ** self.consecutive_errors, max(poll_seconds, MAX_BACKOFF_SECONDS))
+
+
+class _TenantLogger(logging.LoggerAdapter):
+    """Prefix messages with the tenant and add a 'tenant' field to records"""
+
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {**self.extra, **(kwargs.get('extra') or {})}
+        return f"[{self.extra['tenant']}] {msg}", kwargs
+
+
+def load_tenant_manifest(path=None, env=None):
+    """
+    Read a tenant manifest
+
+    Args:
+        path: Manifest file (default: TENANT_MANIFEST)
+        env: Mapping the tenant settings are layered over (default:
+             os.environ, after loading the .env file)
+
+    Returns:
+        List of Tenant, in manifest order
+
+    Raises:
+        ConfigError if the manifest is missing or invalid, a tenant does not
+        name its customer_id, conversion_action_id and callrail_account_id,
+        or a setting is invalid
+    """
+    if env is None:
+        _load_dotenv()
+        env = os.environ
+    path = path or env.get('TENANT_MANIFEST')
+    if not path:
+        raise ConfigError("No tenant manifest given. Set TENANT_MANIFEST or pass --tenants")
+
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Could not read tenant manifest {path}: {e}")
+
+    entries = manifest.get('tenants') if isinstance(manifest, dict) else None
+    if not entries:
+        raise ConfigError(f"Tenant manifest {path} has no tenants")
+    defaults = manifest.get('defaults', {})
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    state_root = os.path.join(manifest_dir, manifest.get('state_root', DEFAULT_STATE_ROOT))
+
+    tenants = []
+    names = set()
+    for entry in entries:
+        name = str(entry.get('name', ''))
+        if not _TENANT_NAME.match(name):
+            raise ConfigError(f"Tenant name {name!r} must be letters, digits, '.', '_' or '-'")
+        if name in names:
+            raise ConfigError(f"Tenant {name!r} appears twice in {path}")
+        names.add(name)
+
+        settings = {**defaults, **entry}
+        unknown = set(settings) - set(TENANT_SETTINGS) - {'name', 'enabled'}
+        if unknown:
+            raise ConfigError(f"Tenant {name!r}: unknown settings {', '.join(sorted(unknown))}")
+        missing = [key for key in TENANT_IDENTITY if not settings.get(key)]
+        if missing:
+            raise ConfigError(f"Tenant {name!r}: missing {', '.join(missing)}")
+
+        rules = settings.get('qualification_rules')
+        if rules is not None and not isinstance(rules, str):
+            raise ConfigError(f"Tenant {name!r}: qualification_rules must be a path or 'off'")
+        if rules and rules.lower() != 'off':
+            settings['qualification_rules'] = os.path.join(manifest_dir, rules)
+
+        tenant_env = dict(env)
+        for key, variable in TENANT_SETTINGS.items():
+            if settings.get(key) is not None:
+                tenant_env[variable] = str(settings[key])
+        try:
+            config = load_config(tenant_env)
+        except ConfigError as e:
+            raise ConfigError(f"Tenant {name!r}: {e}")
+
+        tenants.append(Tenant(
+            name=name,
+            config=replace(config, state_dir=os.path.join(state_root, name)),
+            enabled=bool(settings.get('enabled', True))
+        ))
+    return tenants
+
+
+class TenantOrchestrator:
+    """
+    Runs each tenant's CallRail -> Google Ads sync on a shared worker pool
+
+    Args:
+        tenants: List of Tenant (see load_tenant_manifest)
+        workers: Tenants synced concurrently (default: TENANT_WORKERS or 4)
+        logger: Optional logger instance; each tenant logs through an
+                adapter that tags its records
+        sync: Function run per tenant, called as sync(since_minutes=...,
+              logger=..., config=...) and returning (successful, failed)
+              (default: upload_conversions_from_callrail)
+    """
+
+    def __init__(self, tenants, workers=None, logger=None, sync=upload_conversions_from_callrail):
+        self.tenants = [tenant for tenant in tenants if tenant.enabled]
+        if workers is None:
+            workers = env_int('TENANT_WORKERS', DEFAULT_TENANT_WORKERS)
+        self.workers = max(1, workers)
+        self.logger = logger
+        self.sync = sync
+        self._stop_event = threading.Event()
+
+    def stop(self, *args):
+        """Start no more tenant runs; runs in progress finish (safe from a signal handler)"""
+        self._stop_event.set()
+
+    def run_tenant(self, tenant, since_minutes=None):
+        """
+        Run one tenant's sync, isolating its failures
+
+        Returns:
+            True if the sync completed
+        """
+        logger = _TenantLogger(self.logger, {'tenant': tenant.name}) if self.logger else None
+
+        started = time.perf_counter()
+        tenant.runs += 1
+        try:
+            os.makedirs(tenant.config.state_dir, exist_ok=True)
+            successful, failed = self.sync(since_minutes=since_minutes, logger=logger, config=tenant.config)
+        except Exception as e:
+            tenant.consecutive_errors += 1
+            tenant.last_error = f"{type(e).__name__}: {e}"
+            get_metrics().inc('tenant_runs', tenant=tenant.name, outcome='error')
+            _log(f"✗ Tenant {tenant.name} failed: {tenant.last_error}", self.logger, "error",
+                 tenant=tenant.name, consecutive_errors=tenant.consecutive_errors)
+            return False
+        finally:
+            tenant.last_run_seconds = time.perf_counter() - started
+
+        tenant.consecutive_errors = 0
+        tenant.last_error = None
+        tenant.successful += successful
+        tenant.failed += failed
+        get_metrics().inc('tenant_runs', tenant=tenant.name, outcome='ok')
+        return True
+
+    def run(self, since_minutes=None, poll_seconds=None):
+        """
+        Run every enabled tenant once, or continuously
+
+        Args:
+            since_minutes: Fetch window per run (None = incremental sync from
+                           each tenant's watermark)
+            poll_seconds: None to run each tenant once and return; otherwise
+                          rerun each tenant this long after its run ends
+                          (longer after errors) until stop() or SIGTERM / SIGINT
+
+        Returns:
+            Number of tenants whose last run failed
+        """
+        continuous = poll_seconds is not None
+        if continuous and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        _log(f"=== Syncing {len(self.tenants)} tenants with {self.workers} workers ===", self.logger)
+
+        order = count()
+        due = []
+        for tenant in self.tenants:
+            heappush(due, (time.monotonic(), next(order), tenant))
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tenant') as executor:
+            while due or running:
+                if self._stop_event.is_set():
+                    # Let runs in progress finish, start nothing new
+                    due.clear()
+                    if not running:
+                        break
+
+                # Start due tenants, earliest due first, while workers are free
+                now = time.monotonic()
+                while due and len(running) < self.workers and due[0][0] <= now:
+                    _, _, tenant = heappop(due)
+                    running[executor.submit(self.run_tenant, tenant, since_minutes)] = tenant
+
+                if not running:
+                    self._stop_event.wait(max(0.0, due[0][0] - now))
+                    continue
+
+                # Wake up for the next due tenant, and at least every second
+                # to check for stop()
+                timeout = 1.0
+                if due and len(running) < self.workers:
+                    timeout = min(timeout, max(0.0, due[0][0] - now))
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    tenant = running.pop(future)
+                    if continuous:
+                        heappush(due, (time.monotonic() + tenant.retry_delay(poll_seconds), next(order), tenant))
+
+        self._log_summary()
+        return sum(1 for tenant in self.tenants if tenant.consecutive_errors)
+
+    def _log_summary(self):
+        lines = ["", "=== Tenant Summary ==="]
+        for tenant in self.tenants:
+            status = f"error ({tenant.last_error})" if tenant.consecutive_errors else "ok"
+            seconds = f"{tenant.last_run_seconds:.1f}s" if tenant.last_run_seconds is not None else "-"
+            lines.append(
+                f"{tenant.name}: {status}, {tenant.successful} uploaded, {tenant.failed} failed, "
+                f"{tenant.runs} runs, last run {seconds}"
+            )
+        _log("\n".join(lines), self.logger)
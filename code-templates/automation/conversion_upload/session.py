@@ -0,0 +1,201 @@
+"""
+Upload Session: Google Ads client state built once and reused across uploads
+
+A GoogleAdsClient is cheap to call but expensive to set up: load_from_storage
+parses google-ads.yaml, get_service builds a gRPC transport, and get_type
+copies a message prototype. UploadSession does that work once per client:
+
+- service stubs are created in the constructor,
+- conversion-action resource names are memoized per (customer_id, action_id)
+  in a bounded LRU,
+- requests are built directly on the underlying protobuf message, adding
+  rows with conversions.add(...) instead of creating a ClickConversion
+  wrapper per row. Rows without a GCLID (enhanced conversions for leads)
+  carry their hashed phone number in user_identifiers.
+
+The ConversionAdjustmentUploadService stub is created the first time an
+adjustment request is built, so click uploads never pay for it.
+
+get_session(config) keeps one session per google-ads.yaml path for the
+life of the process.
+"""
+
+import threading
+import weakref
+from functools import lru_cache
+
+# Distinct (customer_id, conversion_action_id) resource names kept per session
+PATH_CACHE_SIZE = 1024
+
+_sessions = {}
+_sessions_by_client = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+
+def _message_class(client, name):
+    """
+    Return (wrapper_class, protobuf_class) for a Google Ads message type
+
+    wrapper_class is None when the client was created with use_proto_plus=False.
+    """
+    message_type = type(client.get_type(name))
+    if hasattr(message_type, 'pb'):
+        return message_type, message_type.pb()
+    return None, message_type
+
+
+class UploadSession:
+    """
+    Google Ads client, service stubs and message classes for conversion uploads
+
+    Thread-safe: one session is shared by every in-flight batch request.
+
+    Args:
+        client: GoogleAdsClient instance
+        path_cache_size: Maximum memoized conversion-action resource names
+    """
+
+    def __init__(self, client, path_cache_size=PATH_CACHE_SIZE):
+        self.client = client
+        self.upload_service = client.get_service("ConversionUploadService")
+
+        google_ads_service = client.get_service("GoogleAdsService")
+        self.conversion_action_path = lru_cache(maxsize=path_cache_size)(
+            google_ads_service.conversion_action_path
+        )
+
+        self._request_wrapper, self._request_pb = _message_class(client, "UploadClickConversionsRequest")
+        self._first_party = int(client.enums.UserIdentifierSourceEnum.FIRST_PARTY)
+
+        self._adjustments = None
+        self._adjustments_lock = threading.Lock()
+        self.failure_type = type(client.get_type("GoogleAdsFailure"))
+
+    def build_request(self, customer_id, batch, default_conversion_action_id=None):
+        """
+        Build an UploadClickConversionsRequest with partial failure enabled
+
+        Args:
+            customer_id: Google Ads customer ID
+            batch: List of (ref, conversion) pairs; conversion is a dict with
+                   gclid (or hashed_phone_number), conversion_date_time and
+                   optional conversion_action_id / conversion_value
+            default_conversion_action_id: Used when a row has no conversion_action_id
+        """
+        request = self._request_pb(customer_id=customer_id, partial_failure=True)
+        add_conversion = request.conversions.add
+        action_path = self.conversion_action_path
+
+        for _, conversion in batch:
+            conversion_action_id = conversion.get("conversion_action_id") or default_conversion_action_id
+            click_conversion = add_conversion(
+                conversion_action=action_path(customer_id, str(conversion_action_id)),
+                conversion_date_time=conversion["conversion_date_time"]
+            )
+            gclid = conversion.get("gclid")
+            if gclid:
+                click_conversion.gclid = gclid
+            else:
+                click_conversion.user_identifiers.add(
+                    hashed_phone_number=conversion["hashed_phone_number"],
+                    user_identifier_source=self._first_party
+                )
+            conversion_value = conversion.get("conversion_value")
+            if conversion_value:
+                click_conversion.conversion_value = float(conversion_value)
+
+        if self._request_wrapper is None:
+            return request
+        # wrap() shares the protobuf message instead of copying it
+        return self._request_wrapper.wrap(request)
+
+    def upload(self, request):
+        """Send an UploadClickConversionsRequest"""
+        return self.upload_service.upload_click_conversions(request=request)
+
+    def _adjustment_state(self):
+        """(service, request wrapper, request protobuf class, adjustment type values), built once"""
+        with self._adjustments_lock:
+            if self._adjustments is None:
+                types = self.client.enums.ConversionAdjustmentTypeEnum
+                self._adjustments = (
+                    self.client.get_service("ConversionAdjustmentUploadService"),
+                    *_message_class(self.client, "UploadConversionAdjustmentsRequest"),
+                    {name: int(getattr(types, name)) for name in ("RESTATEMENT", "RETRACTION")}
+                )
+            return self._adjustments
+
+    def build_adjustment_request(self, customer_id, batch, default_conversion_action_id=None):
+        """
+        Build an UploadConversionAdjustmentsRequest with partial failure enabled
+
+        Args:
+            customer_id: Google Ads customer ID
+            batch: List of (ref, adjustment) pairs; adjustment is a dict with
+                   gclid, conversion_date_time (of the uploaded conversion),
+                   adjustment_type ('RESTATEMENT' or 'RETRACTION'),
+                   adjustment_date_time, optional conversion_action_id and,
+                   for restatements, restatement_value
+            default_conversion_action_id: Used when a row has no conversion_action_id
+        """
+        _, request_wrapper, request_pb, adjustment_types = self._adjustment_state()
+        request = request_pb(customer_id=customer_id, partial_failure=True)
+        add_adjustment = request.conversion_adjustments.add
+        action_path = self.conversion_action_path
+
+        for _, adjustment in batch:
+            conversion_action_id = adjustment.get("conversion_action_id") or default_conversion_action_id
+            conversion_adjustment = add_adjustment(
+                conversion_action=action_path(customer_id, str(conversion_action_id)),
+                adjustment_type=adjustment_types[adjustment["adjustment_type"]],
+                adjustment_date_time=adjustment["adjustment_date_time"]
+            )
+            pair = conversion_adjustment.gclid_date_time_pair
+            pair.gclid = adjustment["gclid"]
+            pair.conversion_date_time = adjustment["conversion_date_time"]
+            if adjustment["adjustment_type"] == "RESTATEMENT":
+                conversion_adjustment.restatement_value.adjusted_value = float(adjustment["restatement_value"])
+
+        if request_wrapper is None:
+            return request
+        return request_wrapper.wrap(request)
+
+    def upload_adjustments(self, request):
+        """Send an UploadConversionAdjustmentsRequest"""
+        return self._adjustment_state()[0].upload_conversion_adjustments(request=request)
+
+
+def session_for(client):
+    """Return the UploadSession for a GoogleAdsClient, creating it on first use"""
+    if isinstance(client, UploadSession):
+        return client
+
+    with _sessions_lock:
+        session = _sessions_by_client.get(client)
+        if session is None:
+            session = _sessions_by_client[client] = UploadSession(client)
+        return session
+
+
+def get_session(config):
+    """
+    Return the shared UploadSession for a configuration
+
+    The GoogleAdsClient is loaded from config.google_ads_yaml_path the first
+    time; later calls reuse it. The google.ads SDK is imported here.
+    """
+    path = config.google_ads_yaml_path
+
+    with _sessions_lock:
+        session = _sessions.get(path)
+    if session is not None:
+        return session
+
+    from google.ads.googleads.client import GoogleAdsClient
+    session = UploadSession(GoogleAdsClient.load_from_storage(path))
+
+    with _sessions_lock:
+        # Another thread may have loaded the same file meanwhile
+        session = _sessions.setdefault(path, session)
+        _sessions_by_client.setdefault(session.client, session)
+    return session
@@ -0,0 +1,693 @@
+"""
+Conversion Uploader: Upload click conversions to Google Ads
+
+Rows from a CSV file or from CallRail are batched into
+UploadClickConversionsRequests with partial failure enabled, optionally
+with several requests in flight, and tracked in the upload ledger. Failed
+rows are handed to the retry queue, which schedules them with backoff or
+dead-letters them depending on the error.
+
+The Google Ads SDK (a large protobuf/gRPC tree) and the CallRail client are
+imported only when an upload needs them, so runs with nothing to upload
+return quickly.
+"""
+
+import csv
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import chain, islice
+
+from automation.conversion_upload.config import (
+    DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER,
+    MAX_CONVERSIONS_PER_REQUEST,
+    load_config
+)
+from automation.conversion_upload.session import get_session, session_for
+from automation.utils.columnar_io import columnar_format_for, iter_rows, read_schema
+from automation.utils.crm_rows import OUTPUT_FIELDNAMES
+from automation.utils.state_manager import get_sync_start, save_last_sync_time, save_sync_watermark, state_path
+from automation.utils.logging_config import get_metrics
+from automation.utils.profiling import span
+from automation.utils.rate_limiter import RateLimitExceeded, get_rate_limiter, google_ads_demands
+from automation.utils.retry_queue import RetryQueue
+from automation.utils.timestamps import TimestampNormalizer
+from automation.utils.upload_ledger import (
+    STATUS_ACKNOWLEDGED,
+    STATUS_DEAD_LETTER,
+    UploadLedger,
+    conversion_key
+)
+from automation.utils.webhook_queue import WebhookQueue, queue_exists
+
+# One semaphore per customer, shared by every upload running in this process
+_customer_slots = {}
+_customer_slots_lock = threading.Lock()
+
+
+def load_client(config):
+    """
+    Return the GoogleAdsClient for the configured google-ads.yaml
+
+    The client is loaded once per process (see session.get_session); the SDK
+    is imported on first use rather than at module level.
+    """
+    return get_session(config).client
+
+
+def _log(message, logger=None, level="info", **fields):
+    """
+    Send a message to the logger if one is configured, otherwise print it
+
+    Keyword arguments become structured fields of the record (JSON log
+    format); success=True marks a message that may be sampled.
+    """
+    if logger:
+        getattr(logger, level)(message, extra=fields or None)
+    else:
+        print(message)
+
+
+def _error_code_name(error):
+    """
+    Return a stable name for a GoogleAdsError code
+
+    Example: "conversion_upload_error.EXPIRED_EVENT"
+    """
+    error_code = error.error_code
+    field = type(error_code).pb(error_code).WhichOneof("error_code")
+    if not field:
+        return "unknown"
+    return f"{field}.{getattr(error_code, field).name}"
+
+
+def _partial_failure_errors(session, response, field_name="conversions"):
+    """
+    Decode the partial_failure_error of an upload response
+
+    Args:
+        field_name: Repeated request field the error locations index
+                    ('conversion_adjustments' for adjustment uploads)
+
+    Returns:
+        Dict mapping the index of each failed conversion in the request to a
+        list of {'code', 'message'} dicts
+    """
+    partial_failure = getattr(response, "partial_failure_error", None)
+    if not partial_failure or partial_failure.code == 0:
+        return {}
+
+    failure_type = session.failure_type
+    errors_by_index = {}
+
+    for detail in partial_failure.details:
+        failure = failure_type.deserialize(detail.value)
+        for error in failure.errors:
+            index = None
+            for element in error.location.field_path_elements:
+                if element.field_name == field_name:
+                    index = element.index
+                    break
+            errors_by_index.setdefault(index, []).append({
+                "code": _error_code_name(error),
+                "message": error.message
+            })
+
+    return errors_by_index
+
+
+def _fail_batch(batch, errors):
+    """Failures for every row of a batch rejected as a whole"""
+    return [
+        {"ref": ref, "gclid": conversion.get("gclid"), "errors": errors}
+        for ref, conversion in batch
+    ]
+
+
+def _upload_batch(session, customer_id, batch, default_conversion_action_id=None, adjustments=False):
+    """
+    Send one UploadClickConversionsRequest for a batch of (ref, conversion) pairs
+
+    With ``adjustments``, the pairs are (ref, adjustment) and one
+    UploadConversionAdjustmentsRequest is sent instead.
+
+    Returns:
+        List of failures ({'ref', 'gclid', 'errors'}) for the batch
+    """
+    import grpc
+    from google.ads.googleads.errors import GoogleAdsException
+
+    if adjustments:
+        build, send = session.build_adjustment_request, session.upload_adjustments
+        field_name = "conversion_adjustments"
+    else:
+        build, send = session.build_request, session.upload
+        field_name = "conversions"
+
+    # Partial failure is enabled: the request continues past rows that fail
+    with span('upload.build_request'):
+        request = build(customer_id, batch, default_conversion_action_id)
+    metrics = get_metrics()
+
+    started = time.perf_counter()
+    try:
+        with span('google_ads.rpc'):
+            response = send(request)
+    except GoogleAdsException as ex:
+        # The whole request was rejected: every row in the batch failed
+        errors = [
+            {"code": _error_code_name(error), "message": error.message}
+            for error in ex.failure.errors
+        ] or [{"code": "unknown", "message": str(ex)}]
+        return _fail_batch(batch, errors)
+    except grpc.RpcError as ex:
+        # Deadline, connection or server errors: retried, not fatal to the run
+        return _fail_batch(batch, [{"code": f"transport.{ex.code().name}", "message": ex.details() or str(ex)}])
+    finally:
+        metrics.inc('batches')
+        metrics.observe('rpc_latency_seconds', time.perf_counter() - started)
+
+    failures = []
+    with span('upload.partial_failures'):
+        errors_by_index = _partial_failure_errors(session, response, field_name)
+    for index, errors in errors_by_index.items():
+        if index is None or index >= len(batch):
+            continue
+        ref, conversion = batch[index]
+        failures.append({"ref": ref, "gclid": conversion.get("gclid"), "errors": errors})
+
+    # Errors without a conversion index cannot be attributed to a single row
+    for error in errors_by_index.get(None, []):
+        failures.extend(
+            {"ref": ref, "gclid": conversion.get("gclid"), "errors": [error]}
+            for ref, conversion in batch
+        )
+
+    return failures
+
+
+@contextmanager
+def _customer_slot(customer_id, limit=DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER):
+    """
+    Hold one of the ``limit`` request slots for a customer
+
+    Caps concurrent requests per account even when several uploads for the
+    same customer run at once. The first upload for a customer sets its limit.
+    """
+    with _customer_slots_lock:
+        slot = _customer_slots.get(customer_id)
+        if slot is None:
+            slot = threading.BoundedSemaphore(max(1, limit))
+            _customer_slots[customer_id] = slot
+
+    with slot:
+        yield
+
+
+def _upload_batch_in_slot(session, customer_id, batch, default_conversion_action_id=None,
+                          max_in_flight_per_customer=DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER, adjustments=False):
+    """
+    Run _upload_batch() while holding a per-customer request slot and quota
+
+    Tokens come from the shared rate limiter (developer-token operations and
+    per-customer requests). If they do not become available in time, the
+    batch fails with rate_limit.QUOTA_WAIT_EXCEEDED and is retried later.
+    """
+    with _customer_slot(customer_id, max_in_flight_per_customer):
+        try:
+            with span('rate_limit.acquire'):
+                get_rate_limiter().acquire(google_ads_demands(customer_id, len(batch)))
+        except RateLimitExceeded as e:
+            return _fail_batch(batch, [{"code": "rate_limit.QUOTA_WAIT_EXCEEDED", "message": str(e)}])
+        return _upload_batch(session, customer_id, batch, default_conversion_action_id, adjustments)
+
+
+def _report_batch(batch, batch_failures, logger=None):
+    """Log and count the outcome of one batch request"""
+    failed_refs = {failure["ref"] for failure in batch_failures}
+    successful = len(batch) - len(failed_refs)
+
+    metrics = get_metrics()
+    metrics.inc('rows', successful, outcome='uploaded')
+    metrics.inc('rows', len(failed_refs), outcome='failed')
+
+    _log(
+        f"✓ Uploaded batch of {len(batch)} conversions ({len(failed_refs)} failed)",
+        logger, success=True, event='batch_uploaded', rows=len(batch), failed=len(failed_refs)
+    )
+
+    for failure in batch_failures:
+        codes = [error['code'] for error in failure["errors"]]
+        for code in codes:
+            metrics.inc('failures', code=code)
+        details = "; ".join(f"{error['code']}: {error['message']}" for error in failure["errors"])
+        _log(
+            f"✗ Failed to upload conversion ref={failure['ref']} gclid={failure['gclid']}: {details}",
+            logger, "error", event='conversion_failed', ref=failure['ref'], gclid=failure['gclid'],
+            error_codes=codes
+        )
+
+    return successful
+
+
+def upload_click_conversions_batch(client, customer_id, conversions, default_conversion_action_id=None,
+                                   logger=None, batch_size=MAX_CONVERSIONS_PER_REQUEST, max_in_flight=1,
+                                   ledger=None, max_in_flight_per_customer=DEFAULT_MAX_IN_FLIGHT_PER_CUSTOMER,
+                                   retry_queue=None):
+    """
+    Upload conversions to Google Ads in batched requests
+
+    Conversions are packed into requests of up to ``batch_size`` rows and sent
+    with partial_failure enabled. Per-row errors are mapped back to the ``ref``
+    of the row that caused them.
+
+    With ``max_in_flight`` > 1, up to that many batch requests are sent
+    concurrently from a thread pool (further capped per customer by
+    ``max_in_flight_per_customer``). Results are still collected in submission
+    order, so logs and totals read the same as a serial run.
+
+    With a ``ledger``, rows Google Ads already acknowledged are skipped before
+    they are batched, rows repeated within the run are sent once, and the
+    outcome of every request is recorded.
+
+    With a ``retry_queue``, failures are scheduled for retry or dead-lettered
+    (and marked so in the ledger), and rows whose retry is not due yet are
+    held back instead of being sent again.
+
+    Args:
+        client: GoogleAdsClient or UploadSession
+        customer_id: Google Ads customer ID
+        conversions: Iterable of (ref, conversion) pairs. ``ref`` identifies the
+                     source record (CSV row number, CallRail call ID) and
+                     ``conversion`` is a dict with gclid (or, for enhanced
+                     conversions for leads, hashed_phone_number), conversion_date_time
+                     and optional conversion_action_id / conversion_value
+        default_conversion_action_id: Conversion action used when a row has none
+        logger: Optional logger instance
+        batch_size: Maximum conversions per request (default 2,000)
+        max_in_flight: Maximum concurrent batch requests (default 1 = serial)
+        ledger: Optional UploadLedger for idempotent uploads
+        max_in_flight_per_customer: Cap on concurrent requests per customer,
+                                    across all uploads in this process
+        retry_queue: Optional RetryQueue for failed rows
+
+    Returns:
+        Tuple of (successful_count, failed_count, failures) where failures is a
+        list of {'ref', 'gclid', 'errors'} dicts
+    """
+    session = session_for(client)
+    batch_size = max(1, min(batch_size, MAX_CONVERSIONS_PER_REQUEST))
+    max_in_flight = max(1, max_in_flight)
+    conversions = iter(conversions)
+
+    successful = 0
+    failures = []
+    seen_keys = set()
+
+    def next_batch():
+        with span('upload.next_batch'):
+            return _next_batch()
+
+    def _next_batch():
+        if ledger is None and retry_queue is None:
+            with span('upload.read_source'):
+                return list(islice(conversions, batch_size))
+
+        # Refill until the batch is full, since acknowledged rows drop out
+        batch = []
+        while len(batch) < batch_size:
+            with span('upload.read_source'):
+                chunk = list(islice(conversions, batch_size - len(batch)))
+            if not chunk:
+                break
+            if ledger is not None:
+                with span('ledger.filter_new'):
+                    chunk = ledger.filter_new(chunk, default_conversion_action_id)
+            for ref, conversion in chunk:
+                key = conversion_key(conversion, default_conversion_action_id)
+                if retry_queue is not None and retry_queue.is_waiting(key):
+                    retry_queue.deferred += 1
+                    continue
+                if key in seen_keys:
+                    if ledger is not None:
+                        ledger.skipped += 1
+                        ledger.stats.repeats += 1
+                    continue
+                seen_keys.add(key)
+                batch.append((ref, conversion))
+        return batch
+
+    def collect(batch, batch_failures):
+        nonlocal successful
+        with span('upload.report'):
+            successful += _report_batch(batch, batch_failures, logger)
+        failures.extend(batch_failures)
+        # The retry queue is written first: a crash before the ledger update
+        # leaves a row that is retried, never one that is lost
+        outcome = None
+        if retry_queue is not None:
+            with span('retry_queue.record'):
+                outcome = retry_queue.record_batch(batch, batch_failures, default_conversion_action_id)
+        if ledger is not None:
+            with span('ledger.record'):
+                ledger.record_batch(batch, batch_failures, default_conversion_action_id)
+                if outcome is not None:
+                    ledger.set_status(outcome.duplicate_keys, STATUS_ACKNOWLEDGED)
+                    ledger.set_status(outcome.dead_keys, STATUS_DEAD_LETTER)
+        if outcome is not None and batch_failures:
+            _log(f"Failures: {outcome}", logger)
+
+    if max_in_flight == 1:
+        batch = next_batch()
+        while batch:
+            collect(batch, _upload_batch_in_slot(
+                session, customer_id, batch, default_conversion_action_id, max_in_flight_per_customer
+            ))
+            batch = next_batch()
+    else:
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            batch = next_batch()
+            while batch or in_flight:
+                # Keep the pipeline full, then collect the oldest request
+                while batch and len(in_flight) < max_in_flight:
+                    future = executor.submit(
+                        _upload_batch_in_slot, session, customer_id, batch, default_conversion_action_id,
+                        max_in_flight_per_customer
+                    )
+                    in_flight.append((batch, future))
+                    batch = next_batch()
+
+                done_batch, future = in_flight.popleft()
+                # Time the pipeline spends stalled on Google Ads
+                with span('upload.wait_in_flight'):
+                    batch_failures = future.result()
+                collect(done_batch, batch_failures)
+
+    failed = len({failure["ref"] for failure in failures})
+    return successful, failed, failures
+
+
+def _retry_summary(retry_queue):
+    """One summary line for the retry queue"""
+    line = f"Retry queue: {len(retry_queue)} waiting, {retry_queue.deferred} held back until due"
+    next_due_at = retry_queue.next_due_at()
+    if next_due_at is not None:
+        line += f", next at {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(next_due_at))} UTC"
+    return line
+
+
+def upload_click_conversion(client, customer_id, conversion_action_id, gclid, conversion_date_time, conversion_value=None, logger=None):
+    """
+    Upload a single click conversion to Google Ads
+
+    Thin wrapper around upload_click_conversions_batch() for one row.
+
+    Args:
+        client: GoogleAdsClient instance
+        customer_id: Google Ads customer ID
+        conversion_action_id: ID of the conversion action
+        gclid: Google Click Identifier
+        conversion_date_time: Conversion timestamp (YYYY-MM-DD HH:MM:SS+TZ)
+        conversion_value: Optional conversion value (for revenue tracking)
+        logger: Optional logger instance
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    conversion = {
+        "gclid": gclid,
+        "conversion_action_id": conversion_action_id,
+        "conversion_date_time": conversion_date_time,
+        "conversion_value": conversion_value
+    }
+    with span('upload.click_conversion'):
+        successful, _, _ = upload_click_conversions_batch(
+            client, customer_id, [(gclid, conversion)], logger=logger
+        )
+    return successful == 1
+
+
+def _valid_csv_rows(rows, normalizer, rejected, logger=None, chunk_size=MAX_CONVERSIONS_PER_REQUEST):
+    """
+    Yield the CSV rows that can be uploaded, with normalized timestamps
+
+    Rows are checked a chunk at a time. Rows without a GCLID, with a
+    conversion_date_time that is not a date, or with a non-numeric
+    conversion_value are logged and appended to ``rejected`` instead of
+    being sent to Google Ads, where each would fail the same way.
+
+    Args:
+        rows: Iterable of (row_num, row dict) pairs
+        normalizer: TimestampNormalizer for conversion_date_time
+        rejected: List extended with a {'ref', 'gclid', 'errors'} dict per bad row
+        logger: Optional logger instance
+        chunk_size: Rows normalized per chunk
+    """
+    rows = iter(rows)
+    metrics = get_metrics()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        timestamps, errors = normalizer.normalize_many([row.get('conversion_date_time') for _, row in chunk])
+        rejected_before = len(rejected)
+        for index, (row_num, row) in enumerate(chunk):
+            problems = []
+            if not (row.get('gclid') or '').strip():
+                problems.append({"code": "validation.MISSING_GCLID", "message": "Missing gclid"})
+            if index in errors:
+                problems.append({"code": "validation.INVALID_DATE_TIME", "message": errors[index]})
+            value = row.get('conversion_value')
+            if value:
+                try:
+                    float(value)
+                except ValueError:
+                    problems.append({
+                        "code": "validation.INVALID_CONVERSION_VALUE",
+                        "message": f"conversion_value is not a number: {value!r}"
+                    })
+
+            if problems:
+                rejected.append({"ref": row_num, "gclid": row.get('gclid'), "errors": problems})
+                details = "; ".join(f"{error['code']}: {error['message']}" for error in problems)
+                _log(
+                    f"✗ Rejected row {row_num}: {details}", logger, "error",
+                    event='conversion_rejected', ref=row_num, gclid=row.get('gclid'),
+                    error_codes=[error['code'] for error in problems]
+                )
+                continue
+
+            row['conversion_date_time'] = timestamps[index]
+            yield row_num, row
+
+        metrics.inc('rows', len(rejected) - rejected_before, outcome='rejected')
+
+
+def _open_state(config):
+    """Open the upload ledger and retry queue (in config.state_dir if set)"""
+    return (
+        UploadLedger(state_path(config.state_dir, 'upload_ledger.sqlite3')),
+        RetryQueue(state_path(config.state_dir, 'retry_queue'), max_attempts=config.retry_max_attempts)
+    )
+
+
+def upload_conversions_from_csv(csv_file_path, logger=None, config=None, client=None):
+    """
+    Bulk upload conversions from a CSV file
+
+    Rows are uploaded in batches; failures are reported by CSV line number.
+    Timestamps are normalized to the Google Ads format (values without an
+    offset are in config.timezone) and invalid rows are rejected before
+    upload. Rows already acknowledged by Google Ads (per the upload ledger)
+    are skipped. Failed rows are scheduled in the retry queue: running the
+    same file again resends only the rows whose retry is due, and never
+    dead-lettered ones.
+
+    Parquet / Arrow files (needs pyarrow) are read through a memory map,
+    upload columns only, and report failures by row number.
+
+    CSV Format:
+    gclid,conversion_action_id,conversion_date_time,conversion_value
+    ABC123XYZ,987654321,2025-12-19 10:30:00-08:00,0
+    DEF456UVW,987654322,12/19/2025 2:00 PM,4500
+
+    Args:
+        csv_file_path: Path to the CSV file (or a .parquet / .arrow file with
+                       the same columns)
+        logger: Optional logger instance
+        config: UploadConfig (default: load_config())
+        client: GoogleAdsClient (default: the shared client for config)
+
+    Returns:
+        Tuple of (successful_count, failed_count); failed includes rejected rows
+    """
+    _log(f"Uploading conversions from CSV: {csv_file_path}", logger)
+    
+    config = config or load_config()
+    with span('google_ads.session'):
+        session = session_for(client) if client is not None else get_session(config)
+    ledger, retry_queue = _open_state(config)
+    normalizer = TimestampNormalizer(config.timezone)
+    rejected = []
+
+    with ExitStack() as stack:
+        if columnar_format_for(csv_file_path):
+            columns = [name for name in OUTPUT_FIELDNAMES if name in read_schema(csv_file_path)]
+            numbered = enumerate(iter_rows(csv_file_path, columns), start=1)
+        else:
+            reader = csv.DictReader(stack.enter_context(open(csv_file_path, 'r')))
+            # Line 1 is the header, so data rows start at line 2
+            numbered = enumerate(reader, start=2)
+        rows = _valid_csv_rows(numbered, normalizer, rejected, logger)
+
+        successful, failed, _ = upload_click_conversions_batch(
+            session,
+            config.customer_id,
+            rows,
+            default_conversion_action_id=config.conversion_action_id,
+            logger=logger,
+            max_in_flight=config.max_in_flight,
+            ledger=ledger,
+            max_in_flight_per_customer=config.max_in_flight_per_customer,
+            retry_queue=retry_queue
+        )
+
+    summary = [
+        "",
+        "=== Upload Summary ===",
+        f"Total rows: {successful + failed + len(rejected)}",
+        f"Successful: {successful}",
+        f"Failed: {failed}",
+        f"Rejected (invalid rows): {len(rejected)}",
+        f"Skipped (already uploaded): {ledger.skipped}",
+        f"Dedup: {ledger.stats}",
+        _retry_summary(retry_queue),
+        f"Quota waits: {get_rate_limiter().stats}"
+    ]
+    retry_queue.close()
+    ledger.close()
+    _log("\n".join(summary), logger)
+    
+    return successful, failed + len(rejected)
+
+
+def upload_conversions_from_callrail(since_minutes=None, logger=None, config=None, client=None):
+    """
+    Fetch conversions from CallRail and upload to Google Ads
+
+    Retries that are due and conversions queued by the webhook receiver are
+    uploaded first; queue events are removed once their outcome is in the
+    ledger.
+    
+    Args:
+        since_minutes: Fetch conversions from last N minutes (None = incremental
+                       sync from the saved watermark minus the overlap window)
+        logger: Optional logger instance
+        config: UploadConfig (default: load_config())
+        client: GoogleAdsClient (default: the shared client for config, loaded only
+                if there is something to upload)
+    
+    Returns:
+        Tuple of (successful_count, failed_count)
+    """
+    from automation.utils.callrail_client import get_client
+    from automation.utils.callrail_fetcher import FetchStats, iter_new_conversions
+    from automation.utils.qualification_rules import load_rules
+
+    config = config or load_config()
+    state_dir = config.state_dir
+
+    # Determine time window
+    _log("=== Starting Conversion Upload ===", logger)
+    if since_minutes is None:
+        start_date = get_sync_start(default_minutes=360, state_dir=state_dir)
+        _log(f"Fetching conversions since {start_date:%Y-%m-%d %H:%M:%S} UTC...", logger)
+    else:
+        start_date = None
+        _log(f"Fetching conversions from last {since_minutes} minutes...", logger)
+    
+    ledger, retry_queue = _open_state(config)
+    
+    # Rows that failed in earlier runs and are due are retried first, without
+    # re-fetching; the rest wait for their backoff to expire
+    retries = retry_queue.due()
+    if retries:
+        _log(f"Retrying {len(retries)} previously failed conversions", logger)
+    
+    # Conversions received by webhook since the last run
+    queue_path = state_path(state_dir, 'webhook_queue.sqlite3')
+    queue = WebhookQueue(queue_path) if queue_exists(queue_path) else None
+    queued = queue.peek() if queue is not None else []
+    if queued:
+        _log(f"Uploading {len(queued)} conversions received by webhook", logger)
+    
+    # Stream from CallRail: uploads start as soon as the first page arrives.
+    # Failures are reported by CallRail call ID.
+    stats = FetchStats()
+    conversions = iter_new_conversions(
+        since_minutes or 360, stats=stats, start_date=start_date,
+        client=get_client(account_id=config.callrail_account_id),
+        rules=load_rules(config.qualification_rules_path, config.customer_id),
+        leads=config.enhanced_conversions_for_leads, logger=logger
+    )
+    rows = chain(
+        retries,
+        ((conv['call_id'], conv) for _, conv in queued),
+        ((conv['call_id'], conv) for conv in conversions)
+    )
+    
+    first = next(rows, None)
+    if first is None:
+        _log("No conversions to upload", logger)
+        successful, failed = 0, 0
+    else:
+        with span('google_ads.session'):
+            session = session_for(client) if client is not None else get_session(config)
+        
+        successful, failed, _ = upload_click_conversions_batch(
+            session,
+            config.customer_id,
+            chain([first], rows),
+            default_conversion_action_id=config.conversion_action_id,
+            logger=logger,
+            max_in_flight=config.max_in_flight,
+            ledger=ledger,
+            max_in_flight_per_customer=config.max_in_flight_per_customer,
+            retry_queue=retry_queue
+        )
+        
+        summary = [
+            "",
+            "=== Upload Summary ===",
+            f"Total conversions: {successful + failed}",
+            f"Successful: {successful}",
+            f"Failed: {failed}",
+            f"Skipped (already uploaded): {ledger.skipped}",
+            f"Dedup: {ledger.stats}",
+            _retry_summary(retry_queue),
+            f"Quota waits: {get_rate_limiter().stats}",
+            f"CallRail: {stats}"
+        ]
+        _log("\n".join(summary), logger)
+    
+    # Failed rows are in the retry queue, so the watermark can move on
+    # to the newest call seen whenever the whole window was fetched
+    if stats.complete:
+        save_last_sync_time(state_dir)
+        if stats.max_start_time:
+            save_sync_watermark(stats.max_start_time, stats.max_call_id, state_dir)
+    
+    if queue is not None:
+        queue.delete(event_id for event_id, _ in queued)
+        queue.close()
+    
+    retry_queue.compact()
+    retry_queue.close()
+    ledger.compact()
+    ledger.close()
+    
+    return successful, failed
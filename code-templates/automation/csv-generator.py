@@ -2,15 +2,33 @@
 
 This script can:
 1. Read conversion data from an existing CRM export CSV file
-2. Generate sample data for testing purposes
+2. Stream very large (optionally gzip/zstd-compressed) CRM exports in
+   constant memory
+3. Read and write Parquet / Arrow files (needs pyarrow), reading only the
+   mapped columns
+4. Generate sample data for testing purposes
 """
 
 import csv
+import os
 import sys
+import time
+from contextlib import ExitStack
 from datetime import datetime
+from itertools import islice
 
+# Add parent directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-def generate_csv_from_crm_data(input_file, output_file, column_mapping=None):
+from automation.utils.columnar_io import ColumnarWriter, columnar_format_for, iter_row_chunks, read_schema
+from automation.utils.compressed_io import open_text
+from automation.utils.crm_rows import DEFAULT_COLUMN_MAPPING, OUTPUT_FIELDNAMES, make_row_converter
+
+# Rows converted and written per chunk in streaming mode
+STREAM_CHUNK_ROWS = 10000
+
+
+def generate_csv_from_crm_data(input_file, output_file, column_mapping=None, streaming=False):
     """
     Read conversion data from CRM export and format for Google Ads upload.
     
@@ -24,15 +42,16 @@ def generate_csv_from_crm_data(input_file, output_file, column_mapping=None):
                            'value_column': 'sale_amount',
                            'conversion_action_id': '987654321'
                        }
+        streaming: Convert row by row in constant memory (see
+                   stream_csv_from_crm_data); always used for compressed,
+                   Parquet and Arrow files
     """
+    if streaming or columnar_format_for(input_file) or columnar_format_for(output_file):
+        return stream_csv_from_crm_data(input_file, output_file, column_mapping)
+
     # Default column mapping if none provided
     if column_mapping is None:
-        column_mapping = {
-            'gclid_column': 'gclid',
-            'date_column': 'conversion_date',
-            'value_column': 'conversion_value',
-            'conversion_action_id': '987654321'  # Replace with your actual ID
-        }
+        column_mapping = DEFAULT_COLUMN_MAPPING
     
     rows = []
     skipped_count = 0
@@ -40,39 +59,27 @@ def generate_csv_from_crm_data(input_file, output_file, column_mapping=None):
     try:
         # Read input CSV file
         with open(input_file, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
+            reader = csv.reader(csvfile)
             
-            # Validate required columns exist
-            if column_mapping['gclid_column'] not in reader.fieldnames:
-                raise ValueError(f"Column '{column_mapping['gclid_column']}' not found in input file")
+            # Validates that the GCLID column exists
+            convert = make_row_converter(next(reader, []), column_mapping)
             
             # Process each row
-            for row_num, row in enumerate(reader, start=2):  # Start at 2 (after header)
-                gclid_value = row.get(column_mapping['gclid_column'], '').strip()
+            for row in reader:
+                output_row = convert(row)
                 
                 # Skip rows without GCLID
-                if not gclid_value:
+                if output_row is None:
                     skipped_count += 1
                     continue
                 
-                # Build output row
-                output_row = {
-                    "gclid": gclid_value,
-                    "conversion_action_id": str(column_mapping['conversion_action_id']),
-                    "conversion_date_time": row.get(column_mapping['date_column'], '').strip(),
-                    "conversion_value": row.get(column_mapping['value_column'], '0').strip()
-                }
-                
                 rows.append(output_row)
         
         # Write Google Ads format CSV
         if rows:
             with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(
-                    csvfile, 
-                    fieldnames=['gclid', 'conversion_action_id', 'conversion_date_time', 'conversion_value']
-                )
-                writer.writeheader()
+                writer = csv.writer(csvfile)
+                writer.writerow(OUTPUT_FIELDNAMES)
                 writer.writerows(rows)
             
             print(f"✓ Successfully processed {len(rows)} conversions")
@@ -93,6 +100,100 @@ def generate_csv_from_crm_data(input_file, output_file, column_mapping=None):
         sys.exit(1)
 
 
+def stream_csv_from_crm_data(input_file, output_file, column_mapping=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Convert a CRM export to Google Ads upload format in constant memory.
+
+    Rows are read, converted and written in chunks of ``chunk_rows``, and the
+    output is flushed after every chunk, so memory use does not grow with the
+    file and a crash leaves every completed chunk on disk. Files ending in
+    .gz or .zst are decompressed / compressed on the fly.
+
+    Parquet and Arrow inputs (.parquet, .arrow) are memory-mapped and only
+    the mapped GCLID, date and value columns are read. Parquet and Arrow
+    outputs get one row group / record batch per chunk.
+
+    Args:
+        input_file: CRM export (.csv, .csv.gz, .csv.zst, .parquet or .arrow)
+        output_file: Google Ads upload file (same formats)
+        column_mapping: Same as generate_csv_from_crm_data()
+        chunk_rows: Rows converted per write
+
+    Returns:
+        Dict with rows_written, rows_skipped, seconds, rows_per_second and
+        mb_per_second (input bytes on disk)
+    """
+    if column_mapping is None:
+        column_mapping = DEFAULT_COLUMN_MAPPING
+
+    started = time.perf_counter()
+    written_count = 0
+    skipped_count = 0
+
+    try:
+        with ExitStack() as stack:
+            # Plain row lists with column indexes: no dict per row.
+            # make_row_converter() validates that the GCLID column exists.
+            if columnar_format_for(input_file):
+                header = _columns_to_read(read_schema(input_file), column_mapping)
+                chunks = iter_row_chunks(input_file, header, chunk_rows)
+            else:
+                reader = csv.reader(stack.enter_context(open_text(input_file, 'r')))
+                header = next(reader, [])
+                chunks = iter(lambda: list(islice(reader, chunk_rows)), [])
+            convert = make_row_converter(header, column_mapping)
+
+            if columnar_format_for(output_file):
+                writer = stack.enter_context(ColumnarWriter(output_file, OUTPUT_FIELDNAMES, chunk_rows))
+                outfile = writer
+            else:
+                outfile = stack.enter_context(open_text(output_file, 'w'))
+                writer = csv.writer(outfile)
+                writer.writerow(OUTPUT_FIELDNAMES)
+
+            for chunk in chunks:
+                output_rows = [output_row for output_row in map(convert, chunk) if output_row]
+                writer.writerows(output_rows)
+                outfile.flush()
+
+                written_count += len(output_rows)
+                skipped_count += len(chunk) - len(output_rows)
+
+    except FileNotFoundError:
+        print(f"✗ Error: Input file '{input_file}' not found")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
+
+    seconds = max(time.perf_counter() - started, 1e-9)
+    input_mb = os.path.getsize(input_file) / (1024 * 1024)
+    stats = {
+        'rows_written': written_count,
+        'rows_skipped': skipped_count,
+        'seconds': seconds,
+        'rows_per_second': (written_count + skipped_count) / seconds,
+        'mb_per_second': input_mb / seconds
+    }
+
+    print(f"✓ Streamed {written_count} conversions to: {output_file}")
+    if skipped_count > 0:
+        print(f"⚠ Skipped {skipped_count} rows without GCLID")
+    print(f"  Throughput: {stats['rows_per_second']:,.0f} rows/s, {stats['mb_per_second']:.1f} MB/s "
+          f"({seconds:.2f}s)")
+
+    return stats
+
+
+def _columns_to_read(schema_names, column_mapping):
+    """Columns of a Parquet/Arrow input that the conversion uses"""
+    if column_mapping is None:
+        wanted = OUTPUT_FIELDNAMES
+    else:
+        wanted = [column_mapping['gclid_column'], column_mapping['date_column'], column_mapping['value_column']]
+    return [name for name in dict.fromkeys(wanted) if name in schema_names]
+
+
 def generate_sample_csv(output_path):
     """
     Generate a sample conversion CSV with fake data for testing.
@@ -135,3 +236,18 @@ if __name__ == "__main__":
     #     output_file="../../data-templates/google-ads-upload.csv",
     #     column_mapping=column_mapping
     # )
+    
+    # Example 3: Stream a multi-GB compressed CRM dump in constant memory
+    # generate_csv_from_crm_data(
+    #     input_file="../../data-templates/crm-export.csv.gz",
+    #     output_file="../../data-templates/google-ads-upload.csv.gz",
+    #     column_mapping=column_mapping,
+    #     streaming=True
+    # )
+
+    # Example 4: Years of CRM history as Parquet in, Parquet out (pip install pyarrow)
+    # generate_csv_from_crm_data(
+    #     input_file="../../data-templates/crm-history.parquet",
+    #     output_file="../../data-templates/google-ads-upload.parquet",
+    #     column_mapping=column_mapping
+    # )
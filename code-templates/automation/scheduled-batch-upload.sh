@@ -5,4 +5,5 @@ set -euo pipefail
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Use relative path to Python script (one level up, then into api-integrations)
-python3 "${SCRIPT_DIR}/../api-integrations/google-ads-api/upload-conversions.py"
+# Extra arguments are passed through, e.g. --daemon for the resident worker
+exec python3 "${SCRIPT_DIR}/../api-integrations/google-ads-api/upload-conversions.py" "$@"
@@ -0,0 +1,138 @@
+"""
+Bloom Filter: Memory-mapped bitmap answering "definitely not seen" in constant time
+
+The upload ledger keeps this filter in front of its SQLite table of
+conversion keys: a key the filter has never seen is new for certain, so
+the ledger only queries SQLite for keys that may be duplicates (repeat
+callers, overlapping fetch windows, retries). At the default 0.1% false
+positive rate a key costs about 14 bits.
+
+The bitmap lives in a file mapped with mmap, so it persists between runs
+without being loaded, and processes sharing a ledger share its pages.
+
+File layout: 32-byte header (magic, number of bits, number of hashes,
+items added), then the bitmap. Bits are chosen by double hashing two
+64-bit halves of a BLAKE2b digest of the key.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+_MAGIC = b'CTBLOOM1'
+_HEADER = struct.Struct('<8sQQQ')
+
+
+def bloom_size(capacity, error_rate):
+    """
+    Return (num_bits, num_hashes) for ``capacity`` items at ``error_rate``
+    """
+    capacity = max(1, capacity)
+    num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    num_bits = (num_bits + 7) // 8 * 8
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    """
+    Bloom filter over str keys, optionally backed by a memory-mapped file
+
+    A filter that cannot be opened with the requested size (new file,
+    different capacity, unreadable header) starts empty and ``created`` is
+    True, so the owner knows to re-add its keys.
+
+    Not thread-safe; concurrent writers to one file can lose a bit, which
+    only turns a later "maybe seen" into "not seen".
+
+    Args:
+        path: Bitmap file (None = anonymous memory, not persisted)
+        capacity: Items the filter is sized for
+        error_rate: False positive rate at ``capacity`` items
+    """
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001):
+        self.path = path
+        self.capacity = capacity
+        self.num_bits, self.num_hashes = bloom_size(capacity, error_rate)
+        size = _HEADER.size + self.num_bits // 8
+        self.created = True
+        self._fd = None
+
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if len(header) == _HEADER.size and os.fstat(self._fd).st_size == size:
+                magic, num_bits, num_hashes, _ = _HEADER.unpack(header)
+                self.created = (magic, num_bits, num_hashes) != (_MAGIC, self.num_bits, self.num_hashes)
+            if self.created:
+                # Sparse file of zero bits
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+
+        if self.created:
+            self._map[:_HEADER.size] = _HEADER.pack(_MAGIC, self.num_bits, self.num_hashes, 0)
+        self.count = _HEADER.unpack(self._map[:_HEADER.size])[3]
+
+    def _positions(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=16).digest(), 'little')
+        h1 = digest & 0xFFFFFFFFFFFFFFFF
+        h2 = (digest >> 64) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        bitmap = self._map
+        offset = _HEADER.size
+        for position in self._positions(key):
+            if not bitmap[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """
+        Add a key
+
+        Returns:
+            True if the key was not in the filter before
+        """
+        bitmap = self._map
+        offset = _HEADER.size
+        added = False
+        for position in self._positions(key):
+            index = offset + (position >> 3)
+            mask = 1 << (position & 7)
+            byte = bitmap[index]
+            if not byte & mask:
+                bitmap[index] = byte | mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def update(self, keys):
+        """Add many keys"""
+        for key in keys:
+            self.add(key)
+
+    @property
+    def saturated(self):
+        """True once more items were added than the filter was sized for"""
+        return self.count > self.capacity
+
+    def flush(self):
+        """Write the item count to the header and the bitmap to disk"""
+        self._map[:_HEADER.size] = _HEADER.pack(_MAGIC, self.num_bits, self.num_hashes, self.count)
+        if self._fd is not None:
+            self._map.flush()
+
+    def close(self):
+        self.flush()
+        self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
@@ -0,0 +1,251 @@
+"""
+CallRail Client: Pooled HTTP session shared by every CallRail script
+
+Keeps TLS connections alive between requests, backs off when CallRail
+signals rate limiting, and can prefetch several pages at once once
+total_pages is known. Every request first takes a token from the account's
+shared hourly budget (see rate_limiter), so concurrent jobs cannot exceed it.
+
+Accounts reached with the same API key (an agency key covering several
+clinics) share one connection pool and throttle: get_client() returns a
+per-account view of the pooled client (see CallRailClient.for_account).
+"""
+
+import copy
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from automation.utils.rate_limiter import RateLimitExceeded, callrail_demands, get_rate_limiter
+from automation.utils.settings import env_int, env_str
+
+BASE_URL = 'https://api.callrail.com/v3'
+
+# Connection pool size and number of pages fetched concurrently
+# (CALLRAIL_POOL_SIZE, CALLRAIL_PREFETCH_PAGES)
+DEFAULT_POOL_SIZE = 8
+DEFAULT_PREFETCH_PAGES = 4
+
+REQUEST_TIMEOUT_SECONDS = 30
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 60
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class _Throttle:
+    """Pre-request delay, shared by every account on one API key"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+
+class CallRailClient:
+    """
+    Thread-safe CallRail API client on a pooled requests.Session
+
+    Args:
+        api_key: CallRail API key
+        account_id: CallRail account ID
+        pool_size: Maximum keep-alive connections to api.callrail.com
+                   (default: CALLRAIL_POOL_SIZE or 8)
+    """
+
+    def __init__(self, api_key, account_id, pool_size=None):
+        if not api_key or not account_id:
+            raise ValueError("Missing CallRail API credentials. Set CALLRAIL_API_KEY and CALLRAIL_ACCOUNT_ID in .env file")
+
+        self.account_id = account_id
+        if pool_size is None:
+            pool_size = env_int('CALLRAIL_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.pool_size = max(1, pool_size)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Token token={api_key}',
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+
+        # Delay applied before every request while CallRail reports we are
+        # close to (or over) the rate limit; decays back to zero on success
+        self._throttle = _Throttle()
+
+    def for_account(self, account_id):
+        """
+        Return a client for another account on the same API key
+
+        The new client shares this client's session (connection pool) and
+        throttle; only the account in request URLs and the hourly budget
+        it draws from differ. Closing either closes the shared session.
+        """
+        if not account_id:
+            raise ValueError("Missing CallRail account ID")
+        client = copy.copy(self)
+        client.account_id = account_id
+        return client
+
+    def account_url(self, path):
+        """Build the URL of an account-scoped endpoint, e.g. 'calls.json'"""
+        return f'{BASE_URL}/a/{self.account_id}/{path}'
+
+    def _adjust_throttle(self, response):
+        """Adapt the pre-request delay to CallRail's rate-limit headers"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+
+        throttle = self._throttle
+        with throttle.lock:
+            if remaining is not None and remaining.isdigit() and int(remaining) < self.pool_size:
+                # Spread the remaining budget over the reset window
+                window = float(reset) if reset and reset.replace('.', '', 1).isdigit() else 1.0
+                throttle.seconds = min(window / (int(remaining) + 1), MAX_BACKOFF_SECONDS)
+            else:
+                throttle.seconds /= 2
+                if throttle.seconds < 0.01:
+                    throttle.seconds = 0.0
+
+    def _backoff_seconds(self, response, attempt):
+        """Seconds to wait before retrying: Retry-After if given, else exponential with jitter"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        return min(2 ** attempt + random.uniform(0, 1), MAX_BACKOFF_SECONDS)
+
+    def get(self, url, params=None):
+        """
+        GET a CallRail URL, retrying on rate limits and transient errors
+
+        Returns:
+            requests.Response (already checked with raise_for_status)
+
+        Raises:
+            requests.exceptions.RequestException when retries are exhausted
+            or the hourly budget does not free up in time
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                get_rate_limiter().acquire(callrail_demands(self.account_id))
+            except RateLimitExceeded as e:
+                raise requests.exceptions.RetryError(str(e))
+
+            if self._throttle.seconds:
+                time.sleep(self._throttle.seconds)
+
+            try:
+                response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(self._backoff_seconds(None, attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                delay = self._backoff_seconds(response, attempt)
+                if response.status_code == 429:
+                    with self._throttle.lock:
+                        self._throttle.seconds = max(self._throttle.seconds, delay / self.pool_size)
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            self._adjust_throttle(response)
+            return response
+
+    def iter_pages(self, path, params=None, per_page=250, prefetch=None, on_page=None):
+        """
+        Yield the JSON body of every page of an offset-paginated endpoint
+
+        The first page is fetched alone to learn total_pages; after that up
+        to ``prefetch`` pages are requested concurrently and yielded in order.
+        Responses using relative pagination (next_page links) are followed
+        one page at a time.
+
+        Args:
+            path: Account-scoped endpoint, e.g. 'calls.json'
+            params: Query parameters (page / per_page are managed here)
+            per_page: Records per page (max 250)
+            prefetch: Pages to fetch concurrently (1 = sequential; default:
+                      CALLRAIL_PREFETCH_PAGES or 4)
+            on_page: Optional callback(response, latency_seconds) per page
+        """
+        url = self.account_url(path)
+        params = dict(params or {}, per_page=min(per_page, 250))
+
+        def fetch(page_url, page_params):
+            started = time.perf_counter()
+            response = self.get(page_url, page_params)
+            return response, time.perf_counter() - started
+
+        def consume(result):
+            # Runs in the caller's thread, in page order
+            response, latency = result
+            if on_page:
+                on_page(response, latency)
+            return response.json()
+
+        data = consume(fetch(url, dict(params, page=1)))
+        yield data
+
+        if data.get('next_page'):
+            # Relative pagination: each page links to the next
+            while data.get('next_page'):
+                data = consume(fetch(data['next_page'], None))
+                yield data
+            return
+
+        total_pages = data.get('total_pages', 1)
+        if total_pages <= 1 or not data.get('page'):
+            return
+
+        if prefetch is None:
+            prefetch = env_int('CALLRAIL_PREFETCH_PAGES', DEFAULT_PREFETCH_PAGES)
+        prefetch = max(1, min(prefetch, self.pool_size))
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            next_page = 2
+            while next_page <= total_pages or in_flight:
+                # Keep up to ``prefetch`` pages requested ahead of the consumer
+                while next_page <= total_pages and len(in_flight) < prefetch:
+                    in_flight.append(executor.submit(fetch, url, dict(params, page=next_page)))
+                    next_page += 1
+                yield consume(in_flight.popleft().result())
+
+    def close(self):
+        self.session.close()
+
+
+def get_client(api_key=None, account_id=None):
+    """
+    Return the shared CallRailClient for an account, creating it on first use
+
+    Defaults to CALLRAIL_API_KEY / CALLRAIL_ACCOUNT_ID from the environment.
+    Accounts on an API key that already has a client share its connection
+    pool.
+    """
+    api_key = api_key or env_str('CALLRAIL_API_KEY')
+    account_id = account_id or env_str('CALLRAIL_ACCOUNT_ID')
+
+    with _clients_lock:
+        client = _clients.get((api_key, account_id))
+        if client is None:
+            pooled = next((other for (key, _), other in _clients.items() if key == api_key), None)
+            if pooled is not None and account_id:
+                client = pooled.for_account(account_id)
+            else:
+                client = CallRailClient(api_key, account_id)
+            _clients[(api_key, account_id)] = client
+        return client
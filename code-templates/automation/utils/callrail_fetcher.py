@@ -0,0 +1,306 @@
+"""
+CallRail Fetcher: Stream qualified call conversions page by page
+"""
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from automation.utils.callrail_client import get_client
+from automation.utils.enhanced_conversions import get_phone_hasher
+from automation.utils.profiling import span
+from automation.utils.qualification_rules import load_rules
+from automation.utils.timestamps import TimestampNormalizer
+
+# CallRail allows up to 250 records per page
+DEFAULT_PER_PAGE = 250
+
+CALL_FIELDS = (
+    'id,start_time,duration,tracking_phone_number,customer_phone_number,qualifying,value,tags,gclid,'
+    'answered,first_call,voicemail'
+)
+
+# CallRail timestamps without an offset are UTC
+_normalizer = TimestampNormalizer()
+
+_logger = logging.getLogger('conversion_upload.callrail')
+
+
+class FetchStats:
+    """
+    Counters for one CallRail fetch
+
+    Attributes:
+        pages: Pages requested
+        calls: Calls returned by CallRail
+        conversions: Calls yielded as conversions (qualified, with GCLID or,
+                     for enhanced conversions for leads, a hashed phone number)
+        leads: Conversions among them matched by phone number (no GCLID)
+        unqualified: Counter of calls dropped by the qualification rules,
+                     by reason
+        bytes: Response body bytes received
+        latency_seconds: Total time spent waiting on CallRail
+        max_latency_seconds: Slowest single page
+        complete: False if the fetch stopped early on an error
+        max_start_time: Latest call start_time seen (aware datetime), the
+                        next sync watermark
+        max_call_id: ID of the call at max_start_time
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.calls = 0
+        self.conversions = 0
+        self.leads = 0
+        self.unqualified = Counter()
+        self.bytes = 0
+        self.latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+        self.complete = True
+        self.max_start_time = None
+        self.max_call_id = None
+
+    def record_page(self, num_bytes, latency):
+        self.pages += 1
+        self.bytes += num_bytes
+        self.latency_seconds += latency
+        self.max_latency_seconds = max(self.max_latency_seconds, latency)
+
+    def record_call(self, call):
+        """Advance the high-watermark (start_time, id) to include a call"""
+        start_time = parse_timestamp(call['start_time'])
+        if self.max_start_time is None or (start_time, str(call['id'])) > (self.max_start_time, str(self.max_call_id)):
+            self.max_start_time = start_time
+            self.max_call_id = call['id']
+
+    def as_dict(self):
+        stats = dict(vars(self))
+        stats['unqualified'] = dict(self.unqualified)
+        return stats
+
+    def __str__(self):
+        unqualified = sum(self.unqualified.values())
+        return (
+            f"{self.pages} pages, {self.calls} calls, {self.conversions} conversions, "
+            + (f"{self.leads} by phone number, " if self.leads else "")
+            + (f"{unqualified} unqualified, " if unqualified else "")
+            + f"{self.bytes / 1024:.1f} KB, {self.latency_seconds:.2f}s waiting"
+        )
+
+
+def parse_timestamp(callrail_timestamp):
+    """
+    Parse a CallRail ISO timestamp into an aware datetime
+
+    Naive timestamps are treated as UTC.
+    """
+    # Handle both with and without timezone
+    if callrail_timestamp.endswith('Z'):
+        callrail_timestamp = callrail_timestamp.replace('Z', '+00:00')
+
+    dt = datetime.fromisoformat(callrail_timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def format_timestamp(callrail_timestamp):
+    """
+    Convert CallRail timestamp to Google Ads format
+
+    Args:
+        callrail_timestamp: ISO format timestamp from CallRail
+
+    Returns:
+        Formatted timestamp: YYYY-MM-DD HH:MM:SS+HH:MM
+
+    Raises:
+        InvalidTimestamp (a ValueError) if the timestamp cannot be parsed
+    """
+    return _normalizer.normalize(callrail_timestamp)
+
+
+def is_qualified_call(call):
+    """
+    Apply the API's qualifying=true filter to a call that did not come
+    through it (e.g. a webhook payload)
+
+    Uses the 'qualifying' field when present, otherwise CallRail's
+    lead_status (anything but 'not_a_lead'). Calls with neither are kept.
+    """
+    if 'qualifying' in call:
+        qualifying = call['qualifying']
+        if isinstance(qualifying, str):
+            return qualifying.strip().lower() in ('true', 'yes', '1')
+        return bool(qualifying)
+    return call.get('lead_status') != 'not_a_lead'
+
+
+def call_to_conversion(call, conversion_action_id=None, conversion_value=None, leads=False):
+    """
+    Convert a CallRail call record into a conversion dict
+
+    A call without a GCLID becomes a conversion only with ``leads``: its
+    gclid is None and the caller's number has to be hashed (see
+    enhanced_conversions.PhoneHasher.attach) before upload.
+
+    Args:
+        call: CallRail call record
+        conversion_action_id: Conversion action the qualification rules
+                              routed the call to (default: the upload's
+                              default action)
+        conversion_value: Value from the qualification rules (default: the
+                          call's value)
+        leads: Keep calls without a GCLID that have a caller number
+               (enhanced conversions for leads)
+
+    Returns:
+        Conversion dict, or None if the call has no GCLID (nor, with
+        ``leads``, a caller number)
+    """
+    # Only include calls with GCLID tracking, or a number to match on
+    if not call.get('gclid') and not (leads and call.get('customer_phone_number')):
+        return None
+
+    conversion = {
+        'gclid': call.get('gclid'),
+        'conversion_date_time': format_timestamp(call['start_time']),
+        'conversion_value': call.get('value', 0) if conversion_value is None else conversion_value,
+        'call_id': call['id'],
+        'duration': call.get('duration', 0),
+        'phone_number': call.get('customer_phone_number', '')
+    }
+    if conversion_action_id:
+        conversion['conversion_action_id'] = conversion_action_id
+    return conversion
+
+
+def iter_call_pages(since_minutes=360, per_page=DEFAULT_PER_PAGE, stats=None,
+                    prefetch=None, client=None, start_date=None):
+    """
+    Yield pages of qualified calls from CallRail, one list per page
+
+    Follows CallRail's offset pagination (page / total_pages), prefetching
+    up to ``prefetch`` pages concurrently, or the next_page link when the
+    response uses relative pagination. Calls are requested oldest first.
+
+    Args:
+        since_minutes: How many minutes back to fetch (default 6 hours)
+        per_page: Records per page (max 250)
+        stats: Optional FetchStats to update
+        prefetch: Pages fetched concurrently once total_pages is known
+                  (default: CALLRAIL_PREFETCH_PAGES or 4)
+        client: CallRailClient to use (default: shared client from .env)
+        start_date: Aware datetime to fetch from; overrides since_minutes
+
+    Raises:
+        requests.exceptions.RequestException on HTTP errors
+    """
+    if client is None:
+        client = get_client()
+
+    if stats is None:
+        stats = FetchStats()
+
+    # Calculate time range (UTC), reading the clock once
+    end_date = datetime.utcnow()
+    if start_date is None:
+        start_date = end_date - timedelta(minutes=since_minutes)
+    elif start_date.tzinfo is not None:
+        start_date = start_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    params = {
+        'start_date': start_date.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end_date': end_date.strftime('%Y-%m-%dT%H:%M:%S'),
+        'fields': CALL_FIELDS,
+        'qualifying': 'true',  # Only fetch qualified leads
+        'sort': 'start_time',
+        'order': 'asc'
+    }
+
+    def on_page(response, latency):
+        stats.record_page(len(response.content), latency)
+
+    pages = client.iter_pages('calls.json', params, per_page, prefetch, on_page)
+    while True:
+        # Only the wait for the next page is timed, not the consumer's work
+        with span('callrail.fetch_page'):
+            page = next(pages, None)
+        if page is None:
+            break
+        calls = page.get('calls', [])
+        stats.calls += len(calls)
+        for call in calls:
+            stats.record_call(call)
+        yield calls
+
+
+def iter_new_conversions(since_minutes=360, per_page=DEFAULT_PER_PAGE, stats=None,
+                         prefetch=None, client=None, start_date=None, rules=None,
+                         leads=False, logger=None):
+    """
+    Stream qualified call conversions from CallRail as pages arrive
+
+    Conversions are yielded while later pages are still being fetched, so a
+    consumer can start batching uploads before the fetch finishes. Each page
+    is filtered and routed by the compiled qualification rules: rejected
+    calls are counted in ``stats.unqualified`` and calls with a mapped tag
+    carry that tag's conversion_action_id. With ``leads``, qualified calls
+    without a GCLID are kept and their caller numbers hashed a page at a time.
+
+    Args:
+        since_minutes: How many minutes back to fetch (default 6 hours)
+        per_page: Records per page (max 250)
+        stats: Optional FetchStats, updated as pages arrive. ``stats.complete``
+               is False if the fetch stopped early on an error.
+        prefetch: Pages fetched concurrently once total_pages is known
+                  (default: CALLRAIL_PREFETCH_PAGES or 4)
+        client: CallRailClient to use (default: shared client from .env)
+        start_date: Aware datetime to fetch from; overrides since_minutes
+        rules: CallRules to apply (default: load_rules(), i.e.
+               QUALIFICATION_RULES_PATH if set)
+        leads: Upload calls without a GCLID by hashed phone number
+               (enhanced conversions for leads)
+        logger: Logger for fetch errors and the summary (default: the
+                conversion_upload.callrail logger)
+
+    Yields:
+        Conversion dicts with GCLID data or a hashed_phone_number
+    """
+    if stats is None:
+        stats = FetchStats()
+    logger = logger or _logger
+    if rules is None:
+        rules = load_rules()
+    router = None
+    if rules is not None:
+        router = rules.router()
+        router.rejected = stats.unqualified
+    hasher = get_phone_hasher() if leads else None
+
+    try:
+        for calls in iter_call_pages(since_minutes, per_page, stats, prefetch, client, start_date):
+            with span('callrail.parse_calls'):
+                if router is not None:
+                    routed = router.route_batch(calls)
+                else:
+                    routed = ((call, None, None) for call in calls)
+                conversions = [
+                    conversion for conversion in (
+                        call_to_conversion(call, action_id, value, leads)
+                        for call, action_id, value in routed
+                    ) if conversion
+                ]
+            if hasher is not None:
+                with span('callrail.hash_phone_numbers'):
+                    conversions = hasher.attach(conversions)
+                stats.leads += sum(1 for conversion in conversions if not conversion['gclid'])
+            stats.conversions += len(conversions)
+            yield from conversions
+    except requests.exceptions.RequestException as e:
+        stats.complete = False
+        logger.error(f"✗ Error fetching from CallRail API: {e}")
+
+    logger.info(f"✓ Fetched {stats.conversions} conversions from CallRail ({stats})")
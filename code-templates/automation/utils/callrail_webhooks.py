@@ -0,0 +1,428 @@
+"""
+CallRail Webhooks: Async receiver that queues call conversions as they happen
+
+A small HTTP/1.1 server on asyncio streams (no extra dependencies):
+
+1. Checks the CallRail signature: the base64 HMAC-SHA1 of the raw request
+   body, keyed with the account's webhook signing token, in the
+   'Signature' header.
+2. Applies the same filtering as polling: qualified calls with a GCLID
+   (callrail_fetcher.is_qualified_call / call_to_conversion), passed and
+   routed by the compiled qualification rules. With
+   ENHANCED_CONVERSIONS_FOR_LEADS, calls without a GCLID are kept with
+   their caller number hashed.
+3. Appends the conversion to the WebhookQueue and answers 200 once it is
+   committed. No upload work happens on the request path.
+
+Writes are group-committed: requests arriving while a commit is running
+are written together in the next transaction, so one fsync covers many
+webhooks and throughput stays in the thousands of requests per second.
+
+CallRail retries webhooks that do not get a 2xx answer, so anything that
+could not be queued is answered with 5xx; malformed requests and payloads
+get 400. Polling stays in place as a
+reconciliation backstop, and the upload ledger drops calls received both
+ways.
+
+One receiver serves one CallRail account. With a tenant manifest, run one
+receiver per tenant (config=tenant.config): it queues into the tenant's
+state_dir, which is where that tenant's uploads read from.
+"""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from automation.utils.callrail_fetcher import call_to_conversion, is_qualified_call
+from automation.utils.enhanced_conversions import get_phone_hasher, leads_enabled
+from automation.utils.qualification_rules import load_rules
+from automation.utils.settings import env_str
+from automation.utils.state_manager import state_path
+from automation.utils.webhook_queue import WebhookQueue
+
+WEBHOOK_PATH = '/callrail/webhook'
+
+# Largest request body accepted (CallRail call payloads are a few KB)
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT_SECONDS = 75
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+    503: 'Service Unavailable'
+}
+
+
+def sign_body(body, secret):
+    """Return the CallRail signature (base64 HMAC-SHA1) of a request body"""
+    digest = hmac.new(secret.encode(), body, hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body, signature, secret):
+    """Constant-time check of a CallRail 'Signature' header"""
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_body(body, secret), signature.strip())
+
+
+def parse_webhook_body(body, content_type=''):
+    """
+    Decode a CallRail webhook body (JSON or form-encoded) into a call dict
+
+    Raises:
+        ValueError if the body cannot be decoded
+    """
+    if 'application/x-www-form-urlencoded' in content_type:
+        return dict(parse_qsl(body.decode('utf-8')))
+
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook body is not a JSON object")
+    return payload
+
+
+def webhook_to_conversion(payload, router=None, leads=False):
+    """
+    Convert a webhook payload to a conversion dict
+
+    Webhooks identify the call as 'resource_id' (or 'id').
+
+    Args:
+        payload: Parsed webhook body
+        router: CallRouter to apply (default: a fresh router for
+                load_rules(); pass a long-lived one to count repeated
+                hangups across webhooks)
+        leads: Keep calls without a GCLID by hashed caller number
+               (enhanced conversions for leads)
+
+    Returns:
+        Conversion dict, or None if the call is not a qualified GCLID call
+        (or, with ``leads``, has no usable caller number)
+    """
+    call = dict(payload)
+    call.setdefault('id', payload.get('resource_id'))
+    if not call.get('id') or not call.get('start_time'):
+        return None
+    if not is_qualified_call(call):
+        return None
+    if router is None:
+        rules = load_rules()
+        if rules is not None:
+            router = rules.router()
+    if router is None:
+        conversion = call_to_conversion(call, leads=leads)
+    else:
+        routed = router.route_batch([call])
+        if not routed:
+            return None
+        _, action_id, value = routed[0]
+        conversion = call_to_conversion(call, action_id, value, leads)
+    if conversion is None or conversion['gclid']:
+        return conversion
+    conversion['hashed_phone_number'] = get_phone_hasher().hash(conversion['phone_number'])
+    return conversion if conversion['hashed_phone_number'] else None
+
+
+class _RefuseRequest(Exception):
+    """Answer the current request with ``status`` and close the connection"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class WebhookStats:
+    """Request counters for the receiver"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queued = 0
+        self.ignored = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class _GroupCommitter:
+    """
+    Batch queue appends from concurrent requests into single transactions
+
+    The first request starts a commit in the writer thread; requests arriving
+    meanwhile wait for the next one, which takes all of them at once.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhook-queue')
+        self.waiting = []
+        self.task = None
+
+    async def append(self, conversion):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append((conversion, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._commit_loop())
+        await future
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while self.waiting:
+            batch, self.waiting = self.waiting, []
+            try:
+                await loop.run_in_executor(
+                    self.executor, self.queue.append_many, [conversion for conversion, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def close(self):
+        if self.task is not None:
+            await self.task
+        self.executor.shutdown(wait=True)
+
+
+class WebhookServer:
+    """
+    Async CallRail webhook receiver
+
+    Args:
+        queue: WebhookQueue to append to (default: the webhook queue for config)
+        secret: Webhook signing token (default: CALLRAIL_WEBHOOK_SECRET);
+                required unless allow_unsigned is True
+        host: Interface to listen on
+        port: TCP port (0 = any free port)
+        path: URL path CallRail posts to
+        allow_unsigned: Accept requests without a valid signature (local testing)
+        logger: Optional logger instance
+        leads: Queue calls without a GCLID by hashed caller number
+               (default: config.enhanced_conversions_for_leads, or
+               ENHANCED_CONVERSIONS_FOR_LEADS without a config)
+        config: UploadConfig of the account the webhooks come from: its
+                qualification rules, leads setting and the webhook queue in
+                its state_dir are used (default: QUALIFICATION_RULES_PATH,
+                ENHANCED_CONVERSIONS_FOR_LEADS and WEBHOOK_QUEUE_PATH)
+    """
+
+    def __init__(self, queue=None, secret=None, host='0.0.0.0', port=8080, path=WEBHOOK_PATH,
+                 allow_unsigned=False, logger=None, leads=None, config=None):
+        self.secret = secret or env_str('CALLRAIL_WEBHOOK_SECRET')
+        if not self.secret and not allow_unsigned:
+            raise ValueError("Missing CallRail webhook signing token. Set CALLRAIL_WEBHOOK_SECRET in .env file")
+
+        if queue is None:
+            queue = WebhookQueue(state_path(config.state_dir, 'webhook_queue.sqlite3') if config else None)
+        self.queue = queue
+        self.host = host
+        self.port = port
+        self.path = path
+        self.allow_unsigned = allow_unsigned
+        self.logger = logger
+        self.stats = WebhookStats()
+        self.server = None
+        self._committer = _GroupCommitter(self.queue)
+        self._connections = {}
+        rules = load_rules(config.qualification_rules_path, config.customer_id) if config else load_rules()
+        self._router = rules.router() if rules is not None else None
+        if leads is None:
+            leads = config.enhanced_conversions_for_leads if config else leads_enabled()
+        self.leads = leads
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    @property
+    def address(self):
+        """(host, port) the server is listening on"""
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def handle_request(self, method, target, headers, body):
+        """
+        Handle one parsed request
+
+        Returns:
+            Tuple of (status, response_body dict)
+        """
+        path = urlsplit(target).path
+
+        if method == 'GET' and path in ('/healthz', '/health'):
+            return 200, {'status': 'ok', **self.stats.as_dict()}
+        if path != self.path:
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+
+        self.stats.requests += 1
+
+        if self.secret and not verify_signature(body, headers.get('signature'), self.secret):
+            if not self.allow_unsigned:
+                self.stats.rejected += 1
+                return 401, {'error': 'invalid signature'}
+
+        try:
+            payload = parse_webhook_body(body, headers.get('content-type', ''))
+        except ValueError:
+            self.stats.rejected += 1
+            return 400, {'error': 'invalid body'}
+
+        try:
+            conversion = webhook_to_conversion(payload, self._router, self.leads)
+        except (TypeError, ValueError):
+            # Fields of the wrong type or format (e.g. an unreadable start_time)
+            self.stats.rejected += 1
+            return 400, {'error': 'invalid call'}
+        if conversion is None:
+            self.stats.ignored += 1
+            return 200, {'status': 'ignored'}
+
+        try:
+            await self._committer.append(conversion)
+        except Exception as e:
+            self.stats.errors += 1
+            self._log(f"✗ Could not queue webhook for call {conversion['call_id']}: {e}", "error")
+            return 503, {'error': 'queue unavailable'}
+
+        self.stats.queued += 1
+        return 200, {'status': 'queued'}
+
+    async def _read_request(self, reader):
+        """
+        Read one request from a keep-alive connection
+
+        Returns:
+            (method, target, version, headers, body), or None at end of stream
+
+        Raises:
+            _RefuseRequest for chunked or oversized bodies
+        """
+        request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT_SECONDS)
+        if not request_line.strip():
+            return None
+
+        method, target, version = request_line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ValueError("Too many headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise _RefuseRequest(411)
+
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise _RefuseRequest(413)
+
+        body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, body
+
+    @staticmethod
+    async def _respond(writer, status, response, keep_alive):
+        payload = json.dumps(response).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+
+                status, response = await self.handle_request(method, target, headers, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except _RefuseRequest as e:
+            await self._respond(writer, e.status, {'error': _REASONS[e.status]}, keep_alive=False)
+        except ValueError:
+            # Malformed request line or headers
+            with contextlib.suppress(ConnectionError):
+                await self._respond(writer, 400, {'error': _REASONS[400]}, keep_alive=False)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def start(self):
+        """Start listening (returns once the socket is bound)"""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+        host, port = self.address
+        self._log(f"✓ Listening for CallRail webhooks on http://{host}:{port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting connections, close idle ones and finish queued commits"""
+        if self.server is not None:
+            self.server.close()
+            handlers = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            if handlers:
+                # Closed connections end their handlers at the next read
+                await asyncio.wait(handlers, timeout=5)
+            await self.server.wait_closed()
+        await self._committer.close()
+        self._log(f"Webhook receiver stopped ({self.stats.as_dict()})")
+
+    async def serve(self, stop_event=None):
+        """Run until stop_event is set, or SIGTERM / SIGINT when none is given"""
+        await self.start()
+
+        if stop_event is None:
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, stop_event.set)
+
+        await stop_event.wait()
+        await self.stop()
+
+
+def run_webhook_server(**kwargs):
+    """
+    Run a WebhookServer until SIGTERM / SIGINT (see WebhookServer for arguments)
+
+    Returns:
+        WebhookStats
+    """
+    server = WebhookServer(**kwargs)
+    try:
+        asyncio.run(server.serve())
+    finally:
+        server.queue.close()
+    return server.stats
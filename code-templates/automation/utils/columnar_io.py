@@ -0,0 +1,182 @@
+"""
+Columnar I/O: Parquet and Arrow IPC readers and writers for conversion datasets
+
+The format is chosen from the file extension (.parquet, .arrow / .feather).
+Files are memory-mapped and only the requested columns are read, so
+reprocessing years of conversions touches the three or four columns it
+needs instead of parsing every CSV field. read_table() returns a
+pyarrow.Table for zero-copy column access (analytics, compute kernels);
+iter_row_chunks() and iter_rows() feed the converter and the uploader.
+
+Needs the optional ``pyarrow`` package, imported on first use so that
+importing this module (and the uploader) stays cheap.
+"""
+
+# Rows per record batch read, and per row group / record batch written
+BATCH_ROWS = 65536
+
+
+def columnar_format_for(path):
+    """Return 'parquet', 'arrow' or None based on the file extension"""
+    path = str(path).lower()
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        return 'parquet'
+    if path.endswith('.arrow') or path.endswith('.feather') or path.endswith('.ipc'):
+        return 'arrow'
+    return None
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Reading/writing Parquet or Arrow files requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _format(path):
+    fmt = columnar_format_for(path)
+    if fmt is None:
+        raise ValueError(f"Not a Parquet or Arrow file: {path}")
+    return fmt
+
+
+def read_schema(path):
+    """Return the column names of a Parquet or Arrow file without reading data"""
+    pyarrow = _pyarrow()
+    if _format(path) == 'parquet':
+        return list(pyarrow.parquet.read_schema(str(path), memory_map=True).names)
+    with pyarrow.memory_map(str(path)) as source:
+        return list(pyarrow.ipc.open_file(source).schema.names)
+
+
+def read_table(path, columns=None):
+    """
+    Read columns of a Parquet or Arrow file into a pyarrow.Table
+
+    Arrow IPC files are memory-mapped and returned without copying;
+    Parquet column chunks are read from a memory map and decoded.
+
+    Args:
+        path: .parquet or .arrow file
+        columns: Column names to read (default: all)
+    """
+    pyarrow = _pyarrow()
+    if _format(path) == 'parquet':
+        return pyarrow.parquet.read_table(str(path), columns=columns, memory_map=True)
+    source = pyarrow.memory_map(str(path))
+    table = pyarrow.ipc.open_file(source).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def iter_record_batches(path, columns=None, batch_rows=BATCH_ROWS):
+    """
+    Yield pyarrow.RecordBatch objects of the requested columns
+
+    Parquet is read one batch at a time, so memory use does not grow with
+    the file. Arrow IPC batches are zero-copy slices of the memory map.
+    """
+    pyarrow = _pyarrow()
+    if _format(path) == 'parquet':
+        parquet_file = pyarrow.parquet.ParquetFile(str(path), memory_map=True)
+        yield from parquet_file.iter_batches(batch_size=batch_rows, columns=columns)
+        return
+
+    with pyarrow.memory_map(str(path)) as source:
+        reader = pyarrow.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            if columns is not None:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(offset, batch_rows)
+
+
+def iter_row_chunks(path, columns, batch_rows=BATCH_ROWS):
+    """
+    Yield lists of rows (lists in ``columns`` order), one list per batch
+
+    The columnar counterpart of reading a csv.reader in chunks: rows come
+    out as plain lists of strings, so make_row_converter() works on them
+    unchanged. Non-string columns are cast to strings in Arrow, and nulls
+    become ''.
+    """
+    pyarrow = _pyarrow()
+    for batch in iter_record_batches(path, columns, batch_rows):
+        values = []
+        for column in batch.columns:
+            if not pyarrow.types.is_string(column.type):
+                column = pyarrow.compute.cast(column, pyarrow.string())
+            values.append(column.fill_null('').to_pylist())
+        yield [list(row) for row in zip(*values)]
+
+
+def iter_rows(path, columns=None, batch_rows=BATCH_ROWS):
+    """Yield one dict per row (like csv.DictReader), reading only ``columns``"""
+    for batch in iter_record_batches(path, columns, batch_rows):
+        yield from batch.to_pylist()
+
+
+class ColumnarWriter:
+    """
+    Write rows of strings to a Parquet (zstd) or Arrow IPC file
+
+    Rows are buffered and written as one row group / record batch per
+    ``batch_rows`` rows, so the writer can stand in for csv.writer in a
+    chunked conversion loop.
+
+    Args:
+        path: .parquet or .arrow output file
+        fieldnames: Column names, in row order
+        batch_rows: Rows per row group / record batch
+    """
+
+    def __init__(self, path, fieldnames, batch_rows=BATCH_ROWS):
+        pyarrow = _pyarrow()
+        self.format = _format(path)
+        self._pyarrow = pyarrow
+        self.fieldnames = list(fieldnames)
+        self.batch_rows = batch_rows
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in self.fieldnames])
+        self._pending = []
+
+        if self.format == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(str(path), self.schema, compression='zstd')
+        else:
+            self._sink = pyarrow.OSFile(str(path), 'wb')
+            self._writer = pyarrow.ipc.new_file(self._sink, self.schema)
+
+    def writerows(self, rows):
+        """Buffer rows (sequences in fieldnames order); full batches are written"""
+        self._pending.extend(rows)
+        while len(self._pending) >= self.batch_rows:
+            self._write(self._pending[:self.batch_rows])
+            del self._pending[:self.batch_rows]
+
+    def _write(self, rows):
+        columns = zip(*rows) if rows else [() for _ in self.fieldnames]
+        pyarrow = self._pyarrow
+        arrays = [pyarrow.array(column, type=pyarrow.string()) for column in columns]
+        self._writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def flush(self):
+        """Write buffered rows as a (short) batch"""
+        if self._pending:
+            self._write(self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if self.format == 'arrow':
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
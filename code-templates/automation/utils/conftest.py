@@ -0,0 +1,9 @@
+"""Make the automation package importable for tests of modules that use absolute imports."""
+
+import os
+import sys
+
+_CODE_TEMPLATES = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+if _CODE_TEMPLATES not in sys.path:
+    sys.path.append(_CODE_TEMPLATES)
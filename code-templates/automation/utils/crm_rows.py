@@ -0,0 +1,63 @@
+"""
+CRM Rows: Map CRM export rows to Google Ads upload rows
+
+Shared by csv-generator.py streaming mode and the sharded consolidation
+driver. Rows are plain csv.reader lists and converted rows are tuples in
+OUTPUT_FIELDNAMES order, so no dict is built per row.
+"""
+
+OUTPUT_FIELDNAMES = ['gclid', 'conversion_action_id', 'conversion_date_time', 'conversion_value']
+
+DEFAULT_COLUMN_MAPPING = {
+    'gclid_column': 'gclid',
+    'date_column': 'conversion_date',
+    'value_column': 'conversion_value',
+    'conversion_action_id': '987654321'  # Replace with your actual ID
+}
+
+
+def make_row_converter(header, column_mapping=None):
+    """
+    Build a function converting one csv.reader row to an upload row tuple
+
+    Args:
+        header: Header row of the input file
+        column_mapping: CRM column mapping (see csv-generator.py). Rows
+                        without a GCLID convert to None. If None, the input
+                        is already in upload format and the OUTPUT_FIELDNAMES
+                        columns are copied as-is (like csv-formatter.py).
+
+    Raises:
+        ValueError if the GCLID column is missing from the header
+    """
+    def index_of(column):
+        return header.index(column) if column in header else None
+
+    def cell(row, index, default=''):
+        value = row[index].strip() if index is not None and index < len(row) else ''
+        return value or default
+
+    if column_mapping is None:
+        indexes = [index_of(column) for column in OUTPUT_FIELDNAMES]
+
+        def convert(row):
+            return tuple(row[i] if i is not None and i < len(row) else '' for i in indexes)
+
+        return convert
+
+    gclid_index = index_of(column_mapping['gclid_column'])
+    if gclid_index is None:
+        raise ValueError(f"Column '{column_mapping['gclid_column']}' not found in input file")
+
+    date_index = index_of(column_mapping['date_column'])
+    value_index = index_of(column_mapping['value_column'])
+    conversion_action_id = str(column_mapping['conversion_action_id'])
+
+    def convert(row):
+        gclid_value = cell(row, gclid_index)
+        # Skip rows without GCLID
+        if not gclid_value:
+            return None
+        return gclid_value, conversion_action_id, cell(row, date_index), cell(row, value_index, '0')
+
+    return convert
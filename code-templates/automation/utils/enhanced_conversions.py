@@ -0,0 +1,180 @@
+"""
+Enhanced Conversions: Hashed caller phone numbers for calls without a GCLID
+
+Enhanced conversions for leads match a conversion to an ad click by the
+caller's phone number instead of a GCLID: the number is normalized to E.164
+("+15551234567") and sent as the lowercase hex SHA-256 in
+ClickConversion.user_identifiers. The conversion action must have enhanced
+conversions for leads turned on in Google Ads.
+
+Off by default: a hashed caller number can still be PHI, so it needs a BAA
+or legal sign-off first (docs/06-hipaa-compliance.md).
+
+Numbers are hashed a batch (one CallRail page) at a time. Each distinct
+number in the batch is hashed once, and hashes are kept in an LRU cache
+keyed by the normalized number, so repeat callers across pages, polls and
+backfill windows are not hashed again.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from automation.utils.settings import env_int, env_str
+
+# Country code for numbers without one (PHONE_DEFAULT_COUNTRY_CODE;
+# CallRail tracking numbers are NANP)
+DEFAULT_COUNTRY_CODE = '1'
+
+# Normalized numbers whose hash is kept (PHONE_HASH_CACHE_SIZE)
+DEFAULT_HASH_CACHE_SIZE = 100000
+
+_NON_DIGITS = re.compile(r'\D')
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def leads_enabled(value=None):
+    """
+    True if a setting (default: ENHANCED_CONVERSIONS_FOR_LEADS) turns leads
+    uploads on: qualified calls without a GCLID are uploaded by hashed
+    phone number
+    """
+    value = env_str('ENHANCED_CONVERSIONS_FOR_LEADS', 'false') if value is None else value
+    return str(value).strip().lower() in ('true', 'yes', '1', 'on')
+
+
+def normalize_e164(number, default_country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalize a phone number to E.164
+
+    Numbers starting with '+' or '00' keep their country code; others get
+    ``default_country_code`` (a national trunk '0' is dropped first).
+
+    Returns:
+        "+<country code><number>", or None if the number cannot be valid
+    """
+    number = str(number or '').strip()
+    digits = _NON_DIGITS.sub('', number)
+    if number.startswith('+'):
+        pass
+    elif number.startswith('00'):
+        digits = digits[2:]
+    elif default_country_code == '1':
+        # NANP: ten digits, optionally already prefixed with the 1
+        if len(digits) == 10:
+            digits = '1' + digits
+        elif not (len(digits) == 11 and digits.startswith('1')):
+            return None
+    else:
+        digits = default_country_code + digits.lstrip('0')
+
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return '+' + digits
+
+
+class PhoneHasher:
+    """
+    SHA-256 of E.164 phone numbers with an LRU cache
+
+    Thread-safe: hashing happens outside the lock.
+
+    Args:
+        cache_size: Normalized numbers whose hash is kept (default:
+                    PHONE_HASH_CACHE_SIZE or 100000)
+        default_country_code: Country code for numbers without one
+                              (default: PHONE_DEFAULT_COUNTRY_CODE or 1)
+
+    Attributes:
+        hits: Numbers answered from the cache
+        misses: Numbers hashed
+        invalid: Numbers that could not be normalized
+    """
+
+    def __init__(self, cache_size=None, default_country_code=None):
+        if cache_size is None:
+            cache_size = env_int('PHONE_HASH_CACHE_SIZE', DEFAULT_HASH_CACHE_SIZE)
+        self.cache_size = max(0, cache_size)
+        self.default_country_code = default_country_code or env_str('PHONE_DEFAULT_COUNTRY_CODE', DEFAULT_COUNTRY_CODE)
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hash_batch(self, numbers):
+        """
+        Hash a batch of phone numbers
+
+        Returns:
+            List of lowercase hex digests, in order; None for numbers that
+            cannot be normalized
+        """
+        normalized = [normalize_e164(number, self.default_country_code) for number in numbers]
+        distinct = set(normalized)
+        distinct.discard(None)
+
+        hashes = {}
+        with self._lock:
+            cache = self._cache
+            for number in distinct:
+                digest = cache.get(number)
+                if digest is not None:
+                    cache.move_to_end(number)
+                    hashes[number] = digest
+
+        missing = distinct.difference(hashes)
+        computed = {number: hashlib.sha256(number.encode()).hexdigest() for number in missing}
+        hashes.update(computed)
+
+        with self._lock:
+            cache = self._cache
+            cache.update(computed)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            self.misses += len(computed)
+            self.hits += len(distinct) - len(computed)
+            self.invalid += normalized.count(None)
+
+        return [hashes.get(number) if number else None for number in normalized]
+
+    def hash(self, number):
+        """Hash one phone number (None if it cannot be normalized)"""
+        return self.hash_batch([number])[0]
+
+    def attach(self, conversions):
+        """
+        Add 'hashed_phone_number' to the conversions that have no GCLID
+
+        Args:
+            conversions: Conversion dicts (see callrail_fetcher.call_to_conversion)
+
+        Returns:
+            The conversions that can be uploaded, in order: those with a
+            GCLID and those whose phone number could be hashed
+        """
+        leads = [conversion for conversion in conversions if not conversion.get('gclid')]
+        if not leads:
+            return conversions
+        digests = self.hash_batch([conversion.get('phone_number') for conversion in leads])
+        for conversion, digest in zip(leads, digests):
+            conversion['hashed_phone_number'] = digest
+        return [
+            conversion for conversion in conversions
+            if conversion.get('gclid') or conversion['hashed_phone_number']
+        ]
+
+    def __str__(self):
+        return f"{self.misses} hashed, {self.hits} cached, {self.invalid} invalid numbers"
+
+
+def get_phone_hasher():
+    """Return the process-wide PhoneHasher"""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PhoneHasher()
+        return _hasher
@@ -1,67 +1,383 @@
 """
 Logging configuration for conversion uploads
+
+setup_logging() installs, once per process:
+
+- a file handler on logs/conversions.log that rolls over daily (or hourly)
+  and whenever the file reaches LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT
+  numbered backups,
+- a console handler,
+- optionally (LOG_ASYNC, on by default) a QueueHandler in front of both, so
+  the upload threads only enqueue records and a QueueListener thread does
+  the formatting and I/O,
+- a sampling filter for success messages (records logged with
+  extra={'success': True}): only LOG_SUCCESS_SAMPLE_RATE of them are kept.
+  Warnings and errors are never sampled.
+
+LOG_FORMAT=json writes one JSON object per line (timestamp, level, logger,
+message and any structured fields passed in ``extra``) instead of text.
+
+Calling setup_logging() again with the same settings returns the configured
+logger without reinstalling handlers.
+
+The module also holds the process-wide upload metrics (get_metrics()):
+counters and histograms rendered in Prometheus text format, for the
+daemon's /metrics endpoint or a node_exporter textfile after a cron run.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from automation.utils.settings import env_flag, env_float, env_int, env_str
+
+LOG_DIR = os.path.join(os.path.dirname(__file__), '../../../logs')
+LOG_FILE_NAME = 'conversions.log'
+
+# Defaults of the LOG_* environment settings
+DEFAULT_LOG_FORMAT = 'text'
+DEFAULT_LOG_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_LOG_ROTATE = 'daily'
+DEFAULT_LOG_BACKUP_COUNT = 14
+
+_TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# LogRecord attributes that are not structured fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_setup_lock = threading.Lock()
+_installed = {}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SuccessSampler(logging.Filter):
+    """
+    Keep one in every 1/rate success records (extra={'success': True})
+
+    Counter-based rather than random, so the kept share is exact and cheap.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.seen = 0
+        self.lock = threading.Lock()
 
+    def filter(self, record):
+        if not getattr(record, 'success', False) or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        with self.lock:
+            self.seen += 1
+            return self.seen % self.every == 1
 
-def setup_logging(log_level=logging.INFO):
+
+class RotatingLogFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Roll over when the file reaches max_bytes or a new day / hour starts
+
+    Backups are numbered (conversions.log.1 is the newest); at most
+    backup_count are kept.
+
+    Args:
+        filename: Log file path
+        max_bytes: Size limit (0 = no size-based rollover)
+        backup_count: Rotated files to keep (at least 1)
+        rotate: 'daily', 'hourly' or None for size-based rollover only
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=14, rotate='daily'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=max(1, backup_count), encoding='utf-8')
+        if rotate not in ('daily', 'hourly', None):
+            raise ValueError(f"Unknown log rotation: {rotate}")
+        # Not 'rotate': BaseRotatingHandler.rotate() is the file-renaming hook
+        self.interval = rotate
+        started = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+        self.rollover_at = self._next_boundary(started)
+
+    def _next_boundary(self, timestamp):
+        if self.interval is None:
+            return float('inf')
+        moment = datetime.fromtimestamp(timestamp)
+        if self.interval == 'hourly':
+            return (moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        return (moment.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+    def shouldRollover(self, record):
+        if record.created >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_boundary(time.time())
+
+
+def _stop_listener(listener):
+    try:
+        listener.stop()
+    except AttributeError:
+        # Already stopped
+        pass
+
+
+def setup_logging(log_level=logging.INFO, log_format=None, async_mode=None, success_sample_rate=None,
+                  max_bytes=None, rotate=None, backup_count=None, log_dir=None):
     """
     Configure logging to file and console
-    
+
+    Arguments left as None use the LOG_* environment settings, read on
+    each call.
+
     Args:
         log_level: Logging level (default: INFO)
-    
+        log_format: 'text' or 'json' (JSON lines)
+        async_mode: Format and write records on a QueueListener thread
+        success_sample_rate: Share of success records kept (0.0 - 1.0)
+        max_bytes: Roll the log file over at this size (0 = never)
+        rotate: 'daily', 'hourly' or 'none' (size-based rollover only)
+        backup_count: Rotated log files to keep
+        log_dir: Directory for conversions.log (default: logs/ at the repo root)
+
     Returns:
         Configured logger instance
     """
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.join(os.path.dirname(__file__), '../../../logs')
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # Log file with date
-    log_file = os.path.join(log_dir, f'conversions_{datetime.now().strftime("%Y%m%d")}.log')
-    
-    # Configure logging format
-    formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    settings = (
+        log_level,
+        log_format or env_str('LOG_FORMAT', DEFAULT_LOG_FORMAT),
+        env_flag('LOG_ASYNC', True) if async_mode is None else async_mode,
+        env_float('LOG_SUCCESS_SAMPLE_RATE', 1.0) if success_sample_rate is None else success_sample_rate,
+        env_int('LOG_MAX_BYTES', DEFAULT_LOG_MAX_BYTES) if max_bytes is None else max_bytes,
+        rotate or env_str('LOG_ROTATE', DEFAULT_LOG_ROTATE),
+        env_int('LOG_BACKUP_COUNT', DEFAULT_LOG_BACKUP_COUNT) if backup_count is None else backup_count,
+        os.path.abspath(log_dir or LOG_DIR)
     )
-    
-    # File handler
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(log_level)
-    file_handler.setFormatter(formatter)
-    
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(log_level)
-    console_handler.setFormatter(formatter)
-    
-    # Configure root logger
     logger = logging.getLogger('conversion_upload')
-    logger.setLevel(log_level)
-    
-    # Remove existing handlers to avoid duplicates
-    logger.handlers = []
-    
-    # Add handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    with _setup_lock:
+        if _installed.get('settings') == settings:
+            return logger
+
+        level, fmt, use_queue, sample_rate, size_limit, rotation, backups, directory = settings
+        if fmt not in ('text', 'json'):
+            raise ValueError(f"Unknown log format: {fmt}")
+
+        # Replace an earlier configuration (different settings)
+        _uninstall()
+        for handler in logger.handlers:
+            handler.close()
+        logger.handlers = []
+        logger.filters = []
+
+        os.makedirs(directory, exist_ok=True)
+        log_file = os.path.join(directory, LOG_FILE_NAME)
+
+        if fmt == 'json':
+            formatter = JsonLinesFormatter()
+        else:
+            formatter = logging.Formatter(_TEXT_FORMAT, datefmt=_DATE_FORMAT)
+
+        file_handler = RotatingLogFileHandler(
+            log_file, max_bytes=size_limit, backup_count=backups,
+            rotate=None if rotation == 'none' else rotation
+        )
+        console_handler = logging.StreamHandler()
+        handlers = [file_handler, console_handler]
+        for handler in handlers:
+            handler.setLevel(level)
+            handler.setFormatter(formatter)
+
+        logger.setLevel(level)
+        logger.propagate = False
+        # Sampling runs on the logging thread, before records are queued
+        logger.addFilter(SuccessSampler(sample_rate))
+
+        listener = None
+        if use_queue:
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(_stop_listener, listener)
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        else:
+            for handler in handlers:
+                logger.addHandler(handler)
+
+        _installed.update(settings=settings, listener=listener, handlers=handlers)
+
     logger.info(f"Logging initialized. Log file: {log_file}")
-    
     return logger
 
 
+def _uninstall():
+    if _installed.get('listener') is not None:
+        _stop_listener(_installed['listener'])
+    for handler in _installed.get('handlers', ()):
+        handler.close()
+    _installed.clear()
+
+
+def shutdown_logging():
+    """Flush queued records, stop the listener thread and close the log file"""
+    with _setup_lock:
+        _uninstall()
+        logger = logging.getLogger('conversion_upload')
+        for handler in logger.handlers:
+            handler.close()
+        logger.handlers = []
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds (Prometheus style)"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms with labels
+
+    Args:
+        prefix: Prepended to every metric name
+    """
+
+    # Upper bounds of latency histograms (seconds)
+    LATENCY_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, prefix='conversion_upload'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, bounds=LATENCY_BOUNDS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(bounds)
+            histogram.observe(value)
+
+    def value(self, name, **labels):
+        """Current value of a counter (0 if never incremented)"""
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = [f'{name}="{value}"' for name, value in (*labels, *extra)]
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render_prometheus(self):
+        """Return every metric in Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (histogram.bounds, list(histogram.counts), histogram.count, histogram.sum))
+                for key, histogram in self.histograms.items()
+            )
+
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {metric} {self.help.get(name, name)}", f"# TYPE {metric} counter"]
+            lines.append(f"{metric}{self._labels(labels)} {value}")
+
+        for (name, labels), (bounds, counts, count, total) in histograms:
+            metric = f"{self.prefix}_{name}"
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {metric} {self.help.get(name, name)}", f"# TYPE {metric} histogram"]
+            for bound, bucket_count in zip(bounds, counts):
+                lines.append(f"{metric}_bucket{self._labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{metric}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total}")
+            lines.append(f"{metric}_count{self._labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_textfile(self, path, extra=""):
+        """
+        Write the metrics to a file atomically (node_exporter textfile collector)
+
+        Args:
+            path: Destination, e.g. /var/lib/node_exporter/conversion_upload.prom
+            extra: Additional exposition text appended to the file
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render_prometheus() + extra)
+        os.replace(tmp_path, path)
+
+
+_metrics = MetricsRegistry()
+_metrics.describe('rows', 'Conversion rows by outcome (uploaded, failed, rejected before upload)')
+_metrics.describe('batches', 'Upload requests sent to Google Ads')
+_metrics.describe('adjustments', 'Conversion adjustment rows by outcome (uploaded, failed, rejected)')
+_metrics.describe('failures', 'Failed conversions by Google Ads error code')
+_metrics.describe('rpc_latency_seconds', 'Google Ads upload request latency')
+
+
+def get_metrics():
+    """Return the process-wide upload MetricsRegistry"""
+    return _metrics
+
+
 if __name__ == "__main__":
     # Test logging configuration
     logger = setup_logging()
-    
+
     logger.info("This is an info message")
     logger.warning("This is a warning message")
     logger.error("This is an error message")
-    
+    shutdown_logging()
+
     print("\nCheck the logs/ directory for output file")
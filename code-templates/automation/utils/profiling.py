@@ -0,0 +1,265 @@
+"""
+Profiling: Opt-in per-stage timing spans for the sync pipeline
+
+Stages of the pipeline are wrapped in span('name') blocks (CallRail page
+fetches, call -> conversion parsing, CSV reads, ledger lookups, request
+building, Google Ads RPCs, ...). While no profile is running, span() returns
+a shared no-op context manager, so the hooks cost one global lookup.
+
+Inside profile_run() every span records, per thread:
+
+- wall time (perf_counter) and self time (wall minus child spans),
+- CPU time of the thread (thread_time),
+- with allocations=True, net bytes allocated (tracemalloc; slows the run).
+
+At the end of the run profile_run() writes to its output directory:
+
+- timing-report.txt   per-stage table (calls, wall, self, CPU, allocations)
+- spans.collapsed     collapsed stacks ("a;b;c <microseconds>") of span self
+                      time, for flamegraph.pl, speedscope or inferno
+- profile.pstats      with mode='cprofile' (snakeviz, flameprof, gprof2dot)
+- pyinstrument.html   with mode='pyinstrument' (if pyinstrument is installed)
+
+Spans are per batch or per page rather than per row, so they do not skew
+the timings they measure.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PROFILE_MODES = ('spans', 'cprofile', 'pyinstrument')
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# The running Profiler, or None
+_active = None
+
+
+class SpanStats:
+    """Totals for one stage"""
+
+    __slots__ = ('calls', 'wall', 'self_wall', 'cpu', 'alloc_bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.self_wall = 0.0
+        self.cpu = 0.0
+        self.alloc_bytes = 0
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'path', 'started', 'cpu_started', 'mem_started', 'child_wall')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.path = f"{stack[-1].path};{self.name}" if stack else self.name
+        self.child_wall = 0.0
+        stack.append(self)
+        self.mem_started = self.profiler._traced_bytes()
+        self.cpu_started = time.thread_time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.started
+        cpu = time.thread_time() - self.cpu_started
+        alloc = self.profiler._traced_bytes() - self.mem_started
+
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_wall += wall
+        self.profiler._record(self.name, self.path, wall, wall - self.child_wall, cpu, alloc)
+        return False
+
+
+class Profiler:
+    """
+    Collects span timings for one run
+
+    Args:
+        allocations: Track net allocated bytes per span with tracemalloc
+    """
+
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.lock = threading.Lock()
+        self.stages = defaultdict(SpanStats)
+        self.collapsed = defaultdict(float)
+        self.started = None
+        self.wall = 0.0
+        self._local = threading.local()
+        self._tracemalloc = None
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _traced_bytes(self):
+        if self._tracemalloc is None:
+            return 0
+        return self._tracemalloc.get_traced_memory()[0]
+
+    def _record(self, name, path, wall, self_wall, cpu, alloc):
+        with self.lock:
+            stats = self.stages[name]
+            stats.calls += 1
+            stats.wall += wall
+            stats.self_wall += self_wall
+            stats.cpu += cpu
+            stats.alloc_bytes += alloc
+            self.collapsed[path] += self_wall
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def start(self):
+        if self.allocations:
+            import tracemalloc
+            tracemalloc.start()
+            self._tracemalloc = tracemalloc
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.wall = time.perf_counter() - self.started
+        if self._tracemalloc is not None:
+            self._tracemalloc.stop()
+            self._tracemalloc = None
+
+    def report(self):
+        """Return the per-stage timing table as text"""
+        lines = [
+            f"Run wall time: {self.wall:.3f}s",
+            "",
+            f"{'stage':<28} {'calls':>8} {'wall s':>9} {'self s':>9} {'cpu s':>9} {'% run':>6}"
+            + (f" {'alloc MB':>9}" if self.allocations else "")
+        ]
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1].wall, reverse=True)
+        for name, stats in stages:
+            share = 100 * stats.wall / self.wall if self.wall else 0.0
+            line = (
+                f"{name:<28} {stats.calls:>8} {stats.wall:>9.3f} {stats.self_wall:>9.3f} "
+                f"{stats.cpu:>9.3f} {share:>6.1f}"
+            )
+            if self.allocations:
+                line += f" {stats.alloc_bytes / 1e6:>9.2f}"
+            lines.append(line)
+        lines.append("")
+        lines.append("Stages run in worker threads overlap, so their totals can exceed the run time.")
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed(self, path):
+        """Write span self time as collapsed stacks (microseconds)"""
+        with self.lock:
+            collapsed = sorted(self.collapsed.items())
+        with open(path, 'w') as f:
+            for stack, seconds in collapsed:
+                micros = int(seconds * 1e6)
+                if micros > 0:
+                    f.write(f"{stack} {micros}\n")
+
+
+def span(name):
+    """
+    Time the enclosed block as pipeline stage ``name`` when a profile is running
+
+    Usage:
+        with span('callrail.fetch_page'):
+            ...
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(name)
+
+
+def profiling_active():
+    return _active is not None
+
+
+@contextmanager
+def profile_run(output_dir, mode='spans', allocations=False, logger=None):
+    """
+    Profile everything run inside the block and write the reports
+
+    Args:
+        output_dir: Directory for timing-report.txt, spans.collapsed and the
+                    optional cProfile / pyinstrument output
+        mode: 'spans', 'cprofile' (adds profile.pstats) or 'pyinstrument'
+              (adds pyinstrument.html; falls back to spans if not installed)
+        allocations: Track allocations per span with tracemalloc
+        logger: Optional logger for the summary (default: print)
+
+    Yields:
+        The Profiler
+    """
+    global _active
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    def log(message):
+        if logger:
+            logger.info(message)
+        else:
+            print(message)
+
+    sampler = None
+    if mode == 'cprofile':
+        import cProfile
+        sampler = cProfile.Profile()
+    elif mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler as PyinstrumentProfiler
+        except ImportError:
+            log("⚠ pyinstrument is not installed (pip install pyinstrument); recording spans only")
+        else:
+            sampler = PyinstrumentProfiler(async_mode='disabled')
+
+    profiler = Profiler(allocations=allocations)
+    _active = profiler
+    profiler.start()
+    if sampler is not None:
+        sampler.enable() if mode == 'cprofile' else sampler.start()
+    try:
+        with profiler.span('run'):
+            yield profiler
+    finally:
+        if sampler is not None:
+            sampler.disable() if mode == 'cprofile' else sampler.stop()
+        profiler.stop()
+        _active = None
+
+        report_path = os.path.join(output_dir, 'timing-report.txt')
+        with open(report_path, 'w') as f:
+            f.write(profiler.report())
+        profiler.write_collapsed(os.path.join(output_dir, 'spans.collapsed'))
+        if mode == 'cprofile':
+            sampler.dump_stats(os.path.join(output_dir, 'profile.pstats'))
+        elif sampler is not None:
+            with open(os.path.join(output_dir, 'pyinstrument.html'), 'w') as f:
+                f.write(sampler.output_html())
+
+        log(f"Profile written to {output_dir}\n{profiler.report()}")
@@ -0,0 +1,367 @@
+"""
+Qualification Rules: Compiled call filter and conversion-action router
+
+Rules are applied only when a rules file is configured
+(QUALIFICATION_RULES_PATH, or "qualification_rules" per tenant);
+configuration/callrail/qualification-rules.json is a template to copy and
+fill in. The file is compiled once into lookup structures:
+
+- known spam callers: a set of normalized phone numbers,
+- business hours: a sorted table of minute-of-week intervals (bisect),
+- conversion tags: a dict from normalized tag name to what the tag does
+  (route to a conversion action, exclude the call, or nothing); mappings
+  to another Google Ads customer than the one uploaded to are skipped,
+- caller-type filters: tag names that mark existing patients, vendors and
+  internal calls.
+
+A CallRouter evaluates calls in batches, in CallRail order (oldest first):
+
+1. Exclusions apply to every call: known spam callers, callers with too many
+   repeated hangups in the run, calls tagged Not_Qualified (or another
+   exclude_from_google_ads tag), and the caller-type tags.
+2. A call with a tag mapped to a Google Ads conversion action goes to that
+   action, with the tag's conversion value ("variable" = the call's value).
+   Manual tags override the automatic checks below.
+3. Other calls must pass automatic_qualification (minimum duration,
+   answered, voicemail, business hours, first-time caller) and go to the
+   default conversion action.
+
+A field the call does not carry (e.g. no 'first_call' in a webhook payload)
+does not disqualify it.
+"""
+
+import json
+import logging
+import re
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime
+
+from automation.utils.settings import env_str
+from automation.utils.timestamps import QUALIFICATION_RULES_FILE, get_timezone
+
+_logger = logging.getLogger('conversion_upload.qualification_rules')
+
+# Tag names (normalized) for caller_type_filters
+CALLER_TYPE_TAGS = {
+    'exclude_existing_patients': ('existing_patient', 'existing_patients'),
+    'exclude_vendors': ('vendor', 'vendors'),
+    'exclude_internal_calls': ('internal', 'internal_call'),
+}
+
+# Callers whose hangups are counted per run; the oldest are forgotten first
+MAX_TRACKED_CALLERS = 100000
+
+# Rejection reasons, as counted in CallRouter.rejected
+REASON_SPAM = 'spam_caller'
+REASON_HANGUPS = 'repeated_hangups'
+REASON_EXCLUDED_TAG = 'excluded_tag'
+REASON_CALLER_TYPE = 'caller_type'
+REASON_TOO_SHORT = 'too_short'
+REASON_NOT_ANSWERED = 'not_answered'
+REASON_VOICEMAIL = 'voicemail'
+REASON_AFTER_HOURS = 'outside_business_hours'
+REASON_REPEAT_CALLER = 'repeat_caller'
+
+_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+_NON_DIGITS = re.compile(r'\D')
+_ACTION_ID = re.compile(r'(?:customers/([\d-]+)/)?conversionActions/(\d+)$')
+
+_TAG_ROUTE = 'route'
+_TAG_EXCLUDE = 'exclude'
+
+
+def normalize_phone(number):
+    """Digits of a phone number, without the NANP country code"""
+    digits = _NON_DIGITS.sub('', str(number or ''))
+    if len(digits) == 11 and digits.startswith('1'):
+        return digits[1:]
+    return digits
+
+
+def _tag_key(tag):
+    if isinstance(tag, dict):
+        tag = tag.get('name', '')
+    return str(tag).strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', '1')
+    return bool(value)
+
+
+def _seconds(value):
+    """Call duration in seconds, or None if missing or not a number"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _customer_key(customer_id):
+    """Customer ID without dashes (None if empty)"""
+    return str(customer_id).replace('-', '') if customer_id else None
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class CallRules:
+    """
+    qualification-rules.json compiled for fast evaluation
+
+    Args:
+        rules: Parsed qualification-rules.json
+        customer_id: Google Ads customer the conversions are uploaded to;
+                     tag mappings to other customers are skipped with a
+                     warning (None = no check)
+
+    Attributes:
+        foreign_mappings: Names of the tags skipped for mapping to another
+                          customer
+
+    Raises:
+        ValueError if the rules are malformed (bad times, unknown timezone)
+    """
+
+    def __init__(self, rules, customer_id=None):
+        rules = rules.get('qualification_rules', rules)
+        self.name = rules.get('rule_name', 'qualification rules')
+
+        automatic = rules.get('automatic_qualification', {})
+        exclusions = rules.get('exclusion_rules', {})
+
+        # Duration: the larger of the qualification minimum and the
+        # too-short exclusion
+        duration_filters = exclusions.get('duration_filters', {})
+        self.min_duration = automatic.get('minimum_duration_seconds', 0) or 0
+        if duration_filters.get('exclude_if_below'):
+            self.min_duration = max(self.min_duration, duration_filters.get('too_short_threshold_seconds', 0) or 0)
+        self.hangup_seconds = duration_filters.get('too_short_threshold_seconds', 0) or 0
+
+        self.must_be_answered = bool(automatic.get('must_be_answered'))
+        self.exclude_voicemail = bool(automatic.get('exclude_voicemail'))
+        self.first_time_only = bool(automatic.get('first_time_caller_only'))
+
+        spam = exclusions.get('spam_detection', {})
+        spam_enabled = spam.get('enabled', True)
+        self.spam_numbers = frozenset(
+            normalize_phone(number) for number in spam.get('known_spam_callers', []) if spam_enabled
+        )
+        self.hangup_threshold = (spam.get('repeated_hangups_threshold') or 0) if spam_enabled else 0
+
+        caller_types = exclusions.get('caller_type_filters', {})
+        self.caller_type_tags = frozenset(
+            tag for setting, tags in CALLER_TYPE_TAGS.items() if caller_types.get(setting) for tag in tags
+        )
+
+        # Tag -> (kind, conversion_action_id, conversion_value); earlier tags win
+        customer_id = _customer_key(customer_id)
+        self.tags = {}
+        self.foreign_mappings = []
+        for tag in rules.get('conversion_tags', []):
+            key = _tag_key(tag.get('tag_name', ''))
+            if not key or key in self.tags:
+                continue
+            if tag.get('exclude_from_google_ads'):
+                self.tags[key] = (_TAG_EXCLUDE, None, None)
+                continue
+            match = _ACTION_ID.search(tag.get('google_ads_mapping') or '')
+            if not match or tag.get('internal_use_only'):
+                continue
+            mapped_customer = _customer_key(match.group(1))
+            if customer_id and mapped_customer and mapped_customer != customer_id:
+                self.foreign_mappings.append(tag.get('tag_name'))
+                _logger.warning(
+                    f"{self.name}: tag {tag.get('tag_name')!r} maps to customer {match.group(1)}, "
+                    f"not {customer_id}; calls with it get the automatic checks and the default action"
+                )
+                continue
+            self.tags[key] = (_TAG_ROUTE, match.group(2), tag.get('conversion_value', 'variable'))
+
+        self.business_hours_only = bool(automatic.get('business_hours_only'))
+        hours = rules.get('business_hours', {})
+        self.timezone = get_timezone(hours.get('timezone', 'UTC'))
+        self.open_starts, self.open_ends = self._hours_table(hours)
+
+    @staticmethod
+    def _hours_table(hours):
+        """Sorted, non-overlapping (start, end) minute-of-week intervals"""
+        intervals = []
+        for day_index, day in enumerate(_DAYS):
+            day_hours = hours.get(day)
+            if not isinstance(day_hours, dict):
+                continue  # "closed" or missing
+            start = day_index * 1440 + _minutes(day_hours['open'])
+            end = day_index * 1440 + _minutes(day_hours['close'])
+            if end <= start:
+                # Open past midnight
+                end += 1440
+            intervals.append((start, end))
+        intervals.sort()
+        return [start for start, _ in intervals], [end for _, end in intervals]
+
+    def is_open(self, start_time):
+        """True if an ISO start_time falls inside business hours"""
+        if isinstance(start_time, str):
+            if start_time.endswith('Z'):
+                start_time = start_time[:-1] + '+00:00'
+            start_time = datetime.fromisoformat(start_time)
+        local = start_time.astimezone(self.timezone)
+        minute = local.weekday() * 1440 + local.hour * 60 + local.minute
+        for candidate in (minute, minute + 7 * 1440):
+            # Sunday-night hours that run past midnight wrap into Monday
+            index = bisect_right(self.open_starts, candidate) - 1
+            if index >= 0 and candidate < self.open_ends[index]:
+                return True
+        return False
+
+    def router(self):
+        """A CallRouter with fresh per-run state (hangup counts)"""
+        return CallRouter(self)
+
+
+class CallRouter:
+    """
+    Evaluates calls against compiled CallRules
+
+    Keeps per-run state: hangups per caller, for repeated_hangups_threshold.
+
+    Attributes:
+        routed: Calls accepted
+        rejected: Counter of rejected calls by reason
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.routed = 0
+        self.rejected = Counter()
+        self._hangups = {}
+
+    def _count_hangup(self, number, call_id):
+        seen = self._hangups.get(number)
+        if seen is None:
+            if len(self._hangups) >= MAX_TRACKED_CALLERS:
+                del self._hangups[next(iter(self._hangups))]
+            seen = self._hangups[number] = set()
+        # Overlapping fetches see the same call more than once
+        seen.add(call_id)
+
+    def route(self, call):
+        """
+        Decide one call
+
+        Returns:
+            Tuple of (reason, conversion_action_id, conversion_value):
+            ``reason`` is None for a qualified call and a REASON_* string for
+            a rejected one; conversion_action_id None means the default action
+        """
+        rules = self.rules
+        number = call.get('customer_phone_number')
+        # Form-encoded webhooks can carry an empty or non-numeric duration:
+        # treated as missing
+        duration = _seconds(call.get('duration'))
+
+        if number:
+            if rules.spam_numbers and normalize_phone(number) in rules.spam_numbers:
+                return REASON_SPAM, None, None
+            if rules.hangup_threshold:
+                hangups = self._hangups.get(number)
+                if hangups is not None and len(hangups) >= rules.hangup_threshold and call.get('id') not in hangups:
+                    return REASON_HANGUPS, None, None
+                if (duration is not None and duration < rules.hangup_seconds) or (
+                        'answered' in call and not _truthy(call['answered'])):
+                    self._count_hangup(number, call.get('id'))
+
+        # Tags: an exclusion anywhere wins, otherwise the first routed tag
+        route = None
+        tags = call.get('tags')
+        if tags:
+            tag_rules = rules.tags
+            caller_type_tags = rules.caller_type_tags
+            for tag in tags:
+                key = _tag_key(tag)
+                if key in caller_type_tags:
+                    return REASON_CALLER_TYPE, None, None
+                found = tag_rules.get(key)
+                if found is None:
+                    continue
+                if found[0] == _TAG_EXCLUDE:
+                    return REASON_EXCLUDED_TAG, None, None
+                if route is None:
+                    route = found
+        if route is not None:
+            value = route[2]
+            if value == 'variable' or value is None:
+                value = call.get('value', 0)
+            return None, route[1], value
+
+        if duration is not None and duration < rules.min_duration:
+            return REASON_TOO_SHORT, None, None
+        if rules.must_be_answered and 'answered' in call and not _truthy(call['answered']):
+            return REASON_NOT_ANSWERED, None, None
+        if rules.exclude_voicemail and _truthy(call.get('voicemail')):
+            return REASON_VOICEMAIL, None, None
+        if rules.first_time_only and 'first_call' in call and not _truthy(call['first_call']):
+            return REASON_REPEAT_CALLER, None, None
+        if rules.business_hours_only and call.get('start_time') and not rules.is_open(call['start_time']):
+            return REASON_AFTER_HOURS, None, None
+        return None, None, call.get('value', 0)
+
+    def route_batch(self, calls):
+        """
+        Route a batch of calls
+
+        Returns:
+            List of (call, conversion_action_id, conversion_value) for the
+            qualified calls, in order; conversion_action_id None means the
+            default action. Rejections are counted in ``rejected``.
+        """
+        routed = []
+        append = routed.append
+        route = self.route
+        rejected = self.rejected
+        for call in calls:
+            reason, action_id, value = route(call)
+            if reason is None:
+                append((call, action_id, value))
+            else:
+                rejected[reason] += 1
+        self.routed += len(routed)
+        return routed
+
+
+_compiled = {}
+
+
+def load_rules(path=None, customer_id=None):
+    """
+    Compile a qualification-rules.json file (cached per path and customer)
+
+    Args:
+        path: Rules file (default: QUALIFICATION_RULES_PATH)
+        customer_id: Google Ads customer uploaded to (default:
+                     GOOGLE_ADS_CUSTOMER_ID); see CallRules
+
+    Returns:
+        CallRules, or None if no rules file is configured, rules are
+        disabled ("off") or the file does not exist
+    """
+    # Unset or "off": no rules (every GCLID call goes to the default conversion action)
+    path = path or env_str('QUALIFICATION_RULES_PATH')
+    if not path or path.lower() in ('off', 'none', 'false', '0'):
+        return None
+    customer_id = _customer_key(customer_id or env_str('GOOGLE_ADS_CUSTOMER_ID'))
+    key = (path, customer_id)
+    if key not in _compiled:
+        try:
+            with open(path) as f:
+                _compiled[key] = CallRules(json.load(f), customer_id)
+        except FileNotFoundError:
+            _compiled[key] = None
+    return _compiled[key]
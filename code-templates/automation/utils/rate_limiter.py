@@ -0,0 +1,341 @@
+"""
+Rate Limiter: Quota-aware token buckets shared by every upload process
+
+Each API quota is a token bucket stored in SQLite, so cron runs, the daemon
+and backfills on the same machine draw from the same budget:
+
+- google_ads:ops                 developer-token operations per day (one
+                                 token per conversion sent)
+- google_ads:customer:<id>       upload requests per minute per customer
+- callrail:<account_id>          CallRail API requests per hour
+
+A bucket for a limit L per window W holds at most L * BURST_FRACTION tokens
+and refills at L * (1 - BURST_FRACTION) / W per second, so no window of
+length W ever spends more than L. A request larger than the bucket waits for
+a full bucket and leaves it in debt, which keeps the long-run rate exact.
+
+Requests run in one of two lanes. Live sync takes tokens whenever there are
+enough. Backfill leaves RATE_LIMIT_BACKFILL_RESERVE of each bucket untouched and stands
+aside entirely while a live request is waiting, so a large backfill cannot
+starve the regular sync.
+
+Acquiring tokens is one short BEGIN IMMEDIATE transaction over all the
+buckets a request needs (all or nothing). Wait time is tracked per API and
+lane and rendered for /metrics.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from automation.utils.settings import env_float, env_int, env_str
+
+# Bucket database without RATE_LIMIT_PATH
+DEFAULT_RATE_LIMIT_FILE = os.path.join(os.path.dirname(__file__), '../../../.rate_limits.sqlite3')
+
+# Default limits (0 disables the bucket): GOOGLE_ADS_OPS_PER_DAY,
+# GOOGLE_ADS_REQUESTS_PER_MINUTE, CALLRAIL_REQUESTS_PER_HOUR
+DEFAULT_GOOGLE_ADS_OPS_PER_DAY = 0
+DEFAULT_GOOGLE_ADS_REQUESTS_PER_MINUTE = 600
+DEFAULT_CALLRAIL_REQUESTS_PER_HOUR = 1000
+
+# Share of a limit that may be spent in one burst
+BURST_FRACTION = 0.1
+
+# Share of each bucket backfill requests leave for live sync
+# (RATE_LIMIT_BACKFILL_RESERVE)
+DEFAULT_BACKFILL_RESERVE = 0.2
+
+# Longest a request waits for tokens before RateLimitExceeded is raised
+# (RATE_LIMIT_MAX_WAIT_SECONDS)
+DEFAULT_MAX_WAIT_SECONDS = 300.0
+
+# Waiting requests re-check the shared buckets at least this often
+_MAX_SLEEP_SECONDS = 5.0
+
+LANE_LIVE = 'live'
+LANE_BACKFILL = 'backfill'
+LANES = (LANE_LIVE, LANE_BACKFILL)
+
+# Upper bounds of the wait-time histogram (seconds)
+WAIT_BUCKETS = (0.01, 0.1, 1, 10, 60, 300)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    live_waiting_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Set by set_default_lane(); otherwise RATE_LIMIT_LANE
+_default_lane = None
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+    """Tokens did not become available within the maximum wait"""
+
+
+def set_default_lane(lane):
+    """
+    Set the lane used by requests in this process that do not choose one
+
+    The lane is process-wide, so it also applies to the upload worker and
+    CallRail prefetch threads that acquire the tokens.
+    """
+    global _default_lane
+    if lane not in LANES:
+        raise ValueError(f"Unknown rate-limit lane: {lane}")
+    _default_lane = lane
+
+
+def current_lane():
+    """The lane of requests that do not choose one (RATE_LIMIT_LANE or --priority)"""
+    return _default_lane or env_str('RATE_LIMIT_LANE', LANE_LIVE)
+
+
+class Bucket:
+    """
+    A token bucket enforcing ``limit`` per ``window_seconds``
+
+    Args:
+        name: Shared bucket name, e.g. "callrail:12345"
+        limit: Tokens allowed per window
+        window_seconds: Window length
+    """
+
+    def __init__(self, name, limit, window_seconds):
+        self.name = name
+        self.capacity = max(1.0, limit * BURST_FRACTION)
+        self.refill_per_second = limit * (1 - BURST_FRACTION) / window_seconds
+
+    @property
+    def api(self):
+        return self.name.split(':', 1)[0]
+
+
+def _rate_limit_file():
+    return env_str('RATE_LIMIT_PATH', DEFAULT_RATE_LIMIT_FILE)
+
+
+def google_ads_demands(customer_id, num_conversions):
+    """(bucket, cost) pairs for one Google Ads upload request"""
+    demands = []
+    ops_per_day = env_int('GOOGLE_ADS_OPS_PER_DAY', DEFAULT_GOOGLE_ADS_OPS_PER_DAY)
+    if ops_per_day > 0:
+        demands.append((Bucket('google_ads:ops', ops_per_day, 86400), num_conversions))
+    requests_per_minute = env_int('GOOGLE_ADS_REQUESTS_PER_MINUTE', DEFAULT_GOOGLE_ADS_REQUESTS_PER_MINUTE)
+    if requests_per_minute > 0:
+        demands.append((Bucket(f'google_ads:customer:{customer_id}', requests_per_minute, 60), 1))
+    return demands
+
+
+def callrail_demands(account_id):
+    """(bucket, cost) pairs for one CallRail API request"""
+    requests_per_hour = env_int('CALLRAIL_REQUESTS_PER_HOUR', DEFAULT_CALLRAIL_REQUESTS_PER_HOUR)
+    if requests_per_hour > 0:
+        return [(Bucket(f'callrail:{account_id}', requests_per_hour, 3600), 1)]
+    return []
+
+
+class WaitStats:
+    """Thread-safe wait-time counters and histogram per (api, lane)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def record(self, api, lane_name, waited):
+        with self.lock:
+            series = self.series.get((api, lane_name))
+            if series is None:
+                series = self.series[(api, lane_name)] = {
+                    'requests': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+                    'buckets': [0] * len(WAIT_BUCKETS)
+                }
+            series['requests'] += 1
+            series['wait_seconds'] += waited
+            series['max_wait_seconds'] = max(series['max_wait_seconds'], waited)
+            if waited > 0:
+                series['waited'] += 1
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if waited <= bound:
+                    series['buckets'][i] += 1
+
+    def snapshot(self):
+        """Return {(api, lane): counters} (a copy)"""
+        with self.lock:
+            return {key: dict(series, buckets=list(series['buckets'])) for key, series in self.series.items()}
+
+    def render_prometheus(self, prefix='rate_limit'):
+        """Return the wait-time histogram in Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        metric = f"{prefix}_wait_seconds"
+        lines = [
+            f"# HELP {metric} Time requests waited for API quota tokens",
+            f"# TYPE {metric} histogram"
+        ]
+        for (api, lane_name), series in sorted(snapshot.items()):
+            labels = f'api="{api}",lane="{lane_name}"'
+            for bound, count in zip(WAIT_BUCKETS, series['buckets']):
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {series["requests"]}')
+            lines.append(f'{metric}_sum{{{labels}}} {series["wait_seconds"]}')
+            lines.append(f'{metric}_count{{{labels}}} {series["requests"]}')
+        return "\n".join(lines) + "\n"
+
+    def __str__(self):
+        parts = []
+        for (api, lane_name), series in sorted(self.snapshot().items()):
+            parts.append(
+                f"{api}/{lane_name}: {series['waited']}/{series['requests']} requests waited, "
+                f"{series['wait_seconds']:.1f}s total, max {series['max_wait_seconds']:.1f}s"
+            )
+        return "; ".join(parts) or "no rate-limited requests"
+
+
+class RateLimiter:
+    """
+    Token buckets in a SQLite (WAL mode) file shared between processes
+
+    Thread-safe: each thread gets its own connection.
+
+    Args:
+        path: Database file (default: RATE_LIMIT_PATH or .rate_limits.sqlite3)
+        backfill_reserve: Share of each bucket backfill leaves for live sync
+                          (default: RATE_LIMIT_BACKFILL_RESERVE or 0.2)
+        max_wait_seconds: Longest acquire() waits before RateLimitExceeded
+                          (default: RATE_LIMIT_MAX_WAIT_SECONDS or 300)
+    """
+
+    def __init__(self, path=None, backfill_reserve=None, max_wait_seconds=None):
+        self.path = path or _rate_limit_file()
+        if backfill_reserve is None:
+            backfill_reserve = env_float('RATE_LIMIT_BACKFILL_RESERVE', DEFAULT_BACKFILL_RESERVE)
+        if max_wait_seconds is None:
+            max_wait_seconds = env_float('RATE_LIMIT_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS)
+        self.backfill_reserve = backfill_reserve
+        self.max_wait_seconds = max_wait_seconds
+        self.stats = WaitStats()
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # Losing the last few updates in a crash only refills buckets early
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _try_acquire(self, demands, lane_name, now):
+        """
+        Take the tokens of every (bucket, cost) demand, or none
+
+        Returns:
+            0 if the tokens were taken, else seconds until they may be available
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = {}
+            for bucket, _ in demands:
+                row = conn.execute(
+                    "SELECT tokens, updated_at, live_waiting_until FROM buckets WHERE name = ?", (bucket.name,)
+                ).fetchone()
+                if row is None:
+                    row = (bucket.capacity, now, 0.0)
+                tokens, updated_at, live_waiting_until = row
+                tokens = min(bucket.capacity, tokens + max(0.0, now - updated_at) * bucket.refill_per_second)
+                rows[bucket.name] = (tokens, live_waiting_until)
+
+            wait = 0.0
+            for bucket, cost in demands:
+                tokens, live_waiting_until = rows[bucket.name]
+                # Requests larger than the bucket go once it is full
+                needed = min(cost, bucket.capacity)
+                if lane_name == LANE_BACKFILL:
+                    needed = min(cost + bucket.capacity * self.backfill_reserve, bucket.capacity)
+                    wait = max(wait, live_waiting_until - now)
+                if tokens < needed:
+                    wait = max(wait, (needed - tokens) / bucket.refill_per_second)
+
+            for bucket, cost in demands:
+                tokens, live_waiting_until = rows[bucket.name]
+                if not wait:
+                    tokens -= cost
+                elif lane_name == LANE_LIVE:
+                    # Backfill stands aside until this request has gone
+                    live_waiting_until = max(live_waiting_until, now + wait + _MAX_SLEEP_SECONDS)
+                conn.execute(
+                    "INSERT INTO buckets (name, tokens, updated_at, live_waiting_until) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, "
+                    "updated_at = excluded.updated_at, live_waiting_until = excluded.live_waiting_until",
+                    (bucket.name, tokens, now, live_waiting_until)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, demands, lane_name=None):
+        """
+        Block until every bucket has the tokens requested from it, then take them
+
+        Args:
+            demands: (Bucket, cost) pairs (see google_ads_demands / callrail_demands)
+            lane_name: LANE_LIVE or LANE_BACKFILL (default: current_lane())
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded if the wait would exceed max_wait_seconds
+        """
+        if not demands:
+            return 0.0
+
+        lane_name = lane_name or current_lane()
+        api = demands[0][0].api
+        started = time.monotonic()
+        slept = False
+        while True:
+            wait = self._try_acquire(demands, lane_name, time.time())
+            waited = time.monotonic() - started if slept else 0.0
+            if not wait:
+                self.stats.record(api, lane_name, waited)
+                return waited
+            if waited + wait > self.max_wait_seconds:
+                self.stats.record(api, lane_name, waited)
+                raise RateLimitExceeded(
+                    f"{api} quota not available within "
+                    f"{self.max_wait_seconds:.0f}s ({lane_name} lane)"
+                )
+            time.sleep(min(wait, _MAX_SLEEP_SECONDS))
+            slept = True
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def get_rate_limiter(path=None):
+    """Return the shared RateLimiter for a database file, creating it on first use"""
+    path = path or _rate_limit_file()
+    with _limiters_lock:
+        limiter = _limiters.get(path)
+        if limiter is None:
+            limiter = _limiters[path] = RateLimiter(path)
+        return limiter
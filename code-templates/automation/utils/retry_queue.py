@@ -0,0 +1,413 @@
+"""
+Retry Queue: Durable, backoff-scheduled retries for failed conversion uploads
+
+Failed rows are classified by their Google Ads error codes:
+
+- transient (internal errors, concurrent modification, transport errors)
+  and rate_limited (Google Ads quota errors, or the local rate limiter's
+  budget running out) are retried with exponential backoff and
+  jitter,
+- delayed (the click or conversion action is too recent for Google Ads to
+  match yet) are retried on a slower schedule,
+- permanent (expired or unparseable GCLID, ...) go straight to the
+  dead-letter file,
+- duplicate (Google Ads already has the conversion) count as done.
+
+Rows that are still failing after RETRY_MAX_ATTEMPTS also go to the dead-letter
+file, so a bad row is sent a bounded number of times instead of on every run.
+
+Storage is an append-only log split into segment files. Each record is one
+line, "<crc32> <json>", written and fsynced before the ledger is updated.
+On open the segments are replayed in order; a torn last line (crash during
+a write) fails its checksum and is cut off, so the queue resumes exactly
+where the last complete write left it. Segments holding only settled
+entries are rewritten away by compact().
+
+Only one uploader process should use a queue directory at a time: cron
+runs or the daemon, not both.
+"""
+
+import json
+import os
+import random
+import time
+import zlib
+
+from automation.utils.settings import env_int, env_str
+from automation.utils.upload_ledger import conversion_key
+
+# Queue directory without RETRY_QUEUE_DIR or a tenant state_dir
+DEFAULT_RETRY_QUEUE_DIR = os.path.join(os.path.dirname(__file__), '../../../.retry_queue')
+
+# Attempts (including the first upload) before a row is dead-lettered
+# (RETRY_MAX_ATTEMPTS)
+DEFAULT_MAX_ATTEMPTS = 8
+
+# A new segment is started once the active one reaches this size
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+
+DEAD_LETTER_FILE = 'dead_letter.jsonl'
+_SEGMENT_PREFIX = 'segment-'
+_SEGMENT_SUFFIX = '.log'
+
+ERROR_TRANSIENT = 'transient'
+ERROR_RATE_LIMITED = 'rate_limited'
+ERROR_DELAYED = 'delayed'
+ERROR_PERMANENT = 'permanent'
+ERROR_DUPLICATE = 'duplicate'
+
+# (first delay, maximum delay) in seconds for each retryable class
+BACKOFF_SECONDS = {
+    ERROR_TRANSIENT: (60, 3600),
+    ERROR_RATE_LIMITED: (300, 6 * 3600),
+    ERROR_DELAYED: (3600, 12 * 3600)
+}
+
+_DUPLICATE_CODES = {
+    'conversion_upload_error.CLICK_CONVERSION_ALREADY_EXISTS',
+    'conversion_upload_error.DUPLICATE_CLICK_CONVERSION_IN_REQUEST'
+}
+
+# Google Ads may match these once the click or conversion action is older
+_DELAYED_CODES = {
+    'conversion_upload_error.TOO_RECENT_EVENT',
+    'conversion_upload_error.TOO_RECENT_CONVERSION_ACTION',
+    'conversion_upload_error.CLICK_NOT_FOUND',
+    'conversion_upload_error.EVENT_NOT_FOUND'
+}
+
+_TRANSIENT_CODES = {
+    'database_error.CONCURRENT_MODIFICATION',
+    'conversion_upload_error.TOO_MANY_CONVERSIONS_IN_REQUEST'
+}
+
+_TRANSIENT_CATEGORIES = {'internal_error', 'transport', 'unknown'}
+
+# Errors about the row itself: sending it again gets the same answer
+_PERMANENT_CATEGORIES = {
+    'conversion_upload_error', 'field_error', 'date_error', 'string_format_error', 'string_length_error'
+}
+
+# A row with several errors takes the most severe class
+_SEVERITY = [ERROR_DUPLICATE, ERROR_TRANSIENT, ERROR_RATE_LIMITED, ERROR_DELAYED, ERROR_PERMANENT]
+
+
+def classify_error(code):
+    """
+    Classify a Google Ads error code name
+
+    Args:
+        code: Name such as "conversion_upload_error.EXPIRED_EVENT" (see
+              uploader._error_code_name)
+
+    Returns:
+        One of ERROR_TRANSIENT, ERROR_RATE_LIMITED, ERROR_DELAYED,
+        ERROR_PERMANENT or ERROR_DUPLICATE
+    """
+    if code in _DUPLICATE_CODES:
+        return ERROR_DUPLICATE
+    if code in _DELAYED_CODES:
+        return ERROR_DELAYED
+    if code in _TRANSIENT_CODES:
+        return ERROR_TRANSIENT
+
+    category = code.split('.', 1)[0]
+    if category in ('quota_error', 'rate_limit'):
+        return ERROR_RATE_LIMITED
+    if category in _PERMANENT_CATEGORIES:
+        return ERROR_PERMANENT
+    if category in _TRANSIENT_CATEGORIES:
+        return ERROR_TRANSIENT
+
+    # Authentication, authorization and anything new: retry, bounded by max_attempts,
+    # so a configuration problem fixed within hours loses nothing
+    return ERROR_TRANSIENT
+
+
+def classify_errors(errors):
+    """Return the most severe class among a row's {'code', 'message'} errors"""
+    classes = {classify_error(error['code']) for error in errors} or {ERROR_TRANSIENT}
+    return max(classes, key=_SEVERITY.index)
+
+
+def backoff_delay(error_class, attempts, rng=random):
+    """
+    Seconds to wait before the next attempt
+
+    Exponential (doubling from the class's first delay, capped at its
+    maximum) with equal jitter, so rows that failed together do not all
+    come back in the same second.
+
+    Args:
+        error_class: A retryable error class
+        attempts: Attempts made so far (1 after the first failure)
+    """
+    first, cap = BACKOFF_SECONDS[error_class]
+    delay = min(cap, first * 2 ** max(0, attempts - 1))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(',', ':'), default=str)
+    return f"{zlib.crc32(payload.encode()):08x} {payload}\n".encode()
+
+
+def _decode(line):
+    """Return the record of a log line, or None if it is torn or corrupt"""
+    checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+    if not line.endswith(b'\n') or len(checksum) != 8:
+        return None
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class RetryOutcome:
+    """Counts of what happened to the failures of one batch"""
+
+    def __init__(self):
+        self.scheduled = 0
+        self.dead_lettered = 0
+        self.duplicates = 0
+        self.dead_keys = []
+        self.duplicate_keys = []
+
+    def __str__(self):
+        return f"{self.scheduled} scheduled for retry, {self.dead_lettered} dead-lettered, {self.duplicates} duplicates"
+
+
+class RetryQueue:
+    """
+    Append-only, segment-based queue of conversions waiting for a retry
+
+    A queue object must be used from one thread.
+
+    Args:
+        directory: Queue directory (default: RETRY_QUEUE_DIR or .retry_queue)
+        max_attempts: Attempts before a row is dead-lettered (default:
+                      RETRY_MAX_ATTEMPTS or 8)
+        segment_max_bytes: Size at which a new segment is started
+        rng: random.Random used for backoff jitter
+    """
+
+    def __init__(self, directory=None, max_attempts=None, segment_max_bytes=SEGMENT_MAX_BYTES,
+                 rng=None):
+        self.directory = directory or env_str('RETRY_QUEUE_DIR', DEFAULT_RETRY_QUEUE_DIR)
+        self.max_attempts = max_attempts or env_int('RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        self.segment_max_bytes = segment_max_bytes
+        self.rng = rng or random.Random()
+        self.dead_letter_path = os.path.join(self.directory, DEAD_LETTER_FILE)
+
+        # conversion_key -> latest 'schedule' record
+        self.entries = {}
+        self._segments = []
+        self._file = None
+        self._records_since_compact = 0
+
+        # Since the queue was opened: rows held back by the uploader because
+        # their retry was not due, rows scheduled and rows dead-lettered
+        self.deferred = 0
+        self.scheduled = 0
+        self.dead_lettered = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._replay()
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{number:08d}{_SEGMENT_SUFFIX}")
+
+    def _replay(self):
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                self._segments.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+
+        for number in self._segments:
+            path = self._segment_path(number)
+            good_bytes = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        break
+                    self._apply(record)
+                    good_bytes += len(line)
+            if good_bytes < os.path.getsize(path):
+                # Drop the torn tail so new records do not follow it
+                with open(path, 'r+b') as f:
+                    f.truncate(good_bytes)
+                    os.fsync(f.fileno())
+
+        if not self._segments:
+            self._segments.append(1)
+        self._file = open(self._segment_path(self._segments[-1]), 'ab')
+
+    def _apply(self, record):
+        self._records_since_compact += 1
+        if record['op'] == 'schedule':
+            self.entries[record['key']] = record
+        else:
+            self.entries.pop(record['key'], None)
+
+    def _append(self, records):
+        if not records:
+            return
+        self._file.write(b''.join(_encode(record) for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for record in records:
+            self._apply(record)
+
+        if self._file.tell() >= self.segment_max_bytes:
+            self._roll_segment()
+
+    def _roll_segment(self):
+        self._file.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._file = open(self._segment_path(self._segments[-1]), 'ab')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_waiting(self, key, now=None):
+        """True if the conversion is scheduled for a retry that is not due yet"""
+        entry = self.entries.get(key)
+        return entry is not None and entry['due_at'] > (now or time.time())
+
+    def due(self, now=None, limit=None):
+        """
+        Return conversions whose retry is due, earliest first
+
+        Returns:
+            List of (ref, conversion) pairs
+        """
+        now = now or time.time()
+        entries = sorted(
+            (entry for entry in self.entries.values() if entry['due_at'] <= now),
+            key=lambda entry: entry['due_at']
+        )
+        if limit:
+            entries = entries[:limit]
+        return [(entry['ref'], entry['conversion']) for entry in entries]
+
+    def next_due_at(self):
+        """Unix time of the earliest scheduled retry, or None if the queue is empty"""
+        return min((entry['due_at'] for entry in self.entries.values()), default=None)
+
+    def record_batch(self, batch, failures, default_conversion_action_id=None, now=None):
+        """
+        Schedule, dead-letter or settle the rows of one upload request
+
+        Rows that succeeded are removed from the queue; failed rows are
+        classified and either scheduled with backoff or dead-lettered.
+
+        Args:
+            batch: List of (ref, conversion) pairs that were sent
+            failures: Failure dicts ({'ref', 'gclid', 'errors'}) for the batch
+
+        Returns:
+            RetryOutcome
+        """
+        now = now or time.time()
+        errors_by_ref = {failure['ref']: failure['errors'] for failure in failures}
+        outcome = RetryOutcome()
+        records = []
+        dead_letters = []
+
+        for ref, conversion in batch:
+            key = conversion_key(conversion, default_conversion_action_id)
+            errors = errors_by_ref.get(ref)
+            previous = self.entries.get(key)
+
+            if not errors:
+                if previous is not None:
+                    records.append({'op': 'done', 'key': key, 'at': now})
+                continue
+
+            error_class = classify_errors(errors)
+            attempts = (previous['attempts'] if previous else 0) + 1
+
+            if error_class == ERROR_DUPLICATE:
+                outcome.duplicates += 1
+                outcome.duplicate_keys.append(key)
+                records.append({'op': 'done', 'key': key, 'at': now})
+            elif error_class == ERROR_PERMANENT or attempts >= self.max_attempts:
+                outcome.dead_lettered += 1
+                outcome.dead_keys.append(key)
+                records.append({'op': 'dead', 'key': key, 'at': now})
+                dead_letters.append({
+                    'key': key, 'ref': ref, 'conversion': conversion, 'error_class': error_class,
+                    'attempts': attempts, 'errors': errors,
+                    'first_failed_at': previous['first_failed_at'] if previous else now,
+                    'dead_lettered_at': now
+                })
+            else:
+                outcome.scheduled += 1
+                records.append({
+                    'op': 'schedule', 'key': key, 'ref': ref, 'conversion': conversion,
+                    'attempts': attempts, 'error_class': error_class, 'errors': errors,
+                    'first_failed_at': previous['first_failed_at'] if previous else now,
+                    'due_at': now + backoff_delay(error_class, attempts, self.rng)
+                })
+
+        if dead_letters:
+            # Written before the queue drops the rows, so a crash in between
+            # at worst repeats a dead-letter line
+            with open(self.dead_letter_path, 'a') as f:
+                f.writelines(json.dumps(entry, default=str) + '\n' for entry in dead_letters)
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Remove entries settled outside this batch (for example, already in the ledger)
+        self._append([record for record in records if record['op'] != 'done' or record['key'] in self.entries])
+        self.scheduled += outcome.scheduled
+        self.dead_lettered += outcome.dead_lettered
+        return outcome
+
+    def discard(self, keys):
+        """Remove conversions from the queue (for example, acknowledged by another path)"""
+        now = time.time()
+        self._append([{'op': 'done', 'key': key, 'at': now} for key in keys if key in self.entries])
+
+    def dead_letters(self):
+        """Return the dead-letter entries, oldest first"""
+        if not os.path.exists(self.dead_letter_path):
+            return []
+        with open(self.dead_letter_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def compact(self):
+        """
+        Rewrite the live entries into a fresh segment and delete the old ones
+
+        The new segment is fsynced before old segments are removed, and
+        replay is idempotent, so a crash at any point leaves a valid queue.
+
+        Returns:
+            Number of segments removed
+        """
+        if len(self._segments) == 1 and self._records_since_compact <= 2 * len(self.entries) + 100:
+            return 0
+
+        old_segments = list(self._segments)
+        self._file.close()
+        number = old_segments[-1] + 1
+        with open(self._segment_path(number), 'wb') as f:
+            f.write(b''.join(_encode(entry) for entry in self.entries.values()))
+            f.flush()
+            os.fsync(f.fileno())
+
+        for old in old_segments:
+            os.remove(self._segment_path(old))
+
+        self._segments = [number]
+        self._records_since_compact = len(self.entries)
+        self._file = open(self._segment_path(number), 'ab')
+        return len(old_segments)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
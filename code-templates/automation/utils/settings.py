@@ -0,0 +1,35 @@
+"""
+Settings: Environment settings read when they are used
+
+The helper modules read their settings through these functions on each
+call instead of into module constants at import, so a .env file loaded by
+the entry point, or a variable changed between runs, applies without
+re-importing anything. Unset or empty variables give the default.
+"""
+
+import os
+
+
+def env_str(name, default=None):
+    """Value of an environment variable"""
+    return os.environ.get(name) or default
+
+
+def env_int(name, default):
+    """Integer environment variable (ValueError if it is not a number)"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name, default):
+    """Float environment variable (ValueError if it is not a number)"""
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def env_flag(name, default):
+    """Boolean environment variable: anything but 0, false or no is on"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() not in ('0', 'false', 'no')
@@ -0,0 +1,212 @@
+"""
+Sharded Convert: Convert many CRM exports in parallel across processes
+
+Large uncompressed inputs are split into shards on line boundaries, each
+shard is converted in a worker process, and the results are merged into
+one upload file per conversion action. Merging follows input order (file,
+then shard, then line) and drops rows whose (gclid, conversion_action_id,
+conversion_date_time) was already written, so output is identical no matter
+how many workers ran.
+
+Line-boundary splitting assumes CSV fields do not contain embedded
+newlines; pass shard_bytes=0 to keep every file in a single shard.
+"""
+
+import csv
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from automation.utils.compressed_io import compression_for, open_text
+from automation.utils.crm_rows import OUTPUT_FIELDNAMES, make_row_converter
+
+# Files larger than this are split into shards of about this size
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+
+
+def _shard_offsets(path, shard_bytes):
+    """
+    Split an uncompressed file into byte ranges that start on line boundaries
+
+    Returns:
+        List of (start, end) offsets covering every data line (header excluded)
+    """
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+
+        if not shard_bytes or size - data_start <= shard_bytes:
+            return [(data_start, size)]
+
+        boundaries = [data_start]
+        for target in range(data_start + shard_bytes, size, shard_bytes):
+            # Move to the start of the next line at or after the target
+            f.seek(target - 1)
+            f.readline()
+            position = f.tell()
+            if position > boundaries[-1] and position < size:
+                boundaries.append(position)
+        boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _read_header(path):
+    with open_text(path, 'r') as f:
+        return next(csv.reader(f), [])
+
+
+def _iter_shard_lines(path, start, end):
+    """Yield decoded lines of a byte range"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if position >= end:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def _convert_shard(task):
+    """
+    Worker: convert one shard and write its rows to per-action temp files
+
+    Returns:
+        Dict with 'files' ({action: path}), 'rows' and 'skipped'
+    """
+    shard_id, path, start, end, header, column_mapping, work_dir = task
+    convert = make_row_converter(header, column_mapping)
+
+    if start is None:
+        # Compressed input: the whole file is one shard
+        infile = open_text(path, 'r')
+        next(csv.reader(infile), None)
+        lines = infile
+    else:
+        infile = None
+        lines = _iter_shard_lines(path, start, end)
+
+    writers = {}
+    handles = {}
+    rows = skipped = 0
+
+    try:
+        for row in csv.reader(lines):
+            output_row = convert(row)
+            if output_row is None:
+                skipped += 1
+                continue
+
+            action = output_row[1]
+            writer = writers.get(action)
+            if writer is None:
+                shard_path = os.path.join(work_dir, f'shard_{shard_id:06d}_{_safe_name(action)}.csv')
+                handles[action] = open(shard_path, 'w', newline='', encoding='utf-8')
+                writer = writers[action] = csv.writer(handles[action])
+            writer.writerow(output_row)
+            rows += 1
+    finally:
+        if infile is not None:
+            infile.close()
+        for handle in handles.values():
+            handle.close()
+
+    return {
+        'files': {action: handle.name for action, handle in handles.items()},
+        'rows': rows,
+        'skipped': skipped
+    }
+
+
+def _safe_name(action):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', action) or 'unassigned'
+
+
+def _plan_shards(input_files, column_mapping, shard_bytes, work_dir):
+    tasks = []
+    for path in input_files:
+        header = _read_header(path)
+        # Fail early on a missing GCLID column, before any worker starts
+        make_row_converter(header, column_mapping)
+
+        if compression_for(path):
+            ranges = [(None, None)]
+        else:
+            ranges = _shard_offsets(path, shard_bytes)
+
+        for start, end in ranges:
+            tasks.append((len(tasks), path, start, end, header, column_mapping, work_dir))
+    return tasks
+
+
+def convert_exports_parallel(input_files, output_dir, column_mapping=None, workers=None,
+                             shard_bytes=DEFAULT_SHARD_BYTES, output_suffix='.csv'):
+    """
+    Convert CRM exports into per-conversion-action upload files in parallel
+
+    Args:
+        input_files: CRM export paths (.csv, .csv.gz, .csv.zst), in priority
+                     order: when a conversion appears twice, the first wins
+        output_dir: Directory for conversions_<action_id><suffix> files
+        column_mapping: CRM column mapping (see csv-generator.py), or None if
+                        the inputs are already in upload format (csv-formatter.py)
+        workers: Worker processes (default: all cores)
+        shard_bytes: Target shard size for uncompressed inputs (0 = no splitting)
+        output_suffix: '.csv', '.csv.gz' or '.csv.zst'
+
+    Returns:
+        Dict with 'files' ({action: path}), 'rows_written', 'duplicates',
+        'rows_skipped', 'shards' and 'seconds'
+    """
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='.shards_', dir=output_dir)
+
+    try:
+        tasks = _plan_shards(input_files, column_mapping, shard_bytes, work_dir)
+
+        # map() returns results in task order, which fixes the merge order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_convert_shard, tasks))
+
+        outputs = {}
+        rows_written = duplicates = 0
+        actions = sorted({action for result in results for action in result['files']})
+
+        for action in actions:
+            output_path = os.path.join(output_dir, f'conversions_{_safe_name(action)}{output_suffix}')
+            seen = set()
+            with open_text(output_path, 'w') as outfile:
+                writer = csv.writer(outfile)
+                writer.writerow(OUTPUT_FIELDNAMES)
+                for result in results:
+                    shard_path = result['files'].get(action)
+                    if shard_path is None:
+                        continue
+                    with open(shard_path, 'r', newline='', encoding='utf-8') as shard:
+                        for row in csv.reader(shard):
+                            key = (row[0], row[1], row[2])
+                            if key in seen:
+                                duplicates += 1
+                                continue
+                            seen.add(key)
+                            writer.writerow(row)
+                            rows_written += 1
+            outputs[action] = output_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'files': outputs,
+        'rows_written': rows_written,
+        'duplicates': duplicates,
+        'rows_skipped': sum(result['skipped'] for result in results),
+        'shards': len(tasks),
+        'seconds': time.perf_counter() - started
+    }
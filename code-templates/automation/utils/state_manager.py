@@ -1,23 +1,61 @@
 """
 State Manager: Track last successful sync to avoid duplicate uploads
+
+Incremental syncs use a high-watermark cursor: the (start_time, id) of the
+newest CallRail call fetched so far. Each run fetches from the watermark
+minus an overlap window, so calls that CallRail reports late are still
+picked up; the upload ledger drops the ones already uploaded.
+
+Every function takes an optional ``state_dir``: tenants run by the
+orchestrator keep their sync state (and ledger / retry queue, see
+state_path) in a directory of their own.
 """
 
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+from automation.utils.settings import env_int
 
 STATE_FILE = os.path.join(os.path.dirname(__file__), '../../../.last_sync')
+WATERMARK_FILE = os.path.join(os.path.dirname(__file__), '../../../.sync_watermark')
+
+# Minutes re-fetched before the watermark on every run (SYNC_OVERLAP_MINUTES)
+DEFAULT_OVERLAP_MINUTES = 120
+
+
+def state_path(state_dir, name):
+    """
+    Path of a state file inside ``state_dir``
+
+    Returns:
+        os.path.join(state_dir, name), or None without a state_dir (callers
+        then use their default location)
+    """
+    if not state_dir:
+        return None
+    return os.path.join(state_dir, name)
+
 
+def _state_file(state_dir):
+    return state_path(state_dir, '.last_sync') or STATE_FILE
 
-def get_last_sync_time():
+
+def _watermark_file(state_dir):
+    return state_path(state_dir, '.sync_watermark') or WATERMARK_FILE
+
+
+def get_last_sync_time(state_dir=None):
     """
     Get timestamp of last successful sync
     
     Returns:
         datetime object or None if never synced
     """
-    if os.path.exists(STATE_FILE):
+    state_file = _state_file(state_dir)
+    if os.path.exists(state_file):
         try:
-            with open(STATE_FILE, 'r') as f:
+            with open(state_file, 'r') as f:
                 timestamp_str = f.read().strip()
                 return datetime.fromisoformat(timestamp_str)
         except (ValueError, IOError) as e:
@@ -26,12 +64,12 @@ def get_last_sync_time():
     return None
 
 
-def save_last_sync_time():
+def save_last_sync_time(state_dir=None):
     """
     Save current timestamp as last successful sync
     """
     try:
-        with open(STATE_FILE, 'w') as f:
+        with open(_state_file(state_dir), 'w') as f:
             f.write(datetime.utcnow().isoformat())
         print(f"✓ Saved last sync timestamp")
     except IOError as e:
@@ -59,6 +97,80 @@ def get_minutes_since_last_sync(default_minutes=360):
         return default_minutes
 
 
+def get_sync_watermark(state_dir=None):
+    """
+    Get the high-watermark of the last complete CallRail fetch
+
+    Returns:
+        Tuple of (start_time as aware datetime, call_id), or None if never synced
+    """
+    watermark_file = _watermark_file(state_dir)
+    if not os.path.exists(watermark_file):
+        return None
+
+    try:
+        with open(watermark_file, 'r') as f:
+            state = json.load(f)
+        return datetime.fromisoformat(state['start_time']), state.get('call_id')
+    except (ValueError, KeyError, IOError) as e:
+        print(f"Warning: Could not read sync watermark: {e}")
+        return None
+
+
+def save_sync_watermark(start_time, call_id=None, state_dir=None):
+    """
+    Save a new high-watermark, never moving it backwards
+
+    The file is replaced atomically so a crash cannot leave it half written.
+
+    Args:
+        start_time: Aware datetime of the newest call fetched
+        call_id: CallRail ID of that call
+        state_dir: Directory holding the watermark (default: repo root)
+    """
+    current = get_sync_watermark(state_dir)
+    if current and (current[0], str(current[1])) >= (start_time, str(call_id)):
+        return
+
+    watermark_file = _watermark_file(state_dir)
+    tmp_file = watermark_file + '.tmp'
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump({'start_time': start_time.isoformat(), 'call_id': call_id}, f)
+        os.replace(tmp_file, watermark_file)
+        print(f"✓ Saved sync watermark: {start_time.isoformat()} (call {call_id})")
+    except IOError as e:
+        print(f"Warning: Could not save sync watermark: {e}")
+
+
+def get_sync_start(overlap_minutes=None, default_minutes=360, state_dir=None):
+    """
+    Calculate where the next incremental fetch should start
+
+    Uses the watermark minus the overlap window (default:
+    SYNC_OVERLAP_MINUTES or 120). Falls back to the legacy .last_sync
+    timestamp, then to ``default_minutes`` ago.
+
+    Returns:
+        Aware UTC datetime
+    """
+    if overlap_minutes is None:
+        overlap_minutes = env_int('SYNC_OVERLAP_MINUTES', DEFAULT_OVERLAP_MINUTES)
+    watermark = get_sync_watermark(state_dir)
+    if watermark:
+        start_time, call_id = watermark
+        print(f"Sync watermark: {start_time.isoformat()} (call {call_id}), overlap {overlap_minutes} minutes")
+        return start_time.astimezone(timezone.utc) - timedelta(minutes=overlap_minutes)
+
+    last_sync = get_last_sync_time(state_dir)
+    if last_sync:
+        print(f"No sync watermark, using last sync time {last_sync.isoformat()}")
+        return last_sync.replace(tzinfo=timezone.utc) - timedelta(minutes=overlap_minutes)
+
+    print(f"No previous sync found, using default: {default_minutes} minutes")
+    return datetime.now(timezone.utc) - timedelta(minutes=default_minutes)
+
+
 if __name__ == "__main__":
     # Test the state manager
     print("Testing state manager...")
@@ -72,3 +184,5 @@ if __name__ == "__main__":
     print("\nChecking again...")
     minutes = get_minutes_since_last_sync()
     print(f"Minutes since last sync: {minutes}")
+    
+    print(f"\nNext incremental fetch starts at: {get_sync_start().isoformat()}")
@@ -0,0 +1,37 @@
+from bloom_filter import BloomFilter, bloom_size
+
+
+def test_no_false_negatives_and_low_false_positive_rate():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    keys = [f'GCLID_{i}|987654321|2025-12-19 10:30:00-0800' for i in range(10000)]
+    bloom.update(keys)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'OTHER_{i}' in bloom for i in range(10000))
+    assert false_positives < 200
+    assert not bloom.saturated
+
+
+def test_persists_in_file(tmp_path):
+    path = str(tmp_path / 'keys.bloom')
+    bloom = BloomFilter(path, capacity=1000)
+    assert bloom.created
+    assert bloom.add('GCLID_A')
+    assert not bloom.add('GCLID_A')
+    bloom.close()
+
+    bloom = BloomFilter(path, capacity=1000)
+    assert not bloom.created
+    assert 'GCLID_A' in bloom and bloom.count == 1
+    bloom.close()
+
+    # A different size cannot reuse the bitmap
+    bloom = BloomFilter(path, capacity=2000)
+    assert bloom.created and 'GCLID_A' not in bloom
+    bloom.close()
+
+
+def test_bloom_size():
+    num_bits, num_hashes = bloom_size(1000000, 0.001)
+    assert 14 * 10 ** 6 < num_bits < 15 * 10 ** 6
+    assert num_hashes == 10
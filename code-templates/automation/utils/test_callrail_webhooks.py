@@ -0,0 +1,110 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from automation.utils.callrail_webhooks import WebhookServer, sign_body, verify_signature, webhook_to_conversion
+from automation.utils.webhook_queue import WebhookQueue
+
+SECRET = 'test-signing-token'
+
+
+def _call(call_id, gclid='CjwKCAiA_test', **fields):
+    return {'resource_id': call_id, 'start_time': '2025-12-19T10:30:00-08:00', 'gclid': gclid,
+            'value': 150, **fields}
+
+
+def test_signature_round_trip():
+    body = json.dumps(_call('CAL1')).encode()
+
+    assert verify_signature(body, sign_body(body, SECRET), SECRET)
+    assert not verify_signature(body + b' ', sign_body(body, SECRET), SECRET)
+    assert not verify_signature(body, None, SECRET)
+
+
+def test_webhook_filtering_matches_polling():
+    assert webhook_to_conversion(_call('CAL1'))['call_id'] == 'CAL1'
+    assert webhook_to_conversion(_call('CAL2', gclid=None)) is None
+    assert webhook_to_conversion(_call('CAL3', qualifying=False)) is None
+    assert webhook_to_conversion(_call('CAL4', lead_status='not_a_lead')) is None
+
+
+def test_queue_peek_and_delete(tmp_path):
+    queue = WebhookQueue(str(tmp_path / 'queue.sqlite3'))
+    queue.append_many([{'call_id': 'CAL1'}, {'call_id': 'CAL2'}])
+
+    events = queue.peek()
+    assert [conversion['call_id'] for _, conversion in events] == ['CAL1', 'CAL2']
+    assert queue.peek(after_id=events[0][0]) == events[1:]
+
+    queue.delete([events[0][0]])
+    assert len(queue) == 1
+
+
+def test_server_queues_signed_conversions(tmp_path):
+    queue = WebhookQueue(str(tmp_path / 'queue.sqlite3'))
+    server = WebhookServer(queue=queue, secret=SECRET, host='127.0.0.1', port=0)
+
+    async def post(reader, writer, payload, signature=None):
+        body = json.dumps(payload).encode()
+        signature = signature or sign_body(body, SECRET)
+        writer.write(
+            f"POST /callrail/webhook HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+            f"Signature: {signature}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b'\r\n':
+            name, _, value = line.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        await reader.readexactly(int(headers['content-length']))
+        return status
+
+    async def scenario():
+        await server.start()
+        host, port = server.address
+        reader, writer = await asyncio.open_connection(host, port)
+        # One keep-alive connection, several requests
+        statuses = [
+            await post(reader, writer, _call('CAL1')),
+            await post(reader, writer, _call('CAL2', gclid=None)),
+            await post(reader, writer, _call('CAL3'), signature='invalid'),
+        ]
+        writer.close()
+        await server.stop()
+        return statuses
+
+    assert asyncio.run(scenario()) == [200, 200, 401]
+    assert [conversion['call_id'] for _, conversion in queue.peek()] == ['CAL1']
+    assert (server.stats.queued, server.stats.ignored, server.stats.rejected) == (1, 1, 1)
+
+
+def test_server_uses_the_tenant_config(tmp_path):
+    config = SimpleNamespace(state_dir=str(tmp_path), qualification_rules_path='off', customer_id='1234567890',
+                             enhanced_conversions_for_leads=True)
+    server = WebhookServer(secret=SECRET, config=config)
+
+    assert server.queue.path == str(tmp_path / 'webhook_queue.sqlite3')
+    assert server.leads and server._router is None
+    server.queue.close()
+
+
+def test_bad_payload_fields_get_400(tmp_path):
+    from automation.utils import qualification_rules
+
+    rules_path = qualification_rules.QUALIFICATION_RULES_FILE
+    config = SimpleNamespace(state_dir=str(tmp_path), qualification_rules_path=rules_path, customer_id='1234567890',
+                             enhanced_conversions_for_leads=False)
+    server = WebhookServer(secret=SECRET, config=config)
+
+    def post(fields):
+        body = '&'.join(f'{name}={value}' for name, value in fields.items()).encode()
+        headers = {'signature': sign_body(body, SECRET), 'content-type': 'application/x-www-form-urlencoded'}
+        return asyncio.run(server.handle_request('POST', '/callrail/webhook', headers, body))[0]
+
+    call = {'resource_id': 'CAL1', 'start_time': '2025-12-19T10:30:00-08:00', 'gclid': 'CjwKCAiA_test',
+            'answered': 'true', 'first_call': 'true'}
+    assert post({**call, 'duration': ''}) == 200
+    assert post({**call, 'resource_id': 'CAL2', 'start_time': 'yesterday'}) == 400
+    assert (server.stats.queued, server.stats.rejected) == (1, 1)
+    server.queue.close()
+
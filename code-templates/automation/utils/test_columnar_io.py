@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from automation.utils.columnar_io import (
+    ColumnarWriter,
+    columnar_format_for,
+    iter_row_chunks,
+    iter_rows,
+    read_schema,
+    read_table
+)
+
+FIELDNAMES = ['gclid', 'conversion_action_id', 'conversion_date_time', 'conversion_value']
+
+
+def _rows(n):
+    return [(f'gclid-{i}', '987654321', '2025-12-19 10:30:00-08:00', str(i)) for i in range(n)]
+
+
+@pytest.mark.parametrize('name', ['conversions.parquet', 'conversions.arrow'])
+def test_round_trip_in_batches(tmp_path, name):
+    path = str(tmp_path / name)
+    with ColumnarWriter(path, FIELDNAMES, batch_rows=4) as writer:
+        writer.writerows(_rows(6))
+        writer.writerows(_rows(10)[6:])
+
+    assert read_schema(path) == FIELDNAMES
+    chunks = list(iter_row_chunks(path, ['gclid', 'conversion_value'], batch_rows=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert chunks[0][1] == ['gclid-1', '1']
+    assert list(iter_rows(path, ['gclid']))[-1] == {'gclid': 'gclid-9'}
+
+
+def test_only_requested_columns_are_read(tmp_path):
+    path = str(tmp_path / 'conversions.parquet')
+    with ColumnarWriter(path, FIELDNAMES) as writer:
+        writer.writerows(_rows(3))
+
+    table = read_table(path, ['conversion_value'])
+
+    assert table.column_names == ['conversion_value']
+    assert table.column('conversion_value').to_pylist() == ['0', '1', '2']
+
+
+def test_non_string_columns_become_strings(tmp_path):
+    import pyarrow
+    import pyarrow.parquet
+
+    path = str(tmp_path / 'crm.parquet')
+    pyarrow.parquet.write_table(pyarrow.table({'gclid': ['a', None], 'sale_amount': [4500.0, None]}), path)
+
+    assert list(iter_row_chunks(path, ['gclid', 'sale_amount'])) == [[['a', '4500'], ['', '']]]
+    assert columnar_format_for('crm.csv.gz') is None
@@ -0,0 +1,51 @@
+import hashlib
+
+from automation.utils.callrail_fetcher import call_to_conversion
+from automation.utils.enhanced_conversions import PhoneHasher, normalize_e164
+from automation.utils.upload_ledger import conversion_key
+
+
+def test_normalize_e164():
+    assert normalize_e164('(555) 123-4567') == '+15551234567'
+    assert normalize_e164('1-555-123-4567') == '+15551234567'
+    assert normalize_e164('+44 20 7946 0958') == '+442079460958'
+    assert normalize_e164('0044 20 7946 0958') == '+442079460958'
+    assert normalize_e164('020 7946 0958', default_country_code='44') == '+442079460958'
+    assert normalize_e164('555-1234') is None
+    assert normalize_e164('') is None
+
+
+def test_hash_batch_caches_normalized_numbers():
+    hasher = PhoneHasher(cache_size=2)
+
+    digests = hasher.hash_batch(['+1 555 123 4567', '(555) 123-4567', 'unknown'])
+
+    assert digests[0] == digests[1] == hashlib.sha256(b'+15551234567').hexdigest()
+    assert digests[2] is None
+    assert (hasher.misses, hasher.invalid) == (1, 1)
+
+    hasher.hash_batch(['555-123-4567', '555-000-0001', '555-000-0002'])
+    assert hasher.hits == 1
+    # Least recently used number evicted
+    assert len(hasher._cache) == 2 and '+15551234567' not in hasher._cache
+
+
+def test_attach_keeps_gclid_rows_and_hashable_leads():
+    hasher = PhoneHasher()
+    calls = [
+        {'id': 'CAL1', 'start_time': '2025-12-15T10:30:00-08:00', 'gclid': 'CjwKCAiA_test',
+         'customer_phone_number': '+15551234567'},
+        {'id': 'CAL2', 'start_time': '2025-12-15T10:31:00-08:00', 'customer_phone_number': '+15551234567'},
+        {'id': 'CAL3', 'start_time': '2025-12-15T10:32:00-08:00', 'customer_phone_number': 'Restricted'},
+        {'id': 'CAL4', 'start_time': '2025-12-15T10:33:00-08:00'},
+    ]
+
+    assert [call_to_conversion(call) for call in calls[1:]] == [None, None, None]
+    conversions = [conversion for conversion in (call_to_conversion(call, leads=True) for call in calls) if conversion]
+    uploadable = hasher.attach(conversions)
+
+    assert [conversion['call_id'] for conversion in uploadable] == ['CAL1', 'CAL2']
+    assert 'hashed_phone_number' not in uploadable[0]
+    assert conversion_key(uploadable[1], '42') == (
+        f"phone:{hashlib.sha256(b'+15551234567').hexdigest()}|42|{uploadable[1]['conversion_date_time']}"
+    )
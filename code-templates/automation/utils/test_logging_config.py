@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+
+from automation.utils.logging_config import (
+    JsonLinesFormatter,
+    MetricsRegistry,
+    RotatingLogFileHandler,
+    SuccessSampler,
+    setup_logging,
+    shutdown_logging
+)
+
+
+def _record(message, **fields):
+    record = logging.LogRecord('conversion_upload', logging.INFO, __file__, 1, message, (), None)
+    record.__dict__.update(fields)
+    return record
+
+
+def test_json_lines_include_structured_fields():
+    line = JsonLinesFormatter().format(_record("✗ Failed\nsecond line", event='conversion_failed', ref=7))
+    entry = json.loads(line)
+
+    assert '\n' not in line
+    assert entry['message'] == "✗ Failed\nsecond line"
+    assert (entry['level'], entry['event'], entry['ref']) == ('INFO', 'conversion_failed', 7)
+
+
+def test_success_messages_are_sampled():
+    sampler = SuccessSampler(0.1)
+
+    kept = sum(sampler.filter(_record("ok", success=True)) for _ in range(1000))
+
+    assert kept == 100
+    assert sampler.filter(_record("✗ Failed"))
+
+
+def test_file_rolls_over_at_max_bytes(tmp_path):
+    path = str(tmp_path / 'conversions.log')
+    handler = RotatingLogFileHandler(path, max_bytes=200, backup_count=2, rotate=None)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    for i in range(50):
+        handler.emit(_record(f"row {i:03d} " + 'x' * 20))
+    handler.close()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['conversions.log', 'conversions.log.1', 'conversions.log.2']
+
+
+def test_setup_logging_is_idempotent(tmp_path):
+    try:
+        logger = setup_logging(log_format='json', async_mode=True, log_dir=str(tmp_path))
+        handlers = list(logger.handlers)
+
+        assert setup_logging(log_format='json', async_mode=True, log_dir=str(tmp_path)) is logger
+        assert logger.handlers == handlers
+
+        logger.info("batch done", extra={'event': 'batch_uploaded', 'rows': 3})
+    finally:
+        shutdown_logging()
+
+    with open(tmp_path / 'conversions.log') as f:
+        entries = [json.loads(line) for line in f]
+    assert entries[-1]['event'] == 'batch_uploaded'
+
+
+def test_metrics_render_prometheus():
+    metrics = MetricsRegistry(prefix='test')
+    metrics.inc('failures', code='conversion_upload_error.EXPIRED_EVENT')
+    metrics.observe('rpc_latency_seconds', 0.2)
+
+    text = metrics.render_prometheus()
+
+    assert 'test_failures_total{code="conversion_upload_error.EXPIRED_EVENT"} 1' in text
+    assert 'test_rpc_latency_seconds_bucket{le="0.25"} 1' in text
+    assert 'test_rpc_latency_seconds_count 1' in text
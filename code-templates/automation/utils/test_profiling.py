@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from automation.utils import profiling
+from automation.utils.profiling import Profiler, profile_run, span
+
+
+def test_spans_are_free_when_not_profiling():
+    assert not profiling.profiling_active()
+    assert span('upload.build_request') is span('google_ads.rpc')
+
+
+def test_nested_spans_record_self_time_and_collapsed_stacks(tmp_path):
+    profiler = Profiler()
+    profiler.start()
+    with profiler.span('upload.next_batch'):
+        with profiler.span('callrail.fetch_page'):
+            time.sleep(0.02)
+    profiler.stop()
+
+    outer, inner = profiler.stages['upload.next_batch'], profiler.stages['callrail.fetch_page']
+    assert inner.wall >= 0.02
+    assert outer.wall >= inner.wall
+    assert outer.self_wall == pytest.approx(outer.wall - inner.wall)
+
+    path = tmp_path / 'spans.collapsed'
+    profiler.write_collapsed(str(path))
+    stacks = dict(line.rsplit(' ', 1) for line in path.read_text().splitlines())
+    assert int(stacks['upload.next_batch;callrail.fetch_page']) >= 20000
+
+
+def test_threads_keep_separate_span_stacks():
+    profiler = Profiler()
+    profiler.start()
+
+    def worker():
+        with profiler.span('google_ads.rpc'):
+            pass
+
+    with profiler.span('upload.wait_in_flight'):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    profiler.stop()
+
+    assert set(profiler.collapsed) == {'upload.wait_in_flight', 'google_ads.rpc'}
+
+
+def test_profile_run_writes_reports(tmp_path):
+    with profile_run(str(tmp_path), mode='cprofile', allocations=True, logger=None):
+        assert profiling.profiling_active()
+        with span('callrail.parse_calls'):
+            rows = [str(i) * 10 for i in range(10000)]
+    assert not profiling.profiling_active()
+
+    report = (tmp_path / 'timing-report.txt').read_text()
+    assert 'callrail.parse_calls' in report
+    assert 'alloc MB' in report
+    assert (tmp_path / 'profile.pstats').stat().st_size > 0
+    assert 'run;callrail.parse_calls' in (tmp_path / 'spans.collapsed').read_text()
+    assert len(rows) == 10000
@@ -0,0 +1,132 @@
+from automation.utils import qualification_rules
+from automation.utils.callrail_fetcher import call_to_conversion
+from automation.utils.qualification_rules import CallRules, load_rules
+
+
+def _rules(**automatic):
+    return CallRules({
+        'automatic_qualification': {'minimum_duration_seconds': 30, 'must_be_answered': True, **automatic},
+        'exclusion_rules': {
+            'spam_detection': {'enabled': True, 'known_spam_callers': ['+1 (555) 000-1111'],
+                               'repeated_hangups_threshold': 2},
+            'duration_filters': {'too_short_threshold_seconds': 15, 'exclude_if_below': True},
+            'caller_type_filters': {'exclude_vendors': True},
+        },
+        'conversion_tags': [
+            {'tag_name': 'Appointment_Booked', 'conversion_value': 0,
+             'google_ads_mapping': 'customers/1234567890/conversionActions/111'},
+            {'tag_name': 'Sale_Completed', 'conversion_value': 'variable',
+             'google_ads_mapping': 'customers/1234567890/conversionActions/222'},
+            {'tag_name': 'High_Quality_Lead', 'internal_use_only': True, 'google_ads_mapping': None},
+            {'tag_name': 'Not_Qualified', 'exclude_from_google_ads': True},
+        ],
+        'business_hours': {
+            'timezone': 'America/Los_Angeles',
+            'monday': {'open': '09:00', 'close': '17:00'},
+            'saturday': 'closed',
+            'sunday': {'open': '22:00', 'close': '02:00'},
+        },
+    })
+
+
+def _call(call_id, **fields):
+    return {'id': call_id, 'start_time': '2025-12-15T10:30:00-08:00', 'duration': 60,
+            'customer_phone_number': f'+1555{call_id[-4:]}', 'value': 150, 'gclid': 'CjwKCAiA_test', **fields}
+
+
+def test_repo_rules_compile():
+    rules = load_rules(qualification_rules.QUALIFICATION_RULES_FILE, '123-456-7890')
+
+    assert rules.min_duration == 30
+    assert rules.tags['appointment_booked'][1] == '987654321'
+    assert rules.tags['not_qualified'][0] == 'exclude'
+    assert 'high_quality_lead' not in rules.tags
+    assert load_rules('off') is None
+    assert load_rules('/nonexistent/rules.json') is None
+
+
+def test_rules_need_a_configured_file(monkeypatch):
+    # The repo's qualification-rules.json is a template, never applied implicitly
+    monkeypatch.delenv('QUALIFICATION_RULES_PATH', raising=False)
+
+    assert load_rules() is None
+
+
+def test_mappings_to_another_customer_are_skipped(caplog):
+    with caplog.at_level('WARNING', logger='conversion_upload.qualification_rules'):
+        rules = load_rules(qualification_rules.QUALIFICATION_RULES_FILE, '5555555555')
+
+    assert rules.foreign_mappings == ['Appointment_Booked', 'Sale_Completed_Audiology']
+    assert "'Appointment_Booked' maps to customer" in caplog.text
+    assert 'appointment_booked' not in rules.tags
+    # The tagged call falls through to the automatic checks and the default action
+    assert rules.router().route(_call('CAL1', tags=['Appointment_Booked'], first_call=True)) == (None, None, 150)
+
+
+def test_tags_route_and_exclusions_win():
+    router = _rules().router()
+    calls = [
+        _call('CAL1', tags=['Appointment_Booked', 'High_Quality_Lead']),
+        _call('CAL2', tags=[{'name': 'sale completed'}], duration=5),
+        _call('CAL3', tags=['Appointment_Booked', 'Not_Qualified']),
+        _call('CAL4', tags=['Vendor']),
+        _call('CAL5'),
+    ]
+
+    routed = router.route_batch(calls)
+
+    assert [(call['id'], action, value) for call, action, value in routed] == [
+        ('CAL1', '111', 0), ('CAL2', '222', 150), ('CAL5', None, 150)
+    ]
+    assert router.rejected == {'excluded_tag': 1, 'caller_type': 1}
+    assert call_to_conversion(*routed[0])['conversion_action_id'] == '111'
+    assert 'conversion_action_id' not in call_to_conversion(*routed[2])
+
+
+def test_automatic_qualification_checks_and_missing_fields():
+    router = _rules(first_time_caller_only=True, exclude_voicemail=True).router()
+    calls = [
+        _call('CAL1', duration=20),
+        _call('CAL2', answered=False),
+        _call('CAL3', voicemail=True),
+        _call('CAL4', first_call=False),
+        _call('CAL5', customer_phone_number='555-000-1111'),
+        {'id': 'CAL6', 'gclid': 'CjwKCAiA_test'},
+    ]
+
+    routed = router.route_batch(calls)
+
+    assert [call['id'] for call, _, _ in routed] == ['CAL6']
+    assert router.rejected == {'too_short': 1, 'not_answered': 1, 'voicemail': 1,
+                               'repeat_caller': 1, 'spam_caller': 1}
+
+
+def test_business_hours_interval_table():
+    rules = _rules(business_hours_only=True)
+
+    assert rules.is_open('2025-12-15T10:30:00-08:00')      # Monday morning
+    assert not rules.is_open('2025-12-15T17:00:00-08:00')  # Monday close
+    assert not rules.is_open('2025-12-20T12:00:00-08:00')  # Saturday
+    assert rules.is_open('2025-12-15T09:30:00Z')           # Monday 01:30, Sunday's late shift
+    assert rules.router().route(_call('CAL1', start_time='2025-12-20T20:00:00Z'))[0] == 'outside_business_hours'
+
+
+def test_repeated_hangups_exclude_the_caller():
+    router = _rules().router()
+    number = '+15550009999'
+    calls = [_call(f'CAL{i}', customer_phone_number=number, duration=3) for i in range(2)]
+    # Overlapping fetches return the same hangup twice
+    calls.append(dict(calls[1]))
+    calls.append(_call('CAL9', customer_phone_number=number))
+
+    assert router.route_batch(calls) == []
+    assert router.rejected == {'too_short': 3, 'repeated_hangups': 1}
+
+
+def test_unreadable_duration_is_treated_as_missing():
+    router = _rules().router()
+    calls = [_call('CAL1', duration=''), _call('CAL2', duration='n/a'), _call('CAL3', duration='12')]
+
+    assert [call['id'] for call, _, _ in router.route_batch(calls)] == ['CAL1', 'CAL2']
+    assert router.rejected == {'too_short': 1}
+
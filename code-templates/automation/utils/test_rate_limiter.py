@@ -0,0 +1,81 @@
+import pytest
+
+from automation.utils.rate_limiter import (
+    LANE_BACKFILL,
+    LANE_LIVE,
+    Bucket,
+    RateLimiter,
+    RateLimitExceeded
+)
+
+NOW = 1_000_000.0
+
+
+def _limiter(tmp_path, **kwargs):
+    return RateLimiter(str(tmp_path / 'rate_limits.sqlite3'), **kwargs)
+
+
+def test_bucket_never_exceeds_limit_per_window():
+    bucket = Bucket('callrail:1', 1000, 3600)
+
+    # Full burst plus a whole window of refill is exactly the limit
+    assert bucket.capacity + bucket.refill_per_second * 3600 == pytest.approx(1000)
+
+
+def test_burst_then_wait(tmp_path):
+    limiter = _limiter(tmp_path)
+    demands = [(Bucket('google_ads:customer:1', 600, 60), 1)]
+
+    for _ in range(60):
+        assert limiter._try_acquire(demands, LANE_LIVE, NOW) == 0
+    # Refill is 9 tokens per second
+    assert limiter._try_acquire(demands, LANE_LIVE, NOW) == pytest.approx(1 / 9)
+    assert limiter._try_acquire(demands, LANE_LIVE, NOW + 1) == 0
+
+
+def test_buckets_are_shared_between_limiters(tmp_path):
+    demands = [(Bucket('callrail:1', 100, 3600), 1)]
+    first, second = _limiter(tmp_path), _limiter(tmp_path)
+
+    for _ in range(10):
+        assert first._try_acquire(demands, LANE_LIVE, NOW) == 0
+    assert second._try_acquire(demands, LANE_LIVE, NOW) > 0
+
+
+def test_backfill_leaves_reserve_and_yields_to_waiting_live(tmp_path):
+    limiter = _limiter(tmp_path, backfill_reserve=0.5)
+    bucket = Bucket('callrail:1', 100, 3600)
+
+    # Backfill stops at half the bucket; live can still take the rest
+    taken = 0
+    while limiter._try_acquire([(bucket, 1)], LANE_BACKFILL, NOW) == 0:
+        taken += 1
+    assert taken == 5
+    for _ in range(5):
+        assert limiter._try_acquire([(bucket, 1)], LANE_LIVE, NOW) == 0
+
+    # A waiting live request holds backfill off until it has gone
+    live_wait = limiter._try_acquire([(bucket, 1)], LANE_LIVE, NOW)
+    assert live_wait > 0
+    assert limiter._try_acquire([(bucket, 1)], LANE_BACKFILL, NOW + 100) > 0
+
+
+def test_requests_larger_than_bucket_wait_for_full_bucket(tmp_path):
+    limiter = _limiter(tmp_path)
+    bucket = Bucket('google_ads:ops', 15000, 86400)
+
+    assert limiter._try_acquire([(bucket, 2000)], LANE_LIVE, NOW) == 0
+    # The bucket is in debt: the next request waits for it to refill
+    assert limiter._try_acquire([(bucket, 1)], LANE_LIVE, NOW) > 0
+
+
+def test_acquire_raises_when_wait_exceeds_maximum(tmp_path):
+    limiter = _limiter(tmp_path, max_wait_seconds=1)
+    demands = [(Bucket('callrail:1', 10, 3600), 1)]
+
+    assert limiter.acquire(demands) == 0
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(demands)
+
+    metrics = limiter.stats.render_prometheus()
+    assert 'rate_limit_wait_seconds_count{api="callrail",lane="live"} 2' in metrics
@@ -0,0 +1,106 @@
+import os
+import random
+
+from automation.utils.retry_queue import (
+    ERROR_DELAYED,
+    ERROR_DUPLICATE,
+    ERROR_PERMANENT,
+    ERROR_RATE_LIMITED,
+    ERROR_TRANSIENT,
+    RetryQueue,
+    backoff_delay,
+    classify_error
+)
+
+ACTION_ID = '987654321'
+
+
+def _row(ref, gclid):
+    return ref, {'gclid': gclid, 'conversion_date_time': '2025-12-19 10:30:00-0800', 'call_id': ref}
+
+
+def _failure(ref, code):
+    return {'ref': ref, 'gclid': 'x', 'errors': [{'code': code, 'message': 'test'}]}
+
+
+def test_classify_error():
+    assert classify_error('quota_error.RESOURCE_EXHAUSTED') == ERROR_RATE_LIMITED
+    assert classify_error('internal_error.INTERNAL_ERROR') == ERROR_TRANSIENT
+    assert classify_error('transport.UNAVAILABLE') == ERROR_TRANSIENT
+    assert classify_error('conversion_upload_error.TOO_RECENT_EVENT') == ERROR_DELAYED
+    assert classify_error('conversion_upload_error.EXPIRED_EVENT') == ERROR_PERMANENT
+    assert classify_error('conversion_upload_error.UNPARSEABLE_GCLID') == ERROR_PERMANENT
+    assert classify_error('conversion_upload_error.CLICK_CONVERSION_ALREADY_EXISTS') == ERROR_DUPLICATE
+
+
+def test_backoff_grows_and_is_capped():
+    rng = random.Random(0)
+    delays = [backoff_delay(ERROR_TRANSIENT, attempts, rng) for attempts in range(1, 12)]
+
+    assert 30 <= delays[0] <= 60
+    assert 60 <= delays[1] <= 120
+    assert max(delays) <= 3600
+
+
+def test_failures_are_scheduled_dead_lettered_and_settled(tmp_path):
+    queue = RetryQueue(str(tmp_path))
+    batch = [_row('CAL1', 'GCLID_A'), _row('CAL2', 'GCLID_B'), _row('CAL3', 'GCLID_C')]
+    failures = [
+        _failure('CAL1', 'quota_error.RESOURCE_EXHAUSTED'),
+        _failure('CAL2', 'conversion_upload_error.EXPIRED_EVENT')
+    ]
+
+    outcome = queue.record_batch(batch, failures, ACTION_ID, now=1000)
+
+    assert (outcome.scheduled, outcome.dead_lettered) == (1, 1)
+    assert queue.due(now=1000) == []
+    assert queue.due(now=1000 + 300) == [batch[0]]
+    assert [entry['ref'] for entry in queue.dead_letters()] == ['CAL2']
+
+    queue.record_batch([batch[0]], [], ACTION_ID, now=2000)
+    assert len(queue) == 0
+
+
+def test_rows_are_dead_lettered_after_max_attempts(tmp_path):
+    queue = RetryQueue(str(tmp_path), max_attempts=3)
+    batch = [_row('CAL1', 'GCLID_A')]
+    failures = [_failure('CAL1', 'internal_error.INTERNAL_ERROR')]
+
+    assert queue.record_batch(batch, failures, ACTION_ID).scheduled == 1
+    assert queue.record_batch(batch, failures, ACTION_ID).scheduled == 1
+    assert queue.record_batch(batch, failures, ACTION_ID).dead_lettered == 1
+    assert queue.dead_letters()[0]['attempts'] == 3
+
+
+def test_resume_after_torn_write(tmp_path):
+    queue = RetryQueue(str(tmp_path))
+    batch = [_row('CAL1', 'GCLID_A'), _row('CAL2', 'GCLID_B')]
+    queue.record_batch(batch, [_failure(ref, 'transport.UNAVAILABLE') for ref, _ in batch], ACTION_ID)
+    queue.close()
+
+    # Simulate a crash half way through the next write
+    segment = os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[0])
+    with open(segment, 'ab') as f:
+        f.write(b'0badc0de {"op": "done", "key"')
+
+    resumed = RetryQueue(str(tmp_path))
+    assert len(resumed) == 2
+
+    resumed.record_batch([batch[0]], [], ACTION_ID)
+    resumed.close()
+    assert len(RetryQueue(str(tmp_path))) == 1
+
+
+def test_segments_roll_and_compact(tmp_path):
+    queue = RetryQueue(str(tmp_path), segment_max_bytes=512)
+    batch = [_row(f'CAL{i}', f'GCLID_{i}') for i in range(20)]
+    queue.record_batch(batch, [_failure(ref, 'transport.UNAVAILABLE') for ref, _ in batch], ACTION_ID)
+    for row in batch[:-1]:
+        queue.record_batch([row], [], ACTION_ID)
+
+    assert queue.compact() > 1
+    assert len(queue) == 1
+    queue.close()
+
+    resumed = RetryQueue(str(tmp_path))
+    assert [ref for ref, _ in resumed.due(now=float('inf'))] == ['CAL19']
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+import pytest
+
+from automation.utils.timestamps import (
+    QUALIFICATION_RULES_FILE, InvalidTimestamp, TimestampNormalizer, rules_timezone
+)
+
+
+def test_iso_and_callrail_timestamps():
+    normalizer = TimestampNormalizer()
+
+    assert normalizer.normalize('2025-12-19T18:30:00Z') == '2025-12-19 18:30:00+00:00'
+    assert normalizer.normalize('2025-12-19T10:30:00.123-08:00') == '2025-12-19 10:30:00-08:00'
+    assert normalizer.normalize('2025-12-19 10:30:00-0800') == '2025-12-19 10:30:00-08:00'
+    assert normalizer.normalize('2025-12-19T10:30:00.12-08:00') == '2025-12-19 10:30:00-08:00'
+    assert normalizer.normalize(' 2025-12-19T10:30:00+0530 ') == '2025-12-19 10:30:00+05:30'
+    # No offset: the normalizer's timezone (UTC by default)
+    assert normalizer.normalize('2025-12-19 18:30:00') == '2025-12-19 18:30:00+00:00'
+    # Parquet / Arrow timestamp and date columns
+    assert normalizer.normalize(datetime(2025, 12, 19, 18, 30)) == '2025-12-19 18:30:00+00:00'
+    assert normalizer.normalize(date(2025, 12, 19)) == '2025-12-19 00:00:00+00:00'
+
+
+def test_crm_layouts_in_local_timezone():
+    normalizer = TimestampNormalizer('America/Los_Angeles')
+
+    assert normalizer.normalize('12/19/2025 2:05 PM') == '2025-12-19 14:05:00-08:00'
+    assert normalizer.normalize('12/19/2025 12:05 AM') == '2025-12-19 00:05:00-08:00'
+    assert normalizer.normalize('2025/07/01 09:00:00') == '2025-07-01 09:00:00-07:00'
+    assert normalizer.normalize(' 19-Dec-2025 ') == '2025-12-19 00:00:00-08:00'
+
+
+def test_batch_reports_rejected_rows():
+    normalizer = TimestampNormalizer('America/Los_Angeles')
+
+    normalized, errors = normalizer.normalize_many(
+        ['2025-12-19 10:30:00', '02/30/2025', '', 'soon', '12/19/2025 10:30 AM']
+    )
+
+    assert normalized == ['2025-12-19 10:30:00-08:00', None, None, None, '2025-12-19 10:30:00-08:00']
+    assert sorted(errors) == [1, 2, 3]
+    with pytest.raises(InvalidTimestamp):
+        normalizer.normalize('13/45/2025')
+
+
+def test_clinic_timezone_comes_from_qualification_rules():
+    assert rules_timezone(QUALIFICATION_RULES_FILE) == 'America/Los_Angeles'
+    assert rules_timezone(None) is None
+    assert rules_timezone('off') is None
+    assert rules_timezone('/nonexistent/rules.json') is None
@@ -0,0 +1,116 @@
+from upload_ledger import UploadLedger, conversion_key
+
+
+def _row(ref, gclid, call_id=None):
+    conversion = {'gclid': gclid, 'conversion_date_time': '2025-12-19 10:30:00-0800'}
+    if call_id:
+        conversion['call_id'] = call_id
+    return ref, conversion
+
+
+def test_acknowledged_rows_are_skipped(tmp_path):
+    ledger = UploadLedger(str(tmp_path / 'ledger.sqlite3'))
+    batch = [_row(1, 'GCLID_A'), _row(2, 'GCLID_B')]
+    failures = [{'ref': 2, 'gclid': 'GCLID_B', 'errors': [{'code': 'x', 'message': 'y'}]}]
+    ledger.record_batch(batch, failures, '987654321')
+
+    pending = ledger.filter_new(batch, '987654321')
+
+    assert [ref for ref, _ in pending] == [2]
+    assert ledger.skipped == 1
+    assert ledger.failed_conversions() == [batch[1]]
+
+
+def test_call_id_lookup(tmp_path):
+    ledger = UploadLedger(str(tmp_path / 'ledger.sqlite3'))
+    ledger.record_batch([_row('CAL1', 'GCLID_A', 'CAL1')], [], '987654321')
+
+    # Same call, different timestamp formatting
+    ref, conversion = _row('CAL1', 'GCLID_A', 'CAL1')
+    conversion['conversion_date_time'] = '2025-12-19 18:30:00+0000'
+
+    assert ledger.filter_new([(ref, conversion)], '987654321') == []
+
+
+def test_conversion_key_uses_default_action():
+    _, conversion = _row(1, 'GCLID_A')
+    assert conversion_key(conversion, '42') == 'GCLID_A|42|2025-12-19 10:30:00-0800'
+
+
+def test_compact_removes_old_entries(tmp_path):
+    ledger = UploadLedger(str(tmp_path / 'ledger.sqlite3'))
+    ledger.record_batch([_row(1, 'GCLID_A')], [], '987654321')
+
+    assert ledger.compact(max_age_days=-1) == 1
+    assert ledger.filter_new([_row(1, 'GCLID_A')], '987654321') != []
+
+
+def test_bloom_filter_skips_lookups_for_new_rows(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite3')
+    ledger = UploadLedger(path, bloom_capacity=1000)
+    ledger.record_batch([_row(1, 'GCLID_A', 'CAL1')], [], '987654321')
+    rows = [_row(1, 'GCLID_A', 'CAL1')] + [_row(i, f'GCLID_{i}') for i in range(2, 50)]
+
+    pending = ledger.filter_new(rows, '987654321')
+
+    assert len(pending) == 48
+    assert ledger.stats.duplicates == 1
+    assert ledger.stats.filtered >= 47
+    assert ledger.stats.false_positives == ledger.stats.lookups - 1
+    ledger.close()
+
+    # Reopened from the memory-mapped file, not rebuilt
+    ledger = UploadLedger(path, bloom_capacity=1000)
+    assert not ledger.bloom.created
+    assert ledger.filter_new([_row(9, 'GCLID_A', 'CAL1')], '987654321') == []
+    ledger.close()
+
+
+def test_bloom_filter_is_rebuilt_from_the_database(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite3')
+    ledger = UploadLedger(path, bloom_capacity=0)
+    ledger.record_batch([_row(1, 'GCLID_A', 'CAL1')], [], '987654321')
+    ledger.close()
+
+    # Different size: the old filter is discarded and refilled from SQLite
+    ledger = UploadLedger(path, bloom_capacity=1000)
+    assert ledger.bloom.created
+    assert 'call:CAL1' in ledger.bloom
+
+    ref, conversion = _row('CAL1', 'GCLID_A', 'CAL1')
+    conversion['conversion_date_time'] = '2025-12-19 18:30:00+0000'
+    assert ledger.filter_new([(ref, conversion)], '987654321') == []
+    assert ledger.stats.filtered == 0
+
+
+def test_uploaded_values_and_adjustments(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / 'ledger.sqlite3')
+    # A ledger created before values were kept
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE conversions (conversion_key TEXT PRIMARY KEY, call_id TEXT, status TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 1, last_error TEXT, payload TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO conversions VALUES ('GCLID_OLD|42|2025-12-01 09:00:00-0800', NULL, "
+                 "'acknowledged', 1, NULL, NULL, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    ledger = UploadLedger(path)
+    ref, conversion = _row(1, 'GCLID_A')
+    conversion['conversion_value'] = '150'
+    ledger.record_batch([(ref, conversion)], [], '42')
+
+    assert ledger.uploaded_conversions('GCLID_A', '42') == [('2025-12-19 10:30:00-0800', 150.0, 'acknowledged')]
+    assert ledger.uploaded_conversions('GCLID_OLD', '42') == [('2025-12-01 09:00:00-0800', None, 'acknowledged')]
+    assert ledger.uploaded_conversions('GCLID_A', '4') == []
+
+    ledger.record_adjustments([(conversion_key(conversion, '42'), 4500.0)])
+    assert ledger.uploaded_conversions('GCLID_A', '42')[0][1] == 4500.0
+
+    ledger.record_adjustments([(conversion_key(conversion, '42'), None)])
+    assert ledger.uploaded_conversions('GCLID_A', '42')[0][2] == 'retracted'
+    assert ledger.filter_new([(ref, conversion)], '42') == []
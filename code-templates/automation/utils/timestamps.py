@@ -0,0 +1,286 @@
+"""
+Timestamps: Bulk normalization of conversion times to the Google Ads format
+
+Google Ads expects conversion_date_time as "yyyy-mm-dd hh:mm:ss+|-hh:mm".
+TimestampNormalizer accepts what CallRail and CRM exports produce:
+
+- ISO 8601 with or without an offset ("2025-12-19T18:30:00Z",
+  "2025-12-19 10:30:00-08:00", "2025-12-19 10:30:00-0800", "2025-12-19"),
+- common CRM layouts ("12/19/2025 10:30 AM", "2025/12/19 10:30:00", ...),
+- datetime and date values (Parquet / Arrow timestamp columns).
+
+Timestamps without an offset are read in the normalizer's timezone: UTC
+for CallRail, and for CSV uploads CONVERSION_TIMEZONE or the clinic's
+business_hours timezone from the configured QUALIFICATION_RULES_PATH file.
+
+The hot path is two C calls per value (datetime.fromisoformat and
+datetime.isoformat). ISO values that fromisoformat() rejects before Python
+3.11 ('Z', offsets without a colon, fractions of other than 3 or 6 digits)
+are parsed by a regular expression instead. Timezones are cached. CRM layouts are compiled to
+regular expressions once and the layout that parsed the previous value is
+tried first, so a CRM export costs one regex match per row instead of a
+strptime call per layout tried.
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+QUALIFICATION_RULES_FILE = os.path.join(
+    os.path.dirname(__file__), '../../../configuration/callrail/qualification-rules.json'
+)
+
+# Non-ISO layouts seen in CRM exports, tried in order
+CRM_FORMATS = (
+    '%m/%d/%Y %I:%M %p',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%m/%d/%y %I:%M %p',
+    '%m/%d/%y %H:%M',
+    '%m/%d/%y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%d-%b-%Y %H:%M:%S',
+    '%d-%b-%Y',
+    '%b %d, %Y %I:%M %p',
+    '%b %d, %Y',
+)
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1
+)}
+
+_DIRECTIVES = {
+    'Y': r'(?P<year>\d{4})',
+    'y': r'(?P<year2>\d{2})',
+    'm': r'(?P<month>\d{1,2})',
+    'b': r'(?P<month_name>[A-Za-z]{3})',
+    'd': r'(?P<day>\d{1,2})',
+    'H': r'(?P<hour>\d{1,2})',
+    'I': r'(?P<hour12>\d{1,2})',
+    'M': r'(?P<minute>\d{2})',
+    'S': r'(?P<second>\d{2})',
+    'p': r'(?P<ampm>[AaPp][Mm])',
+}
+
+
+# ISO 8601 as written by CallRail and CRMs, including the forms
+# datetime.fromisoformat() only accepts from Python 3.11
+_ISO = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?'
+    r'\s*(?:(Z)|([+-])(\d{2}):?(\d{2}))?',
+    re.IGNORECASE
+)
+
+
+class InvalidTimestamp(ValueError):
+    """Raised when a value is not a recognizable date/time"""
+
+
+def _compile_layout(fmt):
+    """Return a parser for one strptime-style layout (None if it does not match)"""
+    pattern = re.sub(r'%(.)', lambda m: _DIRECTIVES[m.group(1)], re.escape(fmt).replace('\\%', '%'))
+    match = re.compile(pattern.replace('\\ ', r'\s+')).fullmatch
+
+    def parse(value):
+        found = match(value)
+        if found is None:
+            return None
+        fields = found.groupdict()
+        year = int(fields['year']) if fields.get('year') else 2000 + int(fields['year2'])
+        if fields.get('month_name'):
+            month = _MONTHS.get(fields['month_name'].lower())
+            if month is None:
+                return None
+        else:
+            month = int(fields['month'])
+        if fields.get('hour12'):
+            hour = int(fields['hour12'])
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if fields['ampm'].lower() == 'pm' else 0)
+        else:
+            hour = int(fields.get('hour') or 0)
+        try:
+            return datetime(year, month, int(fields['day']), hour,
+                            int(fields.get('minute') or 0), int(fields.get('second') or 0))
+        except ValueError:
+            # Matched the layout but is not a real date (e.g. 02/30/2025)
+            return None
+
+    return parse
+
+
+_LAYOUTS = [_compile_layout(fmt) for fmt in CRM_FORMATS]
+
+
+def _parse_iso(value):
+    """Parse an ISO 8601 date/time (None if it is not one)"""
+    found = _ISO.fullmatch(value)
+    if found is None:
+        return None
+    year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = found.groups()
+    tz = None
+    if utc:
+        tz = timezone.utc
+    elif sign:
+        offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+        tz = timezone(-offset if sign == '-' else offset)
+    try:
+        return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                        int((fraction or '0')[:6].ljust(6, '0')), tz)
+    except ValueError:
+        # Not a real date or offset (e.g. 2025-02-30, +25:00)
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """
+    Return the tzinfo for an IANA name (cached: one object per name)
+
+    Raises:
+        InvalidTimestamp if the name is unknown
+    """
+    if name.upper() in ('UTC', 'Z', 'ETC/UTC'):
+        return timezone.utc
+    if ZoneInfo is None:
+        raise InvalidTimestamp(f"Timezone {name!r} needs Python 3.9+ (zoneinfo)")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise InvalidTimestamp(f"Unknown timezone: {name!r}")
+
+
+def rules_timezone(path):
+    """
+    Return the business_hours timezone from a qualification-rules.json file
+
+    Args:
+        path: Configured rules file (QUALIFICATION_RULES_PATH); None or
+              "off" means no rules
+
+    Returns:
+        IANA timezone name, or None if no file is configured or the file or
+        setting is missing
+    """
+    if not path or path.lower() in ('off', 'none', 'false', '0'):
+        return None
+    try:
+        with open(path) as f:
+            rules = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return rules.get('qualification_rules', {}).get('business_hours', {}).get('timezone')
+
+
+class TimestampNormalizer:
+    """
+    Convert date/time strings to the Google Ads conversion_date_time format
+
+    Args:
+        default_timezone: IANA name or tzinfo for values without an offset
+                          (default UTC)
+    """
+
+    def __init__(self, default_timezone=None):
+        if default_timezone is None:
+            default_timezone = timezone.utc
+        elif isinstance(default_timezone, str):
+            default_timezone = get_timezone(default_timezone)
+        self.timezone = default_timezone
+        self._last_layout = _LAYOUTS[0]
+
+    def _parse_crm(self, value):
+        stripped = value.strip()
+
+        # Rows of one export share a layout: try the last one that matched first
+        dt = self._last_layout(stripped)
+        if dt is not None:
+            return dt
+        # Padded ISO values, and ISO forms fromisoformat() rejects
+        dt = _parse_iso(stripped)
+        if dt is not None:
+            return dt
+        for layout in _LAYOUTS:
+            dt = layout(stripped)
+            if dt is not None:
+                self._last_layout = layout
+                return dt
+        raise InvalidTimestamp(f"Unrecognized date/time: {value!r}")
+
+    def _parse_other(self, value):
+        # datetime / date values come from Parquet and Arrow timestamp columns
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        if not isinstance(value, str):
+            raise InvalidTimestamp(f"Unrecognized date/time: {value!r}")
+        return self._parse_crm(value)
+
+    def normalize(self, value):
+        """
+        Normalize one value
+
+        Returns:
+            "yyyy-mm-dd hh:mm:ss+hh:mm"
+
+        Raises:
+            InvalidTimestamp if the value cannot be parsed
+        """
+        if not value:
+            raise InvalidTimestamp("Missing conversion_date_time")
+        try:
+            dt = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            dt = self._parse_other(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=self.timezone)
+        return dt.isoformat(' ', 'seconds')
+
+    def normalize_many(self, values):
+        """
+        Normalize a batch of values
+
+        Returns:
+            Tuple of (normalized, errors): ``normalized`` has one entry per
+            value (None where it was rejected) and ``errors`` maps the index
+            of each rejected value to the reason
+        """
+        # Bind lookups once for the batch; this loop runs once per row
+        fromisoformat = datetime.fromisoformat
+        tz = self.timezone
+        normalized = []
+        append = normalized.append
+        errors = {}
+
+        for index, value in enumerate(values):
+            try:
+                dt = fromisoformat(value)
+            except (TypeError, ValueError):
+                try:
+                    if not value:
+                        raise InvalidTimestamp("Missing conversion_date_time")
+                    dt = self._parse_other(value)
+                except InvalidTimestamp as e:
+                    errors[index] = str(e)
+                    append(None)
+                    continue
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=tz)
+            append(dt.isoformat(' ', 'seconds'))
+
+        return normalized, errors
+
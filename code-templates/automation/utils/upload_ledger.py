@@ -0,0 +1,437 @@
+"""
+Upload Ledger: Durable record of every conversion sent to Google Ads
+
+Rows are keyed by (gclid, conversion_action, conversion_date_time) (the
+hashed phone number stands in for the GCLID of enhanced conversions for
+leads) and indexed by CallRail call ID, so the uploader can skip conversions Google Ads
+already acknowledged and retry only the ones that failed. Acknowledged rows
+keep the value Google Ads has, so later CRM values can be diffed against it
+and sent as adjustments (see conversion_upload/adjustments.py).
+
+A Bloom filter (bloom_filter.py, memory-mapped next to the database as
+<ledger>.bloom) holds the key and call ID of every acknowledged or
+dead-lettered row, so filter_new() only queries SQLite for rows the filter
+may have seen. Keys are added to the filter before the database commit and
+the filter is rebuilt from the database whenever its file is missing or
+full, so it never misses a recorded row.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+from automation.utils.bloom_filter import BloomFilter
+from automation.utils.settings import env_float, env_int, env_str
+
+# Ledger file without UPLOAD_LEDGER_PATH or a tenant state_dir
+DEFAULT_LEDGER_FILE = os.path.join(os.path.dirname(__file__), '../../../.upload_ledger.sqlite3')
+
+# Bloom filter size in items (one per key and one per call ID; doubled while
+# the ledger holds more rows; 0 disables the filter) and its false positive
+# rate (LEDGER_BLOOM_CAPACITY, LEDGER_BLOOM_ERROR_RATE)
+DEFAULT_BLOOM_CAPACITY = 1000000
+DEFAULT_BLOOM_ERROR_RATE = 0.001
+
+# GCLIDs can only be uploaded within 90 days of the click
+GCLID_WINDOW_DAYS = 90
+
+STATUS_ACKNOWLEDGED = 'acknowledged'
+STATUS_FAILED = 'failed'
+# Rejected for good (see retry_queue): never uploaded again
+STATUS_DEAD_LETTER = 'dead_letter'
+# Withdrawn with a RETRACTION adjustment: never uploaded again
+STATUS_RETRACTED = 'retracted'
+
+# Statuses filter_new() treats as done
+_DONE_STATUSES = (STATUS_ACKNOWLEDGED, STATUS_DEAD_LETTER, STATUS_RETRACTED)
+
+# Keep IN (...) lists under SQLite's default host parameter limit
+_LOOKUP_CHUNK = 400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversions (
+    conversion_key TEXT PRIMARY KEY,
+    call_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    last_error TEXT,
+    payload TEXT,
+    conversion_value REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversions_call_id ON conversions (call_id);
+CREATE INDEX IF NOT EXISTS idx_conversions_status ON conversions (status);
+CREATE INDEX IF NOT EXISTS idx_conversions_created_at ON conversions (created_at);
+"""
+
+
+def conversion_key(conversion, default_conversion_action_id=None):
+    """
+    Build the idempotency key of a conversion dict
+
+    Returns:
+        "gclid|conversion_action_id|conversion_date_time", with
+        "phone:<hashed_phone_number>" in place of a missing GCLID
+    """
+    action_id = conversion.get('conversion_action_id') or default_conversion_action_id
+    identity = conversion.get('gclid') or f"phone:{conversion['hashed_phone_number']}"
+    return f"{identity}|{action_id}|{conversion['conversion_date_time']}"
+
+
+def _value(conversion):
+    """The conversion_value Google Ads records for a conversion dict (None if unreadable)"""
+    value = conversion.get('conversion_value')
+    try:
+        return float(value) if value not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        return None
+
+
+def _call_token(call_id):
+    return f"call:{call_id}"
+
+
+class DedupStats:
+    """
+    Counters for UploadLedger.filter_new()
+
+    Attributes:
+        checked: Rows checked
+        filtered: Rows the Bloom filter cleared without a database lookup
+        lookups: Rows looked up in the database
+        duplicates: Rows dropped as already acknowledged, dead-lettered or retracted
+        repeats: Rows dropped as repeated within the run (counted by the uploader)
+    """
+
+    def __init__(self, bloom=True):
+        self.bloom = bloom
+        self.checked = 0
+        self.filtered = 0
+        self.lookups = 0
+        self.duplicates = 0
+        self.repeats = 0
+
+    @property
+    def false_positives(self):
+        """Rows the Bloom filter sent to the database that turned out to be new"""
+        return self.lookups - self.duplicates
+
+    def as_dict(self):
+        counts = {name: value for name, value in vars(self).items() if name != 'bloom'}
+        return {**counts, 'false_positives': self.false_positives}
+
+    def __str__(self):
+        checked = self.checked or 1
+        text = (
+            f"{self.checked} checked, {self.duplicates} already uploaded, {self.repeats} repeated in run "
+            f"({100 * (self.duplicates + self.repeats) / checked:.1f}% duplicates)"
+        )
+        if not self.bloom:
+            return text + "; no Bloom filter"
+        return (
+            f"{text}; {100 * self.filtered / checked:.1f}% cleared by the Bloom filter, "
+            f"{self.false_positives} false positives"
+        )
+
+
+def _chunks(items, size=_LOOKUP_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UploadLedger:
+    """
+    SQLite (WAL mode) ledger of uploaded and failed conversions
+
+    A ledger object must be used from the thread that created it.
+
+    Args:
+        path: Database file (default: UPLOAD_LEDGER_PATH or .upload_ledger.sqlite3)
+        bloom_capacity: Bloom filter size in items (default:
+                        LEDGER_BLOOM_CAPACITY; 0 = no filter)
+    """
+
+    def __init__(self, path=None, bloom_capacity=None):
+        self.path = path or env_str('UPLOAD_LEDGER_PATH', DEFAULT_LEDGER_FILE)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(conversions)")}
+        if 'conversion_value' not in columns:
+            # Ledgers created before adjustments: values of older rows are unknown (NULL)
+            self.conn.execute("ALTER TABLE conversions ADD COLUMN conversion_value REAL")
+        self.conn.commit()
+
+        # Rows skipped by filter_new() since the ledger was opened
+        self.skipped = 0
+
+        self.bloom = None
+        if bloom_capacity is None:
+            bloom_capacity = env_int('LEDGER_BLOOM_CAPACITY', DEFAULT_BLOOM_CAPACITY)
+        self._open_bloom(bloom_capacity)
+        self.stats = DedupStats(bloom=self.bloom is not None)
+
+    def _open_bloom(self, capacity):
+        """Open the Bloom filter next to the database, rebuilding it if needed"""
+        bloom_path = self.path + '.bloom'
+        if capacity <= 0:
+            # A filter left behind would miss the rows recorded meanwhile
+            if os.path.exists(bloom_path):
+                os.remove(bloom_path)
+            return
+
+        # Two items per row; double the size in steps so it stays stable between runs
+        rows = self.conn.execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+        while capacity < 2 * rows:
+            capacity *= 2
+
+        error_rate = env_float('LEDGER_BLOOM_ERROR_RATE', DEFAULT_BLOOM_ERROR_RATE)
+        self.bloom = BloomFilter(bloom_path, capacity, error_rate)
+        if self.bloom.saturated:
+            # Compacted rows still count; start over from the database
+            self.bloom.close()
+            os.remove(bloom_path)
+            self.bloom = BloomFilter(bloom_path, capacity, error_rate)
+
+        if self.bloom.created:
+            done = self.conn.execute(
+                "SELECT conversion_key, call_id FROM conversions WHERE status IN (?, ?, ?)",
+                _DONE_STATUSES
+            )
+            add = self.bloom.add
+            for key, call_id in done:
+                add(key)
+                if call_id:
+                    add(_call_token(call_id))
+            self.bloom.flush()
+
+    def acknowledged(self, keys=(), call_ids=(), statuses=(STATUS_ACKNOWLEDGED,)):
+        """
+        Batch lookup of already-acknowledged conversions
+
+        Args:
+            keys: Conversion keys to check
+            call_ids: CallRail call IDs to check
+            statuses: Statuses that count as done
+
+        Returns:
+            Tuple of (acknowledged_keys, acknowledged_call_ids) sets
+        """
+        found_keys = set()
+        found_call_ids = set()
+        status_list = ','.join('?' * len(statuses))
+
+        for chunk in _chunks(list(keys)):
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT conversion_key FROM conversions "
+                f"WHERE status IN ({status_list}) AND conversion_key IN ({placeholders})",
+                [*statuses, *chunk]
+            )
+            found_keys.update(row[0] for row in rows)
+
+        for chunk in _chunks([str(call_id) for call_id in call_ids]):
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT call_id FROM conversions "
+                f"WHERE status IN ({status_list}) AND call_id IN ({placeholders})",
+                [*statuses, *chunk]
+            )
+            found_call_ids.update(row[0] for row in rows)
+
+        return found_keys, found_call_ids
+
+    def filter_new(self, rows, default_conversion_action_id=None):
+        """
+        Drop (ref, conversion) pairs that were already acknowledged, dead-lettered or retracted
+
+        Args:
+            rows: List of (ref, conversion) pairs from one batch
+
+        Returns:
+            List of the pairs that still need uploading
+        """
+        keys = [conversion_key(conversion, default_conversion_action_id) for _, conversion in rows]
+
+        # Rows the Bloom filter has never seen are new; only the rest are looked up
+        bloom = self.bloom
+        if bloom is None:
+            maybe_seen = [True] * len(rows)
+        else:
+            maybe_seen = [
+                key in bloom or bool(conversion.get('call_id') and _call_token(conversion['call_id']) in bloom)
+                for key, (_, conversion) in zip(keys, rows)
+            ]
+        lookup_keys = [key for key, seen in zip(keys, maybe_seen) if seen]
+        call_ids = [
+            conversion['call_id'] for seen, (_, conversion) in zip(maybe_seen, rows)
+            if seen and conversion.get('call_id')
+        ]
+        done_keys, done_call_ids = set(), set()
+        if lookup_keys:
+            done_keys, done_call_ids = self.acknowledged(
+                lookup_keys, call_ids, _DONE_STATUSES
+            )
+
+        pending = []
+        for key, (ref, conversion) in zip(keys, rows):
+            call_id = conversion.get('call_id')
+            if key in done_keys or (call_id and str(call_id) in done_call_ids):
+                self.skipped += 1
+                continue
+            pending.append((ref, conversion))
+
+        stats = self.stats
+        stats.checked += len(rows)
+        stats.lookups += len(lookup_keys)
+        stats.filtered += len(rows) - len(lookup_keys)
+        stats.duplicates += len(rows) - len(pending)
+        return pending
+
+    def record_batch(self, batch, failures, default_conversion_action_id=None):
+        """
+        Record the outcome of one upload request
+
+        Args:
+            batch: List of (ref, conversion) pairs that were sent
+            failures: Failure dicts ({'ref', 'gclid', 'errors'}) for the batch
+        """
+        errors_by_ref = {failure['ref']: failure['errors'] for failure in failures}
+        now = time.time()
+        bloom = self.bloom
+
+        records = []
+        for ref, conversion in batch:
+            errors = errors_by_ref.get(ref)
+            call_id = conversion.get('call_id')
+            key = conversion_key(conversion, default_conversion_action_id)
+            if bloom is not None and not errors:
+                bloom.add(key)
+                if call_id:
+                    bloom.add(_call_token(call_id))
+            records.append((
+                key,
+                str(call_id) if call_id else None,
+                STATUS_FAILED if errors else STATUS_ACKNOWLEDGED,
+                json.dumps(errors) if errors else None,
+                json.dumps({'ref': ref, 'conversion': conversion}, default=str) if errors else None,
+                _value(conversion),
+                now,
+                now
+            ))
+
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO conversions
+                    (conversion_key, call_id, status, last_error, payload, conversion_value, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (conversion_key) DO UPDATE SET
+                    call_id = COALESCE(excluded.call_id, conversions.call_id),
+                    status = excluded.status,
+                    attempts = conversions.attempts + 1,
+                    last_error = excluded.last_error,
+                    payload = excluded.payload,
+                    conversion_value = excluded.conversion_value,
+                    updated_at = excluded.updated_at
+                """,
+                records
+            )
+
+    def set_status(self, keys, status):
+        """
+        Change the status of recorded conversions
+
+        Used once the retry queue has settled a failure: duplicates become
+        acknowledged, permanent failures dead_letter.
+        """
+        now = time.time()
+        keys = list(keys)
+        if self.bloom is not None and status in _DONE_STATUSES:
+            self.bloom.update(keys)
+            for chunk in _chunks(keys):
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT call_id FROM conversions WHERE call_id IS NOT NULL AND conversion_key IN ({placeholders})",
+                    chunk
+                )
+                self.bloom.update(_call_token(call_id) for (call_id,) in rows)
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE conversions SET status = ?, payload = NULL, updated_at = ? WHERE conversion_key = ?",
+                [(status, now, key) for key in keys]
+            )
+
+    def uploaded_conversions(self, gclid, conversion_action_id):
+        """
+        Acknowledged and retracted conversions of one click for one conversion action
+
+        Returns:
+            List of (conversion_date_time, conversion_value, status) tuples,
+            newest upload first; conversion_value is None for rows recorded
+            before values were kept
+        """
+        # Keys start with "gclid|action|": a range scan of the primary key
+        prefix = f"{gclid}|{conversion_action_id}|"
+        rows = self.conn.execute(
+            "SELECT conversion_key, conversion_value, status FROM conversions "
+            "WHERE conversion_key >= ? AND conversion_key < ? AND status IN (?, ?) ORDER BY created_at DESC",
+            (prefix, prefix[:-1] + '}', STATUS_ACKNOWLEDGED, STATUS_RETRACTED)
+        )
+        return [(key[len(prefix):], value, status) for key, value, status in rows]
+
+    def record_adjustments(self, adjustments):
+        """
+        Record adjustments Google Ads accepted
+
+        Args:
+            adjustments: Iterable of (conversion_key, restated_value) pairs;
+                         restated_value None marks a retraction
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE conversions SET status = CASE WHEN ? IS NULL THEN ? ELSE status END, "
+                "conversion_value = COALESCE(?, 0), updated_at = ? WHERE conversion_key = ?",
+                [(value, STATUS_RETRACTED, value, now, key) for key, value in adjustments]
+            )
+
+    def failed_conversions(self, limit=None):
+        """
+        Return failed conversions so they can be retried without re-fetching
+
+        Returns:
+            List of (ref, conversion) pairs, oldest failure first
+        """
+        query = "SELECT payload FROM conversions WHERE status = ? AND payload IS NOT NULL ORDER BY updated_at"
+        params = [STATUS_FAILED]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        pending = []
+        for (payload,) in self.conn.execute(query, params):
+            record = json.loads(payload)
+            pending.append((record['ref'], record['conversion']))
+        return pending
+
+    def compact(self, max_age_days=GCLID_WINDOW_DAYS):
+        """
+        Delete entries older than the GCLID upload window
+
+        Returns:
+            Number of rows removed
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM conversions WHERE created_at < ?", (cutoff,))
+        return cursor.rowcount
+
+    def close(self):
+        if self.bloom is not None:
+            self.bloom.close()
+            self.bloom = None
+        self.conn.close()
@@ -0,0 +1,111 @@
+"""
+Webhook Queue: Durable hand-off from the CallRail webhook receiver to the uploader
+
+The receiver appends conversions and acknowledges CallRail only after the
+transaction is committed (synchronous=FULL), so an acknowledged webhook
+survives a crash or power loss. The uploader reads events in arrival order
+and deletes them once their upload outcome is in the upload ledger.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+from automation.utils.settings import env_str
+
+# Queue file without WEBHOOK_QUEUE_PATH or a tenant state_dir
+DEFAULT_QUEUE_FILE = os.path.join(os.path.dirname(__file__), '../../../.webhook_queue.sqlite3')
+
+# Keep IN (...) lists under SQLite's default host parameter limit
+_DELETE_CHUNK = 400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_id TEXT,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL
+);
+"""
+
+
+def queue_exists(path=None):
+    """True if a webhook queue file has been created (the receiver has run)"""
+    return os.path.exists(path or _queue_file())
+
+
+def _queue_file():
+    return env_str('WEBHOOK_QUEUE_PATH', DEFAULT_QUEUE_FILE)
+
+
+class WebhookQueue:
+    """
+    SQLite (WAL mode) queue of conversions received by webhook
+
+    Safe to share between processes. Within a process, use one object per
+    thread, or serialize calls (the receiver uses a single writer thread).
+
+    Args:
+        path: Database file (default: WEBHOOK_QUEUE_PATH or .webhook_queue.sqlite3)
+    """
+
+    def __init__(self, path=None):
+        self.path = path or _queue_file()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def append_many(self, conversions):
+        """
+        Append conversions in one transaction
+
+        Args:
+            conversions: List of conversion dicts (see callrail_fetcher.call_to_conversion)
+
+        Returns:
+            Number of events appended
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO events (call_id, payload, received_at) VALUES (?, ?, ?)",
+                [(str(conversion.get('call_id')), json.dumps(conversion), now) for conversion in conversions]
+            )
+        return len(conversions)
+
+    def peek(self, limit=None, after_id=0):
+        """
+        Return queued events in arrival order without removing them
+
+        Args:
+            limit: Maximum events to return (default: all)
+            after_id: Only return events with a larger ID
+
+        Returns:
+            List of (event_id, conversion) pairs
+        """
+        query = "SELECT id, payload FROM events WHERE id > ? ORDER BY id"
+        params = [after_id]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [(event_id, json.loads(payload)) for event_id, payload in self.conn.execute(query, params)]
+
+    def delete(self, event_ids):
+        """Remove events whose uploads have been recorded"""
+        event_ids = list(event_ids)
+        with self.conn:
+            for start in range(0, len(event_ids), _DELETE_CHUNK):
+                chunk = event_ids[start:start + _DELETE_CHUNK]
+                self.conn.execute(
+                    f"DELETE FROM events WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
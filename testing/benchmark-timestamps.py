@@ -0,0 +1,62 @@
+"""Benchmark timestamp normalization against the old per-row conversion.
+
+Compares the per-row replace + fromisoformat + strftime conversion that
+format_timestamp used to do with TimestampNormalizer.normalize_many on
+CallRail-style, naive local and CRM-layout timestamps.
+
+Usage:
+    python3 testing/benchmark-timestamps.py
+    python3 testing/benchmark-timestamps.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code-templates'))
+
+from automation.utils.timestamps import TimestampNormalizer  # noqa: E402
+
+
+def per_row(value):
+    """The previous format_timestamp implementation"""
+    if value.endswith('Z'):
+        value = value.replace('Z', '+00:00')
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S%z')
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark timestamp normalization')
+    parser.add_argument('--rows', type=int, default=1000000, help='Timestamps per dataset (default: 1000000)')
+    args = parser.parse_args(argv)
+
+    base = 1766100000
+    callrail = [time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(base + i)) for i in range(args.rows)]
+    naive = [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + i)) for i in range(args.rows)]
+    crm = [time.strftime('%m/%d/%Y %I:%M %p', time.gmtime(base + 60 * i)) for i in range(args.rows)]
+
+    utc = TimestampNormalizer()
+    local = TimestampNormalizer('America/Los_Angeles')
+
+    print(f"{'dataset':<26} {'rows':>10} {'seconds':>9} {'rows/s':>12}")
+    for name, fn in [
+        ('callrail per-row (old)', lambda: [per_row(value) for value in callrail]),
+        ('callrail normalize_many', lambda: utc.normalize_many(callrail)),
+        ('naive LA normalize_many', lambda: local.normalize_many(naive)),
+        ('CRM strptime per-row', lambda: [datetime.strptime(value, '%m/%d/%Y %I:%M %p') for value in crm]),
+        ('CRM normalize_many', lambda: local.normalize_many(crm)),
+    ]:
+        seconds = _timed(fn)
+        print(f"{name:<26} {args.rows:>10,} {seconds:>9.2f} {args.rows / seconds:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Benchmark the conversion uploader against local fakes.
+
+Runs upload_conversions_from_csv and upload_conversions_from_callrail over
+synthetic datasets, with an in-process fake ConversionUploadService and a
+local fake CallRail HTTP server (see upload_fakes.py). Each scenario runs in
+its own process so peak RSS is measured per dataset.
+
+Reports rows/s, p50/p99 per-request latency, peak RSS and RPC counts.
+
+Usage:
+    python3 testing/benchmark-upload.py
+    python3 testing/benchmark-upload.py --sizes 1000 100000 1000000 --latency-ms 150
+    python3 testing/benchmark-upload.py --source csv --partial-failure-rate 0.01
+    python3 testing/benchmark-upload.py --sizes 100000 --profile profiles/ --profile-mode cprofile
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [1000, 100000]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_scenario(source, size, latency, error_rate, partial_failure_rate, max_in_flight,
+                 profile_dir=None, profile_mode='spans'):
+    """Run one upload in this process and return its metrics"""
+    import upload_fakes
+
+    fake_client = upload_fakes.FakeGoogleAdsClient(
+        latency=latency, error_rate=error_rate, partial_failure_rate=partial_failure_rate
+    )
+    service = fake_client.conversion_upload_service
+
+    with tempfile.TemporaryDirectory(prefix='upload-bench-') as state_dir:
+        if source == 'csv':
+            csv_path = os.path.join(state_dir, 'conversions.csv')
+            upload_fakes.write_synthetic_csv(csv_path, size)
+            uploader = upload_fakes.load_upload_module(state_dir=state_dir, max_in_flight=max_in_flight)
+
+            started = time.perf_counter()
+            with _profiled(profile_dir, profile_mode, source, size):
+                successful, failed = uploader.upload_conversions_from_csv(
+                    csv_path, logger=_quiet_logger(), client=fake_client
+                )
+            seconds = time.perf_counter() - started
+            callrail_requests = 0
+        else:
+            with upload_fakes.FakeCallRailServer(size, error_rate=error_rate) as server:
+                uploader = upload_fakes.load_upload_module(
+                    callrail_base_url=server.base_url, state_dir=state_dir, max_in_flight=max_in_flight
+                )
+
+                started = time.perf_counter()
+                with _profiled(profile_dir, profile_mode, source, size):
+                    successful, failed = uploader.upload_conversions_from_callrail(
+                        since_minutes=60, logger=_quiet_logger(), client=fake_client
+                    )
+                seconds = time.perf_counter() - started
+                callrail_requests = server.request_count
+
+    rows = successful + failed
+    return {
+        'source': source,
+        'size': size,
+        'rows': rows,
+        'successful': successful,
+        'failed': failed,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0.0,
+        'p50_ms': _percentile(service.request_latencies, 0.50) * 1000,
+        'p99_ms': _percentile(service.request_latencies, 0.99) * 1000,
+        'rpc_count': service.rpc_count,
+        'callrail_requests': callrail_requests,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def _profiled(profile_dir, profile_mode, source, size):
+    """Profile the upload into profile_dir/<source>-<size>/ when profiling is on"""
+    stack = ExitStack()
+    if profile_dir:
+        from automation.utils.profiling import profile_run
+        stack.enter_context(profile_run(
+            os.path.join(profile_dir, f"{source}-{size}"), mode=profile_mode, logger=_quiet_logger()
+        ))
+    return stack
+
+
+def _quiet_logger():
+    import logging
+    logger = logging.getLogger('upload_benchmark')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    return logger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the conversion uploader against local fakes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Dataset sizes in rows / calls (default: 1000 100000)')
+    parser.add_argument('--source', choices=['csv', 'callrail', 'both'], default='both')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Fake RPC latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability a whole request fails')
+    parser.add_argument('--partial-failure-rate', type=float, default=0.0, help='Probability each row fails')
+    parser.add_argument('--max-in-flight', type=int, default=4, help='Concurrent upload requests')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON lines')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Write a per-stage timing report and flamegraph stacks per scenario to DIR')
+    parser.add_argument('--profile-mode', choices=['spans', 'cprofile', 'pyinstrument'], default='spans',
+                        help='Also capture a cProfile or pyinstrument profile (default: spans)')
+    parser.add_argument('--run-one', nargs=2, metavar=('SOURCE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    options = dict(
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        partial_failure_rate=args.partial_failure_rate,
+        max_in_flight=args.max_in_flight,
+        profile_dir=args.profile and os.path.abspath(args.profile),
+        profile_mode=args.profile_mode
+    )
+
+    if args.run_one:
+        source, size = args.run_one
+        # Silence the uploader's progress prints; the result goes on the last line
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = run_scenario(source, int(size), **options)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    sources = ['csv', 'callrail'] if args.source == 'both' else [args.source]
+    forwarded = [
+        '--latency-ms', str(args.latency_ms),
+        '--error-rate', str(args.error_rate),
+        '--partial-failure-rate', str(args.partial_failure_rate),
+        '--max-in-flight', str(args.max_in_flight),
+        '--profile-mode', args.profile_mode,
+    ]
+    if args.profile:
+        forwarded += ['--profile', os.path.abspath(args.profile)]
+
+    if not args.json:
+        print(f"{'source':<9} {'size':>9} {'rows/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'RPCs':>6} {'failed':>7} {'peak RSS':>9}")
+
+    for source in sources:
+        for size in args.sizes:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-one', source, str(size), *forwarded],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"✗ {source} {size}: benchmark failed\n{completed.stderr}")
+                continue
+
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{source:<9} {size:>9,} {result['rows_per_second']:>10,.0f} {result['p50_ms']:>8.1f} "
+                      f"{result['p99_ms']:>8.1f} {result['rpc_count']:>6} {result['failed']:>7} "
+                      f"{result['peak_rss_mb']:>7.0f}MB")
+
+    if args.profile:
+        print(f"\nTiming reports and flamegraph stacks: {os.path.abspath(args.profile)}/<source>-<size>/")
+
+
+if __name__ == '__main__':
+    main()
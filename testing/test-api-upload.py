@@ -1,5 +1,393 @@
-"""Simple placeholder for API upload tests."""
+"""API upload tests against the local fakes in upload_fakes.py.
+
+Run with: python -m pytest testing/test-api-upload.py
+"""
+
+import csv
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import upload_fakes
 
 
 def test_placeholder():
     assert True
+
+
+def test_csv_upload_batches_rows(tmp_path):
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    csv_path = tmp_path / 'conversions.csv'
+    upload_fakes.write_synthetic_csv(csv_path, 4500)
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+
+    successful, failed = uploader.upload_conversions_from_csv(str(csv_path), client=fake_client)
+
+    service = fake_client.conversion_upload_service
+    assert (successful, failed) == (4500, 0)
+    assert service.rpc_count == 3
+    assert service.rows == 4500
+
+
+def test_partial_failures_are_counted(tmp_path):
+    fake_client = upload_fakes.FakeGoogleAdsClient(partial_failure_rate=0.1, seed=1)
+    csv_path = tmp_path / 'conversions.csv'
+    upload_fakes.write_synthetic_csv(csv_path, 1000)
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+
+    successful, failed = uploader.upload_conversions_from_csv(str(csv_path), client=fake_client)
+
+    assert successful + failed == 1000
+    assert 0 < failed < 1000
+
+
+def test_permanent_failures_are_dead_lettered_not_resent(tmp_path):
+    fake_client = upload_fakes.FakeGoogleAdsClient(partial_failure_rate=0.1, seed=1)
+    csv_path = tmp_path / 'conversions.csv'
+    upload_fakes.write_synthetic_csv(csv_path, 1000)
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+
+    _, failed = uploader.upload_conversions_from_csv(str(csv_path), client=fake_client)
+
+    # The fake rejects rows as UNPARSEABLE_GCLID, which is not worth retrying
+    retry_queue = uploader.RetryQueue()
+    assert len(retry_queue) == 0
+    assert len(retry_queue.dead_letters()) == failed
+    retry_queue.close()
+
+    service = fake_client.conversion_upload_service
+    rows_sent = service.rows
+    assert uploader.upload_conversions_from_csv(str(csv_path), client=fake_client) == (0, 0)
+    assert service.rows == rows_sent
+
+
+def test_adjustments_send_only_changed_values(tmp_path):
+    gclid = upload_fakes.synthetic_gclid
+    fake_client = upload_fakes.FakeGoogleAdsClient(fail_adjustment_gclids=[gclid(3)])
+    csv_path = tmp_path / 'conversions.csv'
+    upload_fakes.write_synthetic_csv(csv_path, 5)
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+    assert uploader.upload_conversions_from_csv(str(csv_path), client=fake_client) == (5, 0)
+
+    from automation.conversion_upload.adjustments import upload_adjustments_from_csv
+
+    crm_path = tmp_path / 'crm-values.csv'
+    with open(crm_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['gclid', 'conversion_value', 'status'])
+        writer.writerows([
+            [gclid(0), '0', 'Booked'],              # unchanged
+            [gclid(1), '4500', 'Sale Closed'],      # restated
+            [gclid(2), '200', 'Refunded'],          # retracted
+            [gclid(3), '999', 'Sale Closed'],       # rejected by Google Ads
+            ['CjwKCAiA_unknown', '100', 'Sale Closed'],  # never uploaded
+            [gclid(4), 'n/a', 'Sale Closed'],       # invalid value
+        ])
+
+    assert upload_adjustments_from_csv(str(crm_path), client=fake_client) == (2, 2)
+
+    service = fake_client.conversion_adjustment_upload_service
+    assert [
+        (adjustment.gclid_date_time_pair.gclid, adjustment.adjustment_type.name,
+         adjustment.restatement_value.adjusted_value)
+        for adjustment in service.adjustments
+    ] == [(gclid(1), 'RESTATEMENT', 4500.0), (gclid(2), 'RETRACTION', 0.0)]
+    assert service.adjustments[0].gclid_date_time_pair.conversion_date_time == '2025-12-19 10:30:00-08:00'
+
+    # Accepted adjustments are in the ledger: only the failed one is sent again
+    service.fail_gclids.clear()
+    assert upload_adjustments_from_csv(str(crm_path), client=fake_client) == (1, 1)
+    assert service.rpc_count == 2
+    assert service.adjustments[-1].gclid_date_time_pair.gclid == gclid(3)
+
+    # A retracted conversion is never uploaded again
+    assert uploader.upload_conversions_from_csv(str(csv_path), client=fake_client) == (0, 0)
+
+
+def test_parquet_upload(tmp_path):
+    pytest.importorskip('pyarrow')
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    csv_path = tmp_path / 'conversions.csv'
+    upload_fakes.write_synthetic_csv(csv_path, 2500)
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+    from automation.utils.columnar_io import ColumnarWriter
+
+    parquet_path = str(tmp_path / 'conversions.parquet')
+    with open(csv_path) as f, ColumnarWriter(parquet_path, next(csv.reader(f))) as writer:
+        writer.writerows(csv.reader(f))
+
+    assert uploader.upload_conversions_from_csv(parquet_path, client=fake_client) == (2500, 0)
+    assert fake_client.conversion_upload_service.rpc_count == 2
+
+
+def test_invalid_csv_rows_are_rejected_before_upload(tmp_path, monkeypatch):
+    monkeypatch.setenv('QUALIFICATION_RULES_PATH', os.path.join(
+        upload_fakes.REPO_ROOT, 'configuration', 'callrail', 'qualification-rules.json'
+    ))
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    csv_path = tmp_path / 'conversions.csv'
+    csv_path.write_text(
+        'gclid,conversion_action_id,conversion_date_time,conversion_value\n'
+        f'{upload_fakes.synthetic_gclid(1)},{upload_fakes.CONVERSION_ACTION_ID},12/19/2025 2:00 PM,4500\n'
+        f'{upload_fakes.synthetic_gclid(2)},{upload_fakes.CONVERSION_ACTION_ID},2025-02-30 10:00:00,0\n'
+        f'{upload_fakes.synthetic_gclid(3)},{upload_fakes.CONVERSION_ACTION_ID},2025-12-19 10:00:00,N/A\n'
+        f',{upload_fakes.CONVERSION_ACTION_ID},2025-12-19 10:00:00,0\n'
+    )
+    uploader = upload_fakes.load_upload_module(state_dir=str(tmp_path))
+
+    assert uploader.upload_conversions_from_csv(str(csv_path), client=fake_client) == (1, 3)
+    assert fake_client.conversion_upload_service.rows == 1
+
+    # Naive CSV times are in the clinic's timezone (QUALIFICATION_RULES_PATH)
+    ledger = uploader.UploadLedger()
+    key = f'{upload_fakes.synthetic_gclid(1)}|{upload_fakes.CONVERSION_ACTION_ID}|2025-12-19 14:00:00-08:00'
+    assert ledger.acknowledged([key]) == ({key}, set())
+    ledger.close()
+
+
+def test_callrail_upload_against_fake_server(tmp_path):
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    with upload_fakes.FakeCallRailServer(1000) as server:
+        uploader = upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        successful, failed = uploader.upload_conversions_from_callrail(since_minutes=60, client=fake_client)
+
+    # Every other synthetic call carries a GCLID
+    assert (successful, failed) == (500, 0)
+    assert fake_client.conversion_upload_service.rpc_count == 1
+    assert server.request_count >= 1
+
+
+def test_enhanced_conversions_for_leads_upload_calls_without_gclid(tmp_path, monkeypatch):
+    monkeypatch.setenv('ENHANCED_CONVERSIONS_FOR_LEADS', 'true')
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    with upload_fakes.FakeCallRailServer(1000) as server:
+        uploader = upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        successful, failed = uploader.upload_conversions_from_callrail(since_minutes=60, client=fake_client)
+
+    assert (successful, failed) == (1000, 0)
+
+    from automation.conversion_upload.session import session_for
+    lead = {'gclid': None, 'hashed_phone_number': 'ab' * 32, 'conversion_date_time': '2025-12-19 10:30:00-08:00'}
+    request = session_for(fake_client).build_request(upload_fakes.CUSTOMER_ID, [('CAL1', lead)], '42')
+    identifier = request.conversions[0].user_identifiers[0]
+    assert not request.conversions[0].gclid
+    assert identifier.hashed_phone_number == 'ab' * 32
+    assert identifier.user_identifier_source == fake_client.enums.UserIdentifierSourceEnum.FIRST_PARTY
+
+
+def test_nothing_to_upload_skips_google_ads_sdk(tmp_path, monkeypatch):
+    with upload_fakes.FakeCallRailServer(0) as server:
+        uploader = upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        monkeypatch.setattr(uploader, 'get_session', None)  # Would raise if an upload were attempted
+
+        assert uploader.upload_conversions_from_callrail(since_minutes=60) == (0, 0)
+
+
+def test_package_import_has_no_side_effects_and_settings_follow_dotenv(tmp_path):
+    # A fresh interpreter, so no module is imported and no .env loaded yet
+    (tmp_path / '.env').write_text(
+        'GOOGLE_ADS_CUSTOMER_ID=1\nGOOGLE_ADS_CONVERSION_ACTION_ID=2\n'
+        'RETRY_QUEUE_DIR=from-dotenv\nRETRY_MAX_ATTEMPTS=3\n'
+    )
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('GOOGLE_ADS_CUSTOMER_ID', 'GOOGLE_ADS_CONVERSION_ACTION_ID',
+                           'RETRY_QUEUE_DIR', 'RETRY_MAX_ATTEMPTS')}
+    env['PYTHONPATH'] = upload_fakes.CODE_TEMPLATES
+    code = (
+        "import os, sys\n"
+        "import automation.conversion_upload as package\n"
+        "print('RETRY_QUEUE_DIR' in os.environ, 'automation.conversion_upload.uploader' in sys.modules)\n"
+        "config = package.load_config()\n"
+        "from automation.utils.retry_queue import RetryQueue\n"
+        "print(config.retry_max_attempts, os.path.basename(RetryQueue().directory))\n"
+    )
+
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    ).stdout
+
+    assert output.split() == ['False', 'False', '3', 'from-dotenv']
+
+
+def test_session_builds_requests_once_per_client():
+    upload_fakes.load_upload_module()
+    from automation.conversion_upload.session import session_for
+
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    session = session_for(fake_client)
+    assert session_for(fake_client) is session
+
+    batch = [
+        (i, {'gclid': upload_fakes.synthetic_gclid(i), 'conversion_date_time': '2025-12-19 10:30:00-08:00',
+             'conversion_value': str(i % 2 * 150)})
+        for i in range(10)
+    ]
+    request = session.build_request(upload_fakes.CUSTOMER_ID, batch, upload_fakes.CONVERSION_ACTION_ID)
+
+    assert request.partial_failure
+    assert len(request.conversions) == 10
+    assert request.conversions[1].conversion_value == 150.0
+    assert request.conversions[0].conversion_action == (
+        f"customers/{upload_fakes.CUSTOMER_ID}/conversionActions/{upload_fakes.CONVERSION_ACTION_ID}"
+    )
+    assert session.conversion_action_path.cache_info().misses == 1
+
+
+def test_daemon_uploads_micro_batches_and_drains(tmp_path):
+    import json
+    import threading
+    import time
+    import urllib.request
+
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    with upload_fakes.FakeCallRailServer(100) as server:
+        upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        from automation.conversion_upload.config import DaemonConfig, load_config
+        from automation.conversion_upload.daemon import UploadDaemon
+        from automation.utils import state_manager
+
+        daemon = UploadDaemon(
+            load_config(),
+            DaemonConfig(poll_seconds=1, flush_rows=20, flush_seconds=60, metrics_port=0),
+            client=fake_client
+        )
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            deadline = time.time() + 10
+            while daemon.metrics.snapshot()['uploaded'] < 50 and time.time() < deadline:
+                time.sleep(0.05)
+
+            host, port = daemon.metrics_address
+            with urllib.request.urlopen(f'http://{host}:{port}/healthz') as response:
+                assert json.load(response)['status'] == 'ok'
+            with urllib.request.urlopen(f'http://{host}:{port}/metrics') as response:
+                assert 'conversion_upload_uploaded_total 50' in response.read().decode()
+        finally:
+            daemon.stop()
+            thread.join(10)
+
+    assert not thread.is_alive()
+    # Repeated polls of the same calls are not uploaded again
+    assert fake_client.conversion_upload_service.rows == 50
+    assert state_manager.get_sync_watermark() is not None
+
+
+def test_daemon_keeps_tenant_state_in_its_state_dir(tmp_path):
+    import dataclasses
+    import threading
+    import time
+
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    state_dir = tmp_path / 'clinic-a'
+    state_dir.mkdir()
+    with upload_fakes.FakeCallRailServer(100) as server:
+        upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        from automation.conversion_upload.config import DaemonConfig, load_config
+        from automation.conversion_upload.daemon import UploadDaemon
+        from automation.utils.webhook_queue import WebhookQueue
+
+        queue = WebhookQueue(str(state_dir / 'webhook_queue.sqlite3'))
+        queue.append_many([
+            {'gclid': 'CjwKCAiA_webhook', 'conversion_date_time': '2025-12-19 10:30:00-0800', 'call_id': 'CALWEBHOOK'}
+        ])
+        config = dataclasses.replace(load_config(), state_dir=str(state_dir), callrail_account_id='ACCA')
+        daemon = UploadDaemon(config, DaemonConfig(poll_seconds=1, flush_rows=20, flush_seconds=60), client=fake_client)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            deadline = time.time() + 10
+            while daemon.metrics.snapshot()['uploaded'] < 51 and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            daemon.stop()
+            thread.join(10)
+
+    assert fake_client.conversion_upload_service.rows == 51
+    assert set(server.account_requests) == {'ACCA'}
+    assert len(queue) == 0
+    for name in ('upload_ledger.sqlite3', 'retry_queue', '.sync_watermark', '.last_sync'):
+        assert (state_dir / name).exists()
+    assert not (tmp_path / 'ledger.sqlite3').exists()
+
+
+def test_webhook_queue_is_uploaded_and_cleared(tmp_path):
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    with upload_fakes.FakeCallRailServer(10) as server:
+        uploader = upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        from automation.utils.webhook_queue import WebhookQueue
+
+        queue = WebhookQueue()
+        queue.append_many([
+            {'gclid': 'CjwKCAiA_webhook', 'conversion_date_time': '2025-12-19 10:30:00-0800', 'call_id': 'CALWEBHOOK'},
+            # Also returned by polling: uploaded once
+            {'gclid': upload_fakes.synthetic_gclid(1), 'conversion_date_time': '2025-12-18 23:20:01+00:00',
+             'call_id': 'CAL000000000001'},
+        ])
+
+        successful, failed = uploader.upload_conversions_from_callrail(since_minutes=60, client=fake_client)
+
+    assert (successful, failed) == (6, 0)
+    assert len(queue) == 0
+
+
+def test_tenant_orchestrator_isolates_state_and_failures(tmp_path):
+    import json
+
+    fake_client = upload_fakes.FakeGoogleAdsClient()
+    with upload_fakes.FakeCallRailServer(100) as server:
+        uploader = upload_fakes.load_upload_module(callrail_base_url=server.base_url, state_dir=str(tmp_path))
+        from automation.conversion_upload.config import ConfigError
+        from automation.conversion_upload.orchestrator import TenantOrchestrator, load_tenant_manifest
+        from automation.utils.callrail_client import get_client
+
+        manifest = tmp_path / 'tenants.json'
+        manifest.write_text(json.dumps({
+            'defaults': {'conversion_action_id': upload_fakes.CONVERSION_ACTION_ID},
+            'tenants': [
+                {'name': 'clinic-a', 'callrail_account_id': 'ACCA', 'customer_id': '1111111111'},
+                {'name': 'clinic-b', 'callrail_account_id': 'ACCB', 'customer_id': '2222222222'},
+                {'name': 'clinic-c', 'callrail_account_id': 'ACCC', 'customer_id': '3333333333'},
+            ]
+        }))
+        tenants = load_tenant_manifest(str(manifest))
+
+        def sync(config, **kwargs):
+            if config.customer_id == '3333333333':
+                raise RuntimeError('bad credentials')
+            return uploader.upload_conversions_from_callrail(config=config, client=fake_client, **kwargs)
+
+        failed_tenants = TenantOrchestrator(tenants, workers=2, sync=sync).run(since_minutes=60)
+        shared_session = get_client(account_id='ACCA').session is get_client(account_id='ACCB').session
+
+    clinic_a, clinic_b, clinic_c = tenants
+    assert failed_tenants == 1
+    assert clinic_c.last_error == 'RuntimeError: bad credentials'
+    # Separate ledgers: both clinics upload the same synthetic calls
+    assert (clinic_a.successful, clinic_b.successful) == (50, 50)
+    assert fake_client.conversion_upload_service.rows == 100
+    assert server.account_requests == {'ACCA': 1, 'ACCB': 1}
+    assert shared_session
+    for tenant in (clinic_a, clinic_b):
+        assert (tmp_path / '.tenants' / tenant.name / '.sync_watermark').exists()
+
+    manifest.write_text(json.dumps({'tenants': [{'name': 'clinic-a', 'customer_id': '1111111111'}]}))
+    with pytest.raises(ConfigError, match='missing conversion_action_id, callrail_account_id'):
+        load_tenant_manifest(str(manifest))
+
+    manifest.write_text(json.dumps({'tenants': [{
+        'name': 'clinic-a', 'callrail_account_id': 'ACCA', 'customer_id': '1111111111',
+        'conversion_action_id': upload_fakes.CONVERSION_ACTION_ID, 'qualification_rules': False
+    }]}))
+    with pytest.raises(ConfigError, match="qualification_rules must be a path or 'off'"):
+        load_tenant_manifest(str(manifest))
+
+    manifest.write_text(json.dumps({'tenants': [{
+        'name': 'clinic-a', 'callrail_account_id': 'ACCA', 'customer_id': '1111111111',
+        'conversion_action_id': upload_fakes.CONVERSION_ACTION_ID, 'retry_max_attempts': 3
+    }]}))
+    assert load_tenant_manifest(str(manifest))[0].config.retry_max_attempts == 3
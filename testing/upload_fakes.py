@@ -0,0 +1,318 @@
+"""In-process fakes for exercising the upload pipeline without network access.
+
+- FakeGoogleAdsClient: real google-ads message types, fake services. The fake
+  ConversionUploadService injects latency, whole-request errors and per-row
+  partial failures, and counts RPCs and per-request latency. The fake
+  ConversionAdjustmentUploadService keeps every adjustment it accepts.
+- FakeCallRailServer: local HTTP server for /v3/a/<account>/calls.json with
+  offset pagination over a synthetic call log, plus latency and 503 errors.
+- load_upload_module(): imports the uploader with its CallRail endpoint and
+  state files pointed at the fakes.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from google.ads.googleads.client import GoogleAdsClient
+from google.ads.googleads.errors import GoogleAdsException
+from google.protobuf import any_pb2
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CODE_TEMPLATES = os.path.join(REPO_ROOT, 'code-templates')
+
+CUSTOMER_ID = '1234567890'
+CONVERSION_ACTION_ID = '987654321'
+CALLRAIL_ACCOUNT_ID = 'ACC0000000'
+
+
+def synthetic_gclid(i):
+    return f"CjwKCAiA{i:040d}xyz"
+
+
+class FakeConversionUploadService:
+    """
+    Fake ConversionUploadService
+
+    Args:
+        client: GoogleAdsClient used to build responses
+        latency: Seconds to sleep per request
+        error_rate: Probability that a whole request raises GoogleAdsException
+        partial_failure_rate: Probability that each row fails (partial failure)
+        seed: Random seed, so runs are repeatable
+    """
+
+    def __init__(self, client, latency=0.0, error_rate=0.0, partial_failure_rate=0.0, seed=0):
+        self.client = client
+        self.latency = latency
+        self.error_rate = error_rate
+        self.partial_failure_rate = partial_failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.rpc_count = 0
+        self.rows = 0
+        self.request_latencies = []
+
+    def _error(self, index=None, message="Fake partial failure", field_name="conversions"):
+        error = self.client.get_type("GoogleAdsError")
+        error.error_code.conversion_upload_error = (
+            self.client.get_type("ConversionUploadErrorEnum").ConversionUploadError.UNPARSEABLE_GCLID
+        )
+        error.message = message
+        if index is not None:
+            element = self.client.get_type("ErrorLocation").FieldPathElement()
+            element.field_name = field_name
+            element.index = index
+            error.location.field_path_elements.append(element)
+        return error
+
+    def upload_click_conversions(self, request=None):
+        started = time.perf_counter()
+        with self.lock:
+            self.rpc_count += 1
+            self.rows += len(request.conversions)
+            fail_request = self.random.random() < self.error_rate
+            failed_rows = [
+                index for index in range(len(request.conversions))
+                if self.random.random() < self.partial_failure_rate
+            ]
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        try:
+            failure = self.client.get_type("GoogleAdsFailure")
+            if fail_request:
+                failure.errors.append(self._error(message="Fake request failure"))
+                raise GoogleAdsException(None, None, failure, "fake-request-id")
+
+            response = self.client.get_type("UploadClickConversionsResponse")
+            if failed_rows:
+                for index in failed_rows:
+                    failure.errors.append(self._error(index))
+                detail = any_pb2.Any()
+                detail.value = type(failure).serialize(failure)
+                response.partial_failure_error.code = 3
+                response.partial_failure_error.details.append(detail)
+            return response
+        finally:
+            with self.lock:
+                self.request_latencies.append(time.perf_counter() - started)
+
+
+class FakeConversionAdjustmentUploadService(FakeConversionUploadService):
+    """
+    Fake ConversionAdjustmentUploadService
+
+    Args:
+        client: GoogleAdsClient used to build responses
+        fail_gclids: GCLIDs whose adjustments fail (partial failure)
+    """
+
+    def __init__(self, client, fail_gclids=()):
+        super().__init__(client)
+        self.fail_gclids = set(fail_gclids)
+        self.adjustments = []
+
+    def upload_conversion_adjustments(self, request=None):
+        response = self.client.get_type("UploadConversionAdjustmentsResponse")
+        failure = self.client.get_type("GoogleAdsFailure")
+        with self.lock:
+            self.rpc_count += 1
+            self.rows += len(request.conversion_adjustments)
+            for index, adjustment in enumerate(request.conversion_adjustments):
+                if adjustment.gclid_date_time_pair.gclid in self.fail_gclids:
+                    failure.errors.append(self._error(index, field_name="conversion_adjustments"))
+                else:
+                    self.adjustments.append(adjustment)
+
+        if failure.errors:
+            detail = any_pb2.Any()
+            detail.value = type(failure).serialize(failure)
+            response.partial_failure_error.code = 3
+            response.partial_failure_error.details.append(detail)
+        return response
+
+
+class FakeGoogleAdsService:
+    @staticmethod
+    def conversion_action_path(customer_id, conversion_action_id):
+        return f"customers/{customer_id}/conversionActions/{conversion_action_id}"
+
+
+class FakeGoogleAdsClient:
+    """GoogleAdsClient stand-in: real types and enums, fake services"""
+
+    def __init__(self, fail_adjustment_gclids=(), **service_options):
+        self._client = GoogleAdsClient(credentials=None, developer_token="fake", use_proto_plus=True)
+        self.enums = self._client.enums
+        self.conversion_upload_service = FakeConversionUploadService(self._client, **service_options)
+        self.conversion_adjustment_upload_service = FakeConversionAdjustmentUploadService(
+            self._client, fail_adjustment_gclids
+        )
+
+    def get_type(self, name, version=None):
+        return self._client.get_type(name)
+
+    def get_service(self, name, version=None):
+        if name == "ConversionUploadService":
+            return self.conversion_upload_service
+        if name == "ConversionAdjustmentUploadService":
+            return self.conversion_adjustment_upload_service
+        if name == "GoogleAdsService":
+            return FakeGoogleAdsService()
+        raise ValueError(f"Fake client has no service {name}")
+
+
+class FakeCallRailServer:
+    """
+    Local CallRail calls.json endpoint over ``num_calls`` synthetic calls
+
+    Every other call carries a GCLID, matching a typical mix of ad and
+    non-ad traffic. Use as a context manager; ``base_url`` replaces
+    https://api.callrail.com/v3.
+    """
+
+    def __init__(self, num_calls, latency=0.0, error_rate=0.0, seed=0):
+        self.num_calls = num_calls
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.account_requests = Counter()
+        self.server = None
+        self.thread = None
+
+    def _call(self, i):
+        return {
+            'id': f'CAL{i:012d}',
+            'start_time': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(1766100000 + i)),
+            'duration': 60 + i % 300,
+            'customer_phone_number': f'+1555{i % 10000000:07d}',
+            'qualifying': True,
+            'value': i % 5 * 100,
+            'gclid': synthetic_gclid(i) if i % 2 else None
+        }
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with fake.lock:
+                    fake.request_count += 1
+                    # /v3/a/<account>/calls.json
+                    fake.account_requests[urlparse(self.path).path.split('/')[3]] += 1
+                    fail = fake.random.random() < fake.error_rate
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if fail:
+                    body = b'{"error": "Service Unavailable"}'
+                    self.send_response(503)
+                    self.send_header('Retry-After', '0')
+                else:
+                    query = parse_qs(urlparse(self.path).query)
+                    per_page = int(query.get('per_page', ['100'])[0])
+                    page = int(query.get('page', ['1'])[0])
+                    total_pages = max(1, -(-fake.num_calls // per_page))
+                    start = (page - 1) * per_page
+                    calls = [fake._call(i) for i in range(start, min(start + per_page, fake.num_calls))]
+                    body = json.dumps({
+                        'page': page,
+                        'per_page': per_page,
+                        'total_pages': total_pages,
+                        'total_records': fake.num_calls,
+                        'calls': calls
+                    }).encode()
+                    self.send_response(200)
+
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v3'
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_synthetic_csv(path, num_rows):
+    """Write an upload-format CSV with ``num_rows`` distinct conversions"""
+    with open(path, 'w', newline='') as f:
+        f.write('gclid,conversion_action_id,conversion_date_time,conversion_value\n')
+        for i in range(num_rows):
+            f.write(f'{synthetic_gclid(i)},{CONVERSION_ACTION_ID},2025-12-19 10:30:00-08:00,{i % 5 * 100}\n')
+
+
+def load_upload_module(callrail_base_url=None, state_dir=None, max_in_flight=None):
+    """
+    Import the uploader with its CallRail endpoint and state files pointed at the fakes
+
+    Pass the FakeGoogleAdsClient to the upload functions as ``client=``.
+
+    Args:
+        callrail_base_url: FakeCallRailServer.base_url, if CallRail is used
+        state_dir: Directory for the ledger, webhook and retry queues, rate
+                   limits and sync state (default: new temp dir)
+        max_in_flight: GOOGLE_ADS_UPLOAD_MAX_IN_FLIGHT for the run
+
+    Returns:
+        The automation.conversion_upload.uploader module
+    """
+    state_dir = state_dir or tempfile.mkdtemp(prefix='upload-bench-')
+    os.environ.update({
+        'GOOGLE_ADS_CUSTOMER_ID': CUSTOMER_ID,
+        'GOOGLE_ADS_CONVERSION_ACTION_ID': CONVERSION_ACTION_ID,
+        'CALLRAIL_API_KEY': 'fake-key',
+        'CALLRAIL_ACCOUNT_ID': CALLRAIL_ACCOUNT_ID,
+        'UPLOAD_LEDGER_PATH': os.path.join(state_dir, 'ledger.sqlite3'),
+        'RETRY_QUEUE_DIR': os.path.join(state_dir, 'retry_queue'),
+        'RATE_LIMIT_PATH': os.path.join(state_dir, 'rate_limits.sqlite3'),
+        'WEBHOOK_QUEUE_PATH': os.path.join(state_dir, 'webhook_queue.sqlite3'),
+        # The fake CallRail server has no hourly quota; benchmarks page
+        # through far more calls than a real hour's budget
+        'CALLRAIL_REQUESTS_PER_HOUR': '0',
+    })
+    if max_in_flight:
+        os.environ['GOOGLE_ADS_UPLOAD_MAX_IN_FLIGHT'] = str(max_in_flight)
+
+    if CODE_TEMPLATES not in sys.path:
+        sys.path.append(CODE_TEMPLATES)
+
+    from automation.conversion_upload import uploader
+    from automation.utils import callrail_client, state_manager
+    state_manager.STATE_FILE = os.path.join(state_dir, 'last_sync')
+    state_manager.WATERMARK_FILE = os.path.join(state_dir, 'sync_watermark')
+    if callrail_base_url:
+        callrail_client.BASE_URL = callrail_base_url
+    callrail_client._clients.clear()
+
+    return uploader
@@ -0,0 +1,17 @@
+"""Load the hyphenated tool scripts under importable module names for tests."""
+
+import importlib.util
+import os
+import sys
+
+_TOOLS = {
+    'gclid_validator': 'gclid-validator.py',
+}
+
+for module_name, file_name in _TOOLS.items():
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(os.path.dirname(__file__), file_name)
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
@@ -1,10 +1,53 @@
 """
 GCLID Validator - Verify GCLID format and validity
+
+For large batches use validate_gclid_array() / check_gclid_age_array(),
+which return compact boolean and reason-code arrays instead of one dict
+per row. NumPy and pyarrow are used when installed, but are optional.
 """
 
+import csv
 import re
+import string
+from bisect import bisect_right
 from datetime import datetime, timedelta
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+MIN_GCLID_LENGTH = 20
+MAX_GCLID_LENGTH = 200
+MAX_GCLID_AGE_DAYS = 90
+
+GCLID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# bytes.translate() table: 0 for valid GCLID characters, 1 for anything else
+_VALID_CHARS = string.ascii_letters + string.digits + '_-'
+_INVALID_BYTES = bytes(0 if chr(i) in _VALID_CHARS else 1 for i in range(256))
+
+# Reason codes returned by validate_gclid_array()
+REASON_VALID = 0
+REASON_EMPTY = 1
+REASON_TOO_SHORT = 2
+REASON_TOO_LONG = 3
+REASON_INVALID_CHARS = 4
+
+REASON_MESSAGES = {
+    REASON_VALID: "Valid GCLID format",
+    REASON_EMPTY: "GCLID is empty",
+    REASON_TOO_SHORT: f"GCLID too short, expected {MIN_GCLID_LENGTH}+",
+    REASON_TOO_LONG: f"GCLID too long, expected <{MAX_GCLID_LENGTH}",
+    REASON_INVALID_CHARS: "GCLID contains invalid characters",
+}
+
 
 def is_valid_gclid_format(gclid):
     """
@@ -18,14 +61,13 @@ def is_valid_gclid_format(gclid):
     if not gclid:
         return False, "GCLID is empty"
 
-    if len(gclid) < 20:
-        return False, f"GCLID too short ({len(gclid)} chars), expected 20+"
+    if len(gclid) < MIN_GCLID_LENGTH:
+        return False, f"GCLID too short ({len(gclid)} chars), expected {MIN_GCLID_LENGTH}+"
 
-    if len(gclid) > 200:
-        return False, f"GCLID too long ({len(gclid)} chars), expected <200"
+    if len(gclid) > MAX_GCLID_LENGTH:
+        return False, f"GCLID too long ({len(gclid)} chars), expected <{MAX_GCLID_LENGTH}"
 
-    pattern = r'^[A-Za-z0-9_-]+$'
-    if not re.match(pattern, gclid):
+    if not GCLID_PATTERN.match(gclid):
         return False, "GCLID contains invalid characters"
 
     return True, "Valid GCLID format"
@@ -39,10 +81,10 @@ def check_gclid_age(click_timestamp, current_timestamp=None):
         current_timestamp = datetime.now()
 
     age = current_timestamp - click_timestamp
-    max_age = timedelta(days=90)
+    max_age = timedelta(days=MAX_GCLID_AGE_DAYS)
 
     if age > max_age:
-        return False, f"GCLID is {age.days} days old (max: 90 days)"
+        return False, f"GCLID is {age.days} days old (max: {MAX_GCLID_AGE_DAYS} days)"
 
     return True, f"GCLID is {age.days} days old (within window)"
 
@@ -64,6 +106,165 @@ def validate_gclid_batch(gclids):
     return results
 
 
+def _join_gclids(gclids):
+    """
+    Turn a list / NumPy array / other iterable of GCLIDs into a list of str
+
+    Returns:
+        Tuple of (gclids, joined) where joined is the '-'-separated buffer
+    """
+    if np is not None and isinstance(gclids, np.ndarray):
+        gclids = gclids.tolist()
+    elif not isinstance(gclids, list):
+        gclids = list(gclids)
+
+    # '-' is a valid GCLID character, so the separators are never flagged
+    try:
+        return gclids, '-'.join(gclids)
+    except TypeError:
+        # Some values are None or not strings
+        gclids = ['' if g is None else str(g) for g in gclids]
+        return gclids, '-'.join(gclids)
+
+
+def _validate_arrow(gclids):
+    """Validate a pyarrow string array entirely inside Arrow compute kernels"""
+    if isinstance(gclids, pa.ChunkedArray):
+        gclids = gclids.combine_chunks()
+    gclids = pc.fill_null(gclids.cast(pa.string()), '')
+
+    lengths = pc.utf8_length(gclids).to_numpy(zero_copy_only=False)
+    bad_chars = pc.invert(pc.match_substring_regex(gclids, GCLID_PATTERN.pattern))
+    return lengths, bad_chars.to_numpy(zero_copy_only=False)
+
+
+def _reason_codes(lengths, bad_chars):
+    """Combine lengths and invalid-character flags into reason codes (first failing check wins)"""
+    if np is not None:
+        reasons = np.full(len(lengths), REASON_VALID, dtype=np.uint8)
+        # Assign in reverse priority so earlier checks overwrite later ones
+        reasons[bad_chars] = REASON_INVALID_CHARS
+        reasons[lengths > MAX_GCLID_LENGTH] = REASON_TOO_LONG
+        reasons[lengths < MIN_GCLID_LENGTH] = REASON_TOO_SHORT
+        reasons[lengths == 0] = REASON_EMPTY
+        return reasons == REASON_VALID, reasons
+
+    reasons = bytearray(len(lengths))
+    for i, length in enumerate(lengths):
+        if length == 0:
+            reasons[i] = REASON_EMPTY
+        elif length < MIN_GCLID_LENGTH:
+            reasons[i] = REASON_TOO_SHORT
+        elif length > MAX_GCLID_LENGTH:
+            reasons[i] = REASON_TOO_LONG
+        elif bad_chars[i]:
+            reasons[i] = REASON_INVALID_CHARS
+    return bytearray(reason == REASON_VALID for reason in reasons), reasons
+
+
+def validate_gclid_array(gclids):
+    """
+    Validate a column of GCLIDs in bulk
+
+    Applies the same checks as is_valid_gclid_format(), but without building
+    a result per row: all strings are joined into one buffer, invalid
+    characters are located with a single bytes.translate() pass, and lengths
+    are compared as arrays.
+
+    Args:
+        gclids: List of str, NumPy string/object array, or pyarrow string
+                array. None counts as empty.
+
+    Returns:
+        Tuple of (valid, reasons): boolean and uint8 NumPy arrays when NumPy
+        is installed, otherwise two bytearrays. Reason codes are the REASON_*
+        constants; see REASON_MESSAGES.
+    """
+    if pa is not None and np is not None and isinstance(gclids, (pa.Array, pa.ChunkedArray)):
+        return _reason_codes(*_validate_arrow(gclids))
+
+    if pa is not None and isinstance(gclids, (pa.Array, pa.ChunkedArray)):
+        gclids = gclids.to_pylist()
+
+    gclids, joined = _join_gclids(gclids)
+
+    # Non-ASCII characters encode to a single (invalid) '?', keeping byte
+    # offsets equal to character offsets
+    marks = joined.encode('ascii', 'replace').translate(_INVALID_BYTES)
+
+    if np is not None:
+        lengths = np.fromiter(map(len, gclids), dtype=np.int64, count=len(gclids))
+        starts = np.zeros(len(gclids), dtype=np.int64)
+        np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        positions = np.flatnonzero(np.frombuffer(marks, dtype=np.bool_))
+        bad_chars = np.zeros(len(gclids), dtype=bool)
+        bad_chars[np.searchsorted(starts, positions, side='right') - 1] = True
+        return _reason_codes(lengths, bad_chars)
+
+    lengths = [len(g) for g in gclids]
+    starts = []
+    offset = 0
+    for length in lengths:
+        starts.append(offset)
+        offset += length + 1
+    bad_chars = bytearray(len(gclids))
+    position = marks.find(1)
+    while position != -1:
+        row = bisect_right(starts, position) - 1
+        bad_chars[row] = 1
+        # Skip the rest of this row: one invalid character is enough
+        position = marks.find(1, starts[row] + lengths[row])
+    return _reason_codes(lengths, bad_chars)
+
+
+def validate_gclid_csv_column(csv_path, column='gclid'):
+    """
+    Validate the GCLID column of a CSV file in bulk
+
+    Returns:
+        Same (valid, reasons) tuple as validate_gclid_array(); index 0 is
+        the first data row (line 2 of the file)
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, [])
+        if column not in header:
+            raise ValueError(f"Column '{column}' not found in {csv_path}")
+        index = header.index(column)
+        gclids = [row[index] if index < len(row) else '' for row in reader]
+
+    return validate_gclid_array(gclids)
+
+
+def check_gclid_age_array(click_timestamps, current_timestamp=None):
+    """
+    Vectorized check_gclid_age() over an array of click timestamps
+
+    Args:
+        click_timestamps: NumPy datetime64 array, pyarrow timestamp array or
+                          list of naive datetimes (same clock as current_timestamp)
+        current_timestamp: Reference time (default: now)
+
+    Returns:
+        Tuple of (within_window, age_days) arrays. Requires NumPy.
+    """
+    if np is None:
+        raise ImportError("check_gclid_age_array requires numpy (pip install numpy)")
+
+    if current_timestamp is None:
+        current_timestamp = datetime.now()
+
+    if pa is not None and isinstance(click_timestamps, (pa.Array, pa.ChunkedArray)):
+        click_timestamps = click_timestamps.to_numpy(zero_copy_only=False)
+
+    clicks = np.asarray(click_timestamps, dtype='datetime64[s]')
+    age = np.datetime64(current_timestamp, 's') - clicks
+    age_days = age // np.timedelta64(1, 'D')
+
+    within_window = age <= np.timedelta64(MAX_GCLID_AGE_DAYS, 'D')
+    return within_window, age_days.astype(np.int64)
+
+
 if __name__ == "__main__":
     # Example usage
     test_gclids = [
@@ -78,3 +279,9 @@ if __name__ == "__main__":
         print(f"GCLID: {gclid[:30]}...")
         print(f"  Status: {'✓ VALID' if is_valid else '✗ INVALID'}")
         print(f"  Message: {message}\n")
+
+    # Bulk validation returns compact arrays instead of one dict per row
+    valid, reasons = validate_gclid_array(test_gclids)
+    print(f"Bulk: {sum(bool(v) for v in valid)}/{len(test_gclids)} valid")
+    for gclid, reason in zip(test_gclids, reasons):
+        print(f"  {gclid[:30]}: {REASON_MESSAGES[reason]}")
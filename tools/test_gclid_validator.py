@@ -9,3 +9,27 @@ def test_valid_gclid():
 def test_invalid_gclid():
     valid, _ = is_valid_gclid_format("abc")
     assert not valid
+
+
+def test_validate_gclid_array_matches_single_checks():
+    from gclid_validator import (
+        REASON_EMPTY, REASON_INVALID_CHARS, REASON_TOO_LONG, REASON_TOO_SHORT, REASON_VALID,
+        validate_gclid_array,
+    )
+
+    gclids = [
+        "CjwKCAiA1KL3BRA8EiwAzCfbQxyz123abc",
+        "",
+        None,
+        "abc",
+        "Cj" + "x" * 250,
+        "CjwKCAiA1KL3BRA8EiwAzCfb@xyz123abc",
+        "CjwKCAiA1KL3BRA8EiwAzCfbéxyz123abc",
+    ]
+    valid, reasons = validate_gclid_array(gclids)
+
+    assert [bool(v) for v in valid] == [is_valid_gclid_format(g)[0] for g in gclids]
+    assert list(reasons) == [
+        REASON_VALID, REASON_EMPTY, REASON_EMPTY, REASON_TOO_SHORT,
+        REASON_TOO_LONG, REASON_INVALID_CHARS, REASON_INVALID_CHARS,
+    ]